@@ -0,0 +1,329 @@
+"""Caches used to avoid repeated graph lookups."""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from src.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Bounded, thread safe LRU cache whose entries expire after ttl seconds.
+
+    maxsize <= 0 disables the cache, every lookup is then a miss.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = 'cache'):
+        """Initialize empty cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+
+    def get(self, key: Hashable, default=None):
+        """Return value for the key, default if it is missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        """Store value for the key, evicting least recently used entries if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Remove the key from cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries and reset counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        """Return number of entries, including not yet evicted expired ones."""
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters along with current size."""
+        return {'name': self.name, 'hits': self.hits, 'misses': self.misses,
+                'size': len(self), 'maxsize': self.maxsize}
+
+
+class _Flight:
+    """Fetch in progress, shared by the caller performing it and callers waiting for it."""
+
+    def __init__(self):
+        """Initialize unfinished fetch."""
+        self.done = threading.Event()
+        self.result: Dict[Hashable, Any] = {}
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent fetches of the same keys into a single fetch.
+
+    A caller fetches only keys which no other caller is fetching at the moment,
+    for the rest it waits on the in-flight fetch and shares its result or error.
+    Keys missing in the fetch result are reported as None.
+    """
+
+    def __init__(self, name: str = 'single_flight'):
+        """Initialize with no fetch in flight."""
+        self.name = name
+        self.fetches = 0
+        self.fetched = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, _Flight] = {}
+
+    def fetch_many(self, keys: List[Hashable],
+                   fetch: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """Return values for the keys, fetching only keys not already in flight."""
+        own = []
+        waiting = {}
+        flight = _Flight()
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                other = self._in_flight.get(key)
+                if other is None:
+                    own.append(key)
+                    self._in_flight[key] = flight
+                else:
+                    waiting[key] = other
+            self.coalesced += len(waiting)
+            if own:
+                self.fetches += 1
+                self.fetched += len(own)
+
+        result = {}
+        if own:
+            try:
+                flight.result = fetch(own)
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in own:
+                        del self._in_flight[key]
+                flight.done.set()
+            result.update((key, flight.result.get(key)) for key in own)
+
+        # own keys are fetched before waiting, so two callers never wait on each other
+        for key, other in waiting.items():
+            other.done.wait()
+            if other.error is not None:
+                raise other.error
+            result[key] = other.result.get(key)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters of fetches, fetched keys and keys served by other callers' fetch."""
+        return {'name': self.name, 'fetches': self.fetches, 'fetched': self.fetched,
+                'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+
+    def reset(self):
+        """Reset counters."""
+        with self._lock:
+            self.fetches = 0
+            self.fetched = 0
+            self.coalesced = 0
+
+
+class SqliteCache:
+    """TTL cache of serialized payloads shared by all worker processes of a pod.
+
+    Entries are kept in a SQLite database in WAL mode, so warm entries survive
+    worker recycling and readers never block the writer. A process has one
+    connection guarded by a lock, the connection is reopened after fork. SQLite
+    calls block the gevent loop, so a busy database is waited for timeout
+    seconds only. Expired entries are filtered out on read and purged by a write
+    at most once per purge_interval seconds. The cache is an optimization only,
+    any SQLite error is logged and treated as a cache miss.
+    """
+
+    # SQLite limits number of host parameters per statement.
+    _MAX_VARIABLES = 500
+
+    def __init__(self, path: str, ttl: float, timeout: float = 0.1,
+                 purge_interval: float = None):
+        """Initialize cache backed by the database file at path, purge_interval defaults to ttl."""
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.purge_interval = ttl if purge_interval is None else purge_interval
+        self._purged_at = time.time()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return connection of the process, caller must hold the lock."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                             'value TEXT NOT NULL, expires_at REAL NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)')
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _locked(self) -> threading.Lock:
+        """Return the lock, connection and lock of parent process are dropped after fork."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            # connection must not be used nor closed in the child
+            self._conn = None
+        return self._lock
+
+    def close(self):
+        """Close connection of the process, it is reopened on next use."""
+        with self._locked():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _key(key: Tuple) -> str:
+        return json.dumps(key)
+
+    def get_many(self, keys: List[Tuple]) -> Dict[Tuple, str]:
+        """Return not expired values for the given keys, missing keys are left out."""
+        result = {}
+        db_keys = {self._key(key): key for key in keys}
+        try:
+            with self._locked():
+                conn = self._connection()
+                now = time.time()
+                names = list(db_keys.keys())
+                for i in range(0, len(names), self._MAX_VARIABLES):
+                    chunk = names[i:i + self._MAX_VARIABLES]
+                    rows = conn.execute(
+                        'SELECT key, value FROM cache WHERE expires_at > ? AND key IN ({})'
+                        .format(','.join('?' * len(chunk))), [now] + chunk)
+                    for db_key, value in rows:
+                        result[db_keys[db_key]] = value
+        except sqlite3.Error as e:
+            logger.error('Failed to read from shared cache %s: %r', self.path, e)
+        return result
+
+    def put_many(self, items: Dict[Tuple, str]):
+        """Store the given values, expired entries are purged once per purge_interval."""
+        if not items:
+            return
+        now = time.time()
+        try:
+            with self._locked(), self._connection() as conn:
+                conn.execute('BEGIN')
+                if now - self._purged_at >= self.purge_interval:
+                    conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+                    self._purged_at = now
+                conn.executemany(
+                    'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    [(self._key(key), value, now + self.ttl) for key, value in items.items()])
+        except sqlite3.Error as e:
+            logger.error('Failed to write into shared cache %s: %r', self.path, e)
+
+    def clear(self):
+        """Remove all entries."""
+        try:
+            with self._locked():
+                self._connection().execute('DELETE FROM cache')
+        except sqlite3.Error as e:
+            logger.error('Failed to clear shared cache %s: %r', self.path, e)
+
+
+_shared_cache: Optional[SqliteCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+@atexit.register
+def close_shared_cache():
+    """Close connection of the shared cache on shutdown."""
+    with _shared_cache_lock:
+        if _shared_cache is not None:
+            _shared_cache.close()
+
+
+def get_shared_cache() -> Optional[SqliteCache]:
+    """Return pod wide shared cache, None when SHARED_CACHE_PATH is not configured."""
+    global _shared_cache
+    settings = Settings()
+    if not settings.shared_cache_path:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None or _shared_cache.path != settings.shared_cache_path:
+            if _shared_cache is not None:
+                _shared_cache.close()
+            _shared_cache = SqliteCache(settings.shared_cache_path, settings.shared_cache_ttl,
+                                        timeout=settings.shared_cache_timeout)
+        return _shared_cache
+
+
+def fetch_with_shared_cache(namespace: str, ecosystem: str, names: List[str],
+                            fetch: Callable[[List[str]], List[Dict]],
+                            row_name: Callable[[Dict], str]) -> List[Dict]:
+    """Get graph rows for the given package names through the shared cache.
+
+    Only names missing in the shared cache are passed to fetch. Fetched rows are
+    grouped by row_name(row) and stored per package name.
+    """
+    shared_cache = get_shared_cache()
+    if shared_cache is None:
+        return fetch(names)
+
+    keys = {name: (namespace, ecosystem, name) for name in names}
+    cached = shared_cache.get_many(list(keys.values()))
+    rows = []
+    missing = []
+    for name in names:
+        payload = cached.get(keys[name])
+        if payload is None:
+            missing.append(name)
+        else:
+            rows.extend(json.loads(payload))
+
+    if missing:
+        fetched = fetch(missing)
+        rows.extend(fetched)
+        rows_by_name = defaultdict(list)
+        for row in fetched:
+            rows_by_name[row_name(row)].append(row)
+        shared_cache.put_many({keys[name]: json.dumps(rows_by_name[name])
+                               for name in missing if name in rows_by_name})
+    return rows
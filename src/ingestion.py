@@ -0,0 +1,112 @@
+"""Background ingestion of packages unknown to the graph database."""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Set, Tuple
+
+from src.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# (ecosystem, name, version)
+EPV = Tuple[str, str, str]
+
+
+class IngestionQueue:
+    """Deduplicating queue which initiates ingestion flows off the request path.
+
+    Worker threads take EPVs off the queue one by one and hand each over to the
+    ingest callable, which starts one flow per EPV, so one failure doesn't stop
+    the remaining EPVs. An EPV already waiting in the queue is not queued again.
+    At most max_pending EPVs wait in the queue, further EPVs are logged and
+    dropped. With workers <= 0 EPVs are ingested inline.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        """Initialize queue, worker threads are started on first submit."""
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending: Set[EPV] = set()
+        self._threads = []
+        self._pid = None
+
+    def submit(self, epvs: Iterable[EPV], ingest: Callable[[str, str, str], object]) -> List[EPV]:
+        """Queue EPVs for ingestion through ingest(ecosystem, name, version).
+
+        Return EPVs actually queued, ingested ones in inline mode. EPVs already
+        waiting in the queue and dropped ones are left out.
+        """
+        if self.workers <= 0:
+            epvs = list(dict.fromkeys(epvs))
+            started_at = time.time()
+            for epv in epvs:
+                self._ingest(epv, ingest)
+            logger.info('It took %0.2f seconds to initiate ingestion for %d packages',
+                        time.time() - started_at, len(epvs))
+            return epvs
+
+        queued = []
+        dropped = []
+        with self._lock:
+            self._start_workers()
+            for epv in epvs:
+                if epv in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    dropped.append(epv)
+                    continue
+                self._pending.add(epv)
+                self._queue.put((epv, ingest))
+                queued.append(epv)
+        if dropped:
+            logger.warning('Ingestion queue is full, dropped %d packages: %s',
+                           len(dropped), dropped)
+        return queued
+
+    def join(self):
+        """Block until every queued EPV has been processed."""
+        self._queue.join()
+
+    def _start_workers(self):
+        """Start worker threads, threads of parent process don't survive fork."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._threads = [threading.Thread(target=self._run, name='ingestion-{}'.format(i),
+                                          daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        """Worker thread loop."""
+        while True:
+            epv, ingest = self._queue.get()
+            with self._lock:
+                self._pending.discard(epv)
+            try:
+                self._ingest(epv, ingest)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _ingest(epv: EPV, ingest: Callable[[str, str, str], object]):
+        """Initiate ingestion of the EPV, failure is logged."""
+        ecosystem, name, version = epv
+        try:
+            ingest(ecosystem, name, version)
+        except Exception as e:  # pylint:disable=W0703,C0103
+            logger.error('Ingestion failed for {%s, %s, %s}', ecosystem, name, version)
+            logger.error(e)
+
+
+unknown_package_ingestion = IngestionQueue(
+    workers=Settings().unknown_package_ingestion_workers,
+    max_pending=Settings().unknown_package_ingestion_max_pending)
@@ -0,0 +1,112 @@
+"""Background execution of long running API requests."""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.cache import TTLCache
+from src.settings import Settings
+from src.utils import session
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _get_error(result: Any) -> Optional[str]:
+    """Return error message of task result which is not a success, None otherwise."""
+    if not isinstance(result, dict):
+        return None
+    status = result.get('recommendation', result.get('aggregation', 'success'))
+    if status == 'success':
+        return None
+    return result.get('message', status)
+
+
+class JobQueue:
+    """Run jobs on a bounded thread pool and keep their status in an in-memory job table.
+
+    At most max_pending jobs are queued or running at a time, further submissions
+    are rejected. Status of finished jobs is kept for ttl seconds, results are not
+    kept in memory, jobs are expected to persist them. The job table is local to
+    the process.
+    """
+
+    def __init__(self, workers: int, max_pending: int, ttl: float):
+        """Initialize queue, executor is created on first submit."""
+        self.workers = max(workers, 1)
+        self.max_pending = max_pending
+        self._jobs = TTLCache(maxsize=max(max_pending * 10, 1), ttl=ttl, name='jobs')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = None
+        self._pid = None
+
+    def submit(self, job_id: str, func: Callable[[], Any]) -> Optional[Dict[str, Any]]:
+        """Queue func() under job_id, return job or None when the queue is full.
+
+        Job which is still queued or running under the same id is returned
+        instead of queueing a duplicate.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] in (PENDING, RUNNING):
+                return job
+            executor = self._get_executor()
+            if self._pending >= self.max_pending:
+                return None
+            job = {'job_id': job_id, 'status': PENDING, 'submitted_at': time.time()}
+            self._jobs.put(job_id, job)
+            self._pending += 1
+            executor.submit(self._run, job, func)
+            return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return job, None if it is unknown to this process or expired."""
+        return self._jobs.get(job_id)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Return executor, threads of parent process don't survive fork."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = 0
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='job')
+        return self._executor
+
+    def _run(self, job: Dict[str, Any], func: Callable[[], Any]):
+        """Execute the job and record its status, result of func() is dropped.
+
+        Job whose func() returns a task result which is not a success, e.g.
+        recommendation 'pgm_error', is failed with message of that result.
+        """
+        job['status'] = RUNNING
+        try:
+            error = _get_error(func())
+            if error is not None:
+                logger.error('Job %s failed: %s', job['job_id'], error)
+                job['error'] = error
+                job['status'] = FAILED
+            else:
+                job['status'] = DONE
+        except Exception as e:  # pylint:disable=W0703,C0103
+            logger.exception('Job %s failed', job['job_id'])
+            job['error'] = '%s' % e
+            job['status'] = FAILED
+        finally:
+            # release DB session of this thread
+            session.remove()
+            job['finished_at'] = time.time()
+            with self._lock:
+                self._pending -= 1
+
+
+async_jobs = JobQueue(workers=Settings().async_job_workers,
+                      max_pending=Settings().async_job_max_pending,
+                      ttl=Settings().async_job_ttl)
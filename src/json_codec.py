@@ -0,0 +1,128 @@
+"""Pluggable JSON encoding and decoding of API responses, upstream responses and DB payloads.
+
+Backend is selected by json_codec setting (JSON_CODEC environment variable):
+orjson - orjson package
+json - json module of standard library
+auto - orjson when it is installed, json otherwise (default)
+
+Values which orjson can't handle, like integers over 64 bits or NaN literals in
+decoded documents, are handled by json module.
+
+API responses are encoded by dumpb_sorted() the way flask.jsonify encodes them:
+compact, with sorted keys, values JSON can't represent are converted by the given
+default, e.g. datetimes into HTTP dates. Unlike json module, orjson doesn't escape
+non-ASCII characters, they are sent UTF-8 encoded.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Optional, Union
+
+from src.settings import Settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class JsonCodec:
+    """JSON codec backed by json module of standard library."""
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj: Any) -> str:
+        """Encode obj into JSON string."""
+        return json.dumps(obj)
+
+    @staticmethod
+    def dumpb(obj: Any) -> bytes:
+        """Encode obj into UTF-8 encoded JSON."""
+        return json.dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def dumpb_sorted(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        """Encode obj into compact UTF-8 encoded JSON with sorted keys."""
+        return json.dumps(obj, sort_keys=True, separators=(',', ':'),
+                          default=default).encode('utf-8')
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        """Decode JSON document."""
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """JSON codec backed by orjson, falling back to json module."""
+
+    name = 'orjson'
+    _options = orjson.OPT_NON_STR_KEYS if orjson else 0
+    # datetimes are converted by default, like the json module does
+    _sorted_options = (_options | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                       if orjson else 0)
+
+    @classmethod
+    def dumps(cls, obj: Any) -> str:
+        """Encode obj into JSON string."""
+        return cls.dumpb(obj).decode('utf-8')
+
+    @classmethod
+    def dumpb(cls, obj: Any) -> bytes:
+        """Encode obj into UTF-8 encoded JSON."""
+        try:
+            return orjson.dumps(obj, option=cls._options)
+        except TypeError:
+            return JsonCodec.dumpb(obj)
+
+    @classmethod
+    def dumpb_sorted(cls, obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        """Encode obj into compact UTF-8 encoded JSON with sorted keys."""
+        try:
+            return orjson.dumps(obj, default=default, option=cls._sorted_options)
+        except TypeError:
+            return JsonCodec.dumpb_sorted(obj, default=default)
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        """Decode JSON document."""
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            return JsonCodec.loads(data)
+
+
+def get_codec(name: str = 'auto') -> JsonCodec:
+    """Get codec of the given name, json module is used when orjson isn't installed."""
+    if name not in ('auto', 'orjson', 'json'):
+        raise ValueError('Unknown JSON codec {}'.format(name))
+    if name == 'json' or orjson is None:
+        if name == 'orjson':
+            logger.warning('orjson is not installed, using json module')
+        return JsonCodec()
+    return OrjsonCodec()
+
+
+codec = get_codec(Settings().json_codec)
+
+
+def dumps(obj: Any) -> str:
+    """Encode obj into JSON string with the configured codec."""
+    return codec.dumps(obj)
+
+
+def dumpb(obj: Any) -> bytes:
+    """Encode obj into UTF-8 encoded JSON with the configured codec."""
+    return codec.dumpb(obj)
+
+
+def dumpb_sorted(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Encode obj into compact UTF-8 encoded JSON with sorted keys with the configured codec."""
+    return codec.dumpb_sorted(obj, default=default)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON document with the configured codec."""
+    return codec.loads(data)
@@ -0,0 +1,113 @@
+"""Incremental parsing of large JSON documents.
+
+Items of an array nested in a JSON document are decoded one at a time while
+the document is read, so that the whole document is never held in memory.
+"""
+
+import json
+import re
+from typing import Any, Iterable, Iterator, Sequence
+
+_WHITESPACE = ' \t\n\r'
+# parsed part of buffer is dropped once it grows over this many characters
+_COMPACT_SIZE = 1 << 16
+# rest of buffer which may be a part of the number decoded before it
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class _Reader:
+    """Buffer over text chunks with JSON value decoding."""
+
+    def __init__(self, chunks: Iterable[str]):
+        """Initialize empty buffer."""
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read(self, size: int = 1) -> bool:
+        """Append chunks until at least size unparsed characters are buffered."""
+        if self._pos > _COMPACT_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        parts = [self._buf]
+        buffered = len(self._buf) - self._pos
+        while buffered < size and not self._eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+            elif chunk:
+                parts.append(chunk)
+                buffered += len(chunk)
+        self._buf = ''.join(parts)
+        return buffered >= size
+
+    def peek(self) -> str:
+        """Skip whitespace and return next character, empty string at end of document."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf) or not self._read():
+                return self._buf[self._pos:self._pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consume next character which must be one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected one of {!r} at {}, found {!r}'.format(
+                chars, self._pos, char))
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode next JSON value, more chunks are read until the value is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                end = None
+            # a number at the end of buffer may continue in the next chunk,
+            # e.g. '1' of '1.5' split after the point
+            if end is not None and (self._eof or not (
+                    isinstance(value, (int, float)) and _NUMBER_TAIL.match(self._buf, end))):
+                self._pos = end
+                return value
+            # double the buffered part, so an item is decoded O(1) times on average
+            self._read(2 * (len(self._buf) - self._pos) or 1)
+
+
+def iter_json_items(chunks: Iterable[str], path: Sequence[str]) -> Iterator[Any]:
+    """Yield items of the array found under keys path of JSON document given in chunks.
+
+    Nothing is yielded when the path is missing or doesn't lead to an array.
+    Other values of the document are decoded and dropped.
+    """
+    reader = _Reader(chunks)
+    depth = 0
+    if reader.peek() != '{':
+        return
+    reader.expect('{')
+    while reader.peek() != '}':
+        key = reader.value()
+        reader.expect(':')
+        if key == path[depth] and depth == len(path) - 1:
+            if reader.peek() != '[':
+                return
+            reader.expect('[')
+            while reader.peek() != ']':
+                yield reader.value()
+                if reader.expect(',]') == ']':
+                    return
+            return
+        if key == path[depth] and reader.peek() == '{':
+            # descend into the object on path, its siblings are never visited
+            reader.expect('{')
+            depth += 1
+            continue
+        reader.value()
+        if reader.expect(',}') == '}':
+            return
@@ -64,16 +64,21 @@ Output:
 
 import json
 import datetime
+import inspect
 import requests
 import os
 from collections import Counter, defaultdict
+from functools import partial
 import re
 import logging
 
-from src.utils import (create_package_dict, get_session_retry, select_latest_version,
+from src.cache import fetch_with_shared_cache
+from src.settings import Settings
+from src.utils import (create_package_dict, get_http_session, select_latest_version,
                        GREMLIN_SERVER_URL_REST, LICENSE_SCORING_URL_REST,
-                       convert_version_to_proper_semantic, get_response_data,
-                       version_info_tuple, persist_data_in_db, post_http_request)
+                       version_sort_key, get_response_data,
+                       persist_data_in_db, post_http_request, execute_concurrently,
+                       index_insights_packages)
 from src.stack_aggregator import extract_user_stack_package_licenses
 
 logging.basicConfig(level=logging.INFO)
@@ -96,19 +101,31 @@ class GraphDB:
 
         Also remove EPVs with CVEs and ones not present in Graph
         """
-        str_query = "data=[]; "
-        for package in input_list:
-            str_query += "pkg = g.V().has('ecosystem', '{eco}').has('name', '{pkg}'); " \
-                         "lnv = []; pkg.clone().values('latest_non_cve_version', " \
-                         "'latest_version').fill(lnv); pkg.clone().as('package').V()." \
-                         "has('pecosystem', '{eco}').has('pname', '{pkg}')." \
-                         "has('version', within(lnv)).as('version')." \
-                         "select('package', 'version').by(valueMap()).fill(data);".format(
-                                                                                    eco=ecosystem,
-                                                                                    pkg=package)
-        str_query += "data"
+        return fetch_with_shared_cache(
+            'version_information', ecosystem, list(input_list),
+            lambda packages: GraphDB.get_version_information_from_graph(packages, ecosystem),
+            lambda epv: epv.get('package', {}).get('name', [''])[0])
+
+    @staticmethod
+    def get_version_information_from_graph(input_list, ecosystem):
+        """Fetch the version information for each of the packages from graph."""
+        query = inspect.cleandoc("""
+            data = [];
+            packages.each {
+                pkg = g.V().has('ecosystem', ecosystem).has('name', it);
+                lnv = [];
+                pkg.clone().values('latest_non_cve_version', 'latest_version').fill(lnv);
+                pkg.clone().as('package').V().
+                has('pecosystem', ecosystem).has('pname', it).
+                has('version', within(lnv)).as('version').
+                select('package', 'version').by(valueMap()).fill(data);
+            };
+            data;
+        """)
+        bindings = {'ecosystem': ecosystem, 'packages': list(input_list)}
         payload = {
-            'gremlin': str_query
+            'gremlin': query,
+            'bindings': bindings
         }
 
         # Query Gremlin with packages list to get their version information
@@ -202,10 +219,8 @@ class GraphDB:
             latest_version = epv.get('package').get('latest_version', [''])[0]
 
             # Convert version to a proper semantic case
-            semversion_tuple = version_info_tuple(
-                convert_version_to_proper_semantic(version, name))
-            input_stack_tuple = version_info_tuple(
-                convert_version_to_proper_semantic(input_stack.get(name, ''), name))
+            semversion_tuple = version_sort_key(version, name)
+            input_stack_tuple = version_sort_key(input_stack.get(name, ''), name)
 
             if name and version:
                 # Select highest version based on input or graph as latest version
@@ -253,35 +268,6 @@ class GraphDB:
         new_list = GraphDB.prepare_final_filtered_list(new_dict)
         return new_list, filtered_comp_list
 
-    @staticmethod
-    def get_topics_for_alt(alt_list, pgm_dict):
-        """Get topics from pgm and associate with filtered versions from Graph."""
-        for epv in alt_list:
-            name = epv.get('package', {}).get('name', [''])[0]
-            if name:
-                for pgm_pkg_key, pgm_list in pgm_dict.items():
-                    for pgm_epv in pgm_list:
-                        if name == pgm_epv.get('package_name', ''):
-                            epv['package']['pgm_topics'] = pgm_epv.get('topic_list', [])
-
-        return alt_list
-
-    @staticmethod
-    def get_topics_for_comp(comp_list, pgm_list):
-        """Get topics from pgm and associate with filtered versions from Graph."""
-        for epv in comp_list:
-            name = epv.get('package', {}).get('name', [''])[0]
-            if name:
-                for pgm_epv in pgm_list:
-                    if name == pgm_epv.get('package_name', ''):
-                        epv['package']['pgm_topics'] = pgm_epv.get('topic_list', [])
-                        epv['package']['cooccurrence_probability'] = pgm_epv.get(
-                            'cooccurrence_probability', 0)
-                        epv['package']['cooccurrence_count'] = pgm_epv.get(
-                            'cooccurrence_count', 0)
-
-        return comp_list
-
 
 class License:
     """License Analytics Class."""
@@ -300,7 +286,7 @@ class License:
         json_response = {}
         try:
             # Call License service to get license data
-            lic_response = get_session_retry().post(license_url, data=json.dumps(payload))
+            lic_response = get_http_session(license_url).post(license_url, data=json.dumps(payload))
             if lic_response.status_code != 200:
                 lic_response.raise_for_status()  # raise exception for bad http-status codes
             json_response = lic_response.json()
@@ -370,9 +356,15 @@ class License:
     def perform_license_analysis(
             resolved, ecosystem, filtered_alternate_packages,
             filtered_alt_packages_graph, filtered_companion_packages,
-            filtered_comp_packages_graph, external_request_id):
-        """Apply License Filters and log the messages."""
-        list_user_stack_comp = extract_user_stack_package_licenses(resolved, ecosystem)
+            filtered_comp_packages_graph, external_request_id, user_stack_licenses=None):
+        """Apply License Filters and log the messages.
+
+        Licenses of user stack are extracted from resolved packages unless
+        user_stack_licenses are given.
+        """
+        list_user_stack_comp = user_stack_licenses
+        if list_user_stack_comp is None:
+            list_user_stack_comp = extract_user_stack_package_licenses(resolved, ecosystem)
         license_filter_output = License.apply_license_filter(
             list_user_stack_comp,
             filtered_alt_packages_graph,
@@ -460,7 +452,7 @@ class RecommendationTask:
             # TODO remove hardcodedness for payloads with multiple ecosystems
 
             insights_url = RecommendationTask.get_insights_url(payload)
-            response = get_session_retry().post(insights_url, json=payload)
+            response = get_http_session(insights_url).post(insights_url, json=payload)
 
             if response.status_code != 200:
                 logger.error("HTTP error {}. Error retrieving insights data.".format(
@@ -475,6 +467,63 @@ class RecommendationTask:
             logger.error("%s" % e)
             return None
 
+    @staticmethod
+    def get_fetch_tasks(companion_packages, alternate_packages, resolved, ecosystem,
+                        check_license):
+        """Get no-arg tasks fetching data of one manifest, see unpack_fetched().
+
+        Companion versions are always fetched, alternate versions only when there
+        are alternates and user stack licenses only when licenses are checked.
+        """
+        tasks = [partial(GraphDB().get_version_information, companion_packages, ecosystem)]
+        if alternate_packages:
+            tasks.append(partial(GraphDB().get_version_information, alternate_packages,
+                                 ecosystem))
+        if check_license:
+            tasks.append(partial(extract_user_stack_package_licenses, resolved, ecosystem))
+        return tasks
+
+    @staticmethod
+    def unpack_fetched(fetched, alternate_packages, check_license):
+        """Split results of get_fetch_tasks() tasks, given in the order of tasks.
+
+        Return companion and alternate versions along with user stack licenses,
+        alternate versions default to [] and licenses to None when not fetched.
+        """
+        fetched = list(fetched)
+        comp_packages_graph = fetched.pop(0)
+        alt_packages_graph = fetched.pop(0) if alternate_packages else []
+        user_stack_licenses = fetched.pop(0) if check_license else None
+        return comp_packages_graph, alt_packages_graph, user_stack_licenses
+
+    @staticmethod
+    def _get_companion_block(comp_packages_graph, insights_result):
+        """Create companion block.
+
+        Topics and co-occurrence stats are looked up by package name in insights response.
+        """
+        companion_index = index_insights_packages(insights_result.get('companion_packages', []))
+        comp_packages = create_package_dict(comp_packages_graph, insights_index=companion_index)
+        return set_valid_cooccurrence_probability(comp_packages)
+
+    @staticmethod
+    def _index_alternate_topics(insights_result):
+        """Index topics of alternates in insights response by package name.
+
+        Alternates take only topics from insights response, they have no co-occurrence stats.
+        """
+        alternates = (pgm_epv for pgm_list in insights_result.get('alternate_packages', {}).values()
+                      for pgm_epv in pgm_list)
+        return {name: {'topic_list': pgm_epv.get('topic_list', [])}
+                for name, pgm_epv in index_insights_packages(alternates).items()}
+
+    @staticmethod
+    def _get_alternate_block(alt_packages_graph, final_dict, insights_result):
+        """Create alternate block."""
+        return create_package_dict(
+            alt_packages_graph, final_dict,
+            insights_index=RecommendationTask._index_alternate_topics(insights_result))
+
     def execute(self, arguments=None, persist=True, check_license=False):
         """Execute task."""
         started_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
@@ -560,9 +609,20 @@ class RecommendationTask:
                     for pkg in insights_result['companion_packages']:
                         companion_packages.append(pkg['package_name'])
 
-                    # Get Companion Packages from Graph
-                    comp_packages_graph = GraphDB().get_version_information(companion_packages,
-                                                                            ecosystem)
+                    # Get the topmost alternate package for each input package
+                    alternate_packages, final_dict = GraphDB.get_topmost_alternate(
+                        insights_result=insights_result, input_stack=input_stack
+                    )
+
+                    # Get Companion and Alternate Packages from Graph, licenses of user
+                    # stack needed by license filter are extracted at the same time;
+                    # fetches of other requests don't count against recommendation_workers
+                    tasks = self.get_fetch_tasks(companion_packages, alternate_packages,
+                                                 resolved, ecosystem, check_license)
+                    fetched = execute_concurrently(tasks, Settings().recommendation_workers,
+                                                   name='recommendation')
+                    comp_packages_graph, alt_packages_graph, user_stack_licenses = \
+                        self.unpack_fetched(fetched, alternate_packages, check_license)
 
                     # Apply Version Filters
                     filtered_comp_packages_graph, filtered_list = GraphDB().filter_versions(
@@ -574,16 +634,6 @@ class RecommendationTask:
                         "Companion Packages Filtered for external_request_id %s %s",
                         external_request_id, filtered_companion_packages
                     )
-                    # Get the topmost alternate package for each input package
-                    alternate_packages, final_dict = GraphDB.get_topmost_alternate(
-                        insights_result=insights_result, input_stack=input_stack
-                    )
-
-                    alt_packages_graph = []
-                    if alternate_packages:
-                        alt_packages_graph = GraphDB().get_version_information(
-                            alternate_packages, ecosystem)
-
                     # Apply Version Filters
                     filtered_alt_packages_graph, filtered_list = GraphDB().filter_versions(
                         alt_packages_graph, input_stack, external_request_id, rec_type="ALTERNATE")
@@ -604,32 +654,17 @@ class RecommendationTask:
                                 filtered_comp_packages_graph=filtered_comp_packages_graph,
                                 filtered_alternate_packages=filtered_alternate_packages,
                                 filtered_companion_packages=filtered_companion_packages,
-                                external_request_id=external_request_id
+                                external_request_id=external_request_id,
+                                user_stack_licenses=user_stack_licenses
                             )
                     else:
                         lic_filtered_alt_graph = filtered_alt_packages_graph
                         lic_filtered_comp_graph = filtered_comp_packages_graph
 
-                    # Get Topics Added to Filtered Packages
-                    topics_comp_packages_graph = GraphDB(). \
-                        get_topics_for_comp(lic_filtered_comp_graph,
-                                            insights_result.get('companion_packages', []))
-
-                    # Create Companion Block
-                    comp_packages = create_package_dict(topics_comp_packages_graph)
-                    final_comp_packages = \
-                        set_valid_cooccurrence_probability(comp_packages)
-
-                    recommendation['companion'] = final_comp_packages
-
-                    # Get Topics Added to Filtered Packages
-                    topics_comp_packages_graph = GraphDB(). \
-                        get_topics_for_alt(lic_filtered_alt_graph,
-                                           insights_result.get('alternate_packages', {}))
-
-                    # Create Alternate Dict
-                    alt_packages = create_package_dict(topics_comp_packages_graph, final_dict)
-                    recommendation['alternate'] = alt_packages
+                    recommendation['companion'] = self._get_companion_block(
+                        lic_filtered_comp_graph, insights_result)
+                    recommendation['alternate'] = self._get_alternate_block(
+                        lic_filtered_alt_graph, final_dict, insights_result)
 
                 recommendations.append(recommendation)
             else:
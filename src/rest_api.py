@@ -2,8 +2,8 @@
 
 import os
 import logging
-import flask
 import time
+from functools import partial
 from f8a_worker.setup_celery import init_selinon
 from flask import Flask, request
 from flask_cors import CORS
@@ -12,8 +12,13 @@ from raven.contrib.flask import Sentry
 from src.recommender import RecommendationTask as RecommendationTaskV1
 from src.stack_aggregator import StackAggregator as StackAggregatorV1
 from src.v2.recommender import RecommendationTask as RecommendationTaskV2
-from src.v2.stack_aggregator import StackAggregator as StackAggregatorV2
-from src.utils import push_data, total_time_elapsed, get_time_delta
+from src.v2.stack_aggregator import (StackAggregator as StackAggregatorV2,
+                                     invalidate_stack_result_cache)
+from src.v2.stack_analysis import StackAnalysis as StackAnalysisV2
+from src import json_codec
+from src.jobs import async_jobs, DONE, FAILED
+from src.utils import (push_data, total_time_elapsed, get_time_delta, select_from_db,
+                       session)
 
 
 def setup_logging(flask_app):
@@ -41,16 +46,28 @@ logger = logging.getLogger(__name__)
 init_selinon()
 
 
+@app.teardown_appcontext
+def remove_session(_exception=None):
+    """Release DB session of the request, its connection goes back to the pool."""
+    session.remove()
+
+
+def _jsonify(obj):
+    """Create JSON response like flask.jsonify, encoded with the configured JSON codec."""
+    body = json_codec.dumpb_sorted(obj, default=app.json_encoder().default) + b'\n'
+    return app.response_class(body, mimetype=app.config['JSONIFY_MIMETYPE'])
+
+
 @app.route('/api/readiness')
 def readiness():
     """Handle GET requests that are sent to /api/readiness REST API endpoint."""
-    return flask.jsonify({}), 200
+    return _jsonify({}), 200
 
 
 @app.route('/api/liveness')
 def liveness():
     """Handle GET requests that are sent to /api/liveness REST API endpoint."""
-    return flask.jsonify({}), 200
+    return _jsonify({}), 200
 
 
 def _recommender(handler):
@@ -95,10 +112,10 @@ def _recommender(handler):
     logger.info('%s took %0.2f seconds for _recommender',
                 external_request_id, time.time() - recommender_started_at)
 
-    return flask.jsonify(r), metrics_payload['status_code']
+    return _jsonify(r), metrics_payload['status_code']
 
 
-def _stack_aggregator(handler):
+def _stack_aggregator(handler, **kwargs):
     external_request_id = 'None'
     stack_aggregator_started_at = time.time()
 
@@ -122,7 +139,7 @@ def _stack_aggregator(handler):
 
         try:
             persist = request.args.get('persist', 'true') == 'true'
-            s = handler.execute(input_json, persist=persist)
+            s = handler.execute(input_json, persist=persist, **kwargs)
             if s is not None and s.get('result') and s.get('result').get('_audit'):
                 # Creating and Pushing Total Metrics Data to Accumulator
                 metrics_payload['value'] = total_time_elapsed(
@@ -150,7 +167,61 @@ def _stack_aggregator(handler):
     logger.info('%s took %0.2f seconds for _stack_aggregators',
                 external_request_id, time.time() - stack_aggregator_started_at)
 
-    return flask.jsonify(s)
+    return _jsonify(s)
+
+
+def _submit_async(execute, worker):
+    """Run execute(input_json, persist=True) in background, respond with 202 and job id.
+
+    Results of async requests are always persisted, the job id is the
+    external_request_id under which the result is stored.
+    """
+    input_json = request.get_json()
+    if not input_json or not input_json.get('external_request_id'):
+        return _jsonify({'status': 'failure', 'external_request_id': None,
+                         'message': 'external_request_id is required'}), 400
+    if request.args.get('persist', 'true') != 'true':
+        return _jsonify({'status': 'failure',
+                         'external_request_id': input_json['external_request_id'],
+                         'message': 'async requests are always persisted'}), 400
+
+    job_id = input_json['external_request_id']
+    job = async_jobs.submit(job_id, partial(execute, input_json, persist=True))
+    if job is None:
+        logger.warning('%s async job queue is full', job_id)
+        return _jsonify({'status': 'rejected', 'external_request_id': job_id,
+                         'message': 'Too many pending jobs, retry later'}), 503
+
+    logger.info('%s %s/ request queued as async job', job_id, worker)
+    location = '{}/{}'.format(request.path, job_id)
+    return _jsonify({'status': job['status'], 'job_id': job_id,
+                     'external_request_id': job_id}), 202, {'Location': location}
+
+
+def _job_status(job_id, worker):
+    """Report status of async job, result is read from RDS.
+
+    Job table is local to the worker process, a job unknown to this process
+    which has no persisted result yet may still be running in another worker,
+    so it is reported as pending or unknown.
+    """
+    body = {'job_id': job_id, 'external_request_id': job_id}
+    job = async_jobs.get(job_id)
+    if job is not None and job['status'] == FAILED:
+        body.update(status=FAILED, message=job['error'])
+        return _jsonify(body), 400
+    if job is not None and job['status'] != DONE:
+        body.update(status=job['status'])
+        return _jsonify(body), 202
+
+    row = select_from_db(external_request_id=job_id, worker=worker)
+    if isinstance(row, dict):
+        return _jsonify(row), row.get('status', 500)
+    if row is None:
+        body.update(status='pending or unknown')
+        return _jsonify(body), 202
+    body.update(status=DONE, result={'external_request_id': job_id, 'result': row.task_result})
+    return _jsonify(body), 200
 
 
 @app.route('/api/v1/recommender', methods=['POST'])
@@ -168,13 +239,81 @@ def stack_aggregator_v1():
 @app.route('/api/v2/recommender', methods=['POST'])
 def recommender_v2():
     """Handle POST requests that are sent to /api/v2/recommender REST API endpoint."""
+    if request.args.get('async', 'false') == 'true':
+        execute = partial(RecommendationTaskV2().execute,
+                          check_license=request.args.get('check_license', 'false') == 'true')
+        return _submit_async(execute, 'recommendation_v2')
     return _recommender(RecommendationTaskV2())
 
 
+@app.route('/api/v2/recommender/<external_request_id>', methods=['GET'])
+def recommender_v2_status(external_request_id):
+    """Handle GET requests polling for result of async /api/v2/recommender request."""
+    return _job_status(external_request_id, 'recommendation_v2')
+
+
 @app.route('/api/v2/stack_aggregator', methods=['POST'])
 def stack_aggregator_v2():
     """Handle POST requests that are sent to /api/v2/stack_aggregator REST API endpoint."""
-    return _stack_aggregator(StackAggregatorV2())
+    incremental = request.args.get('incremental', 'false') == 'true'
+    if request.args.get('async', 'false') == 'true':
+        execute = partial(StackAggregatorV2().execute, incremental=incremental)
+        return _submit_async(execute, 'stack_aggregator_v2')
+    return _stack_aggregator(StackAggregatorV2(), incremental=incremental)
+
+
+@app.route('/api/v2/stack_aggregator/<external_request_id>', methods=['GET'])
+def stack_aggregator_v2_status(external_request_id):
+    """Handle GET requests polling for result of async /api/v2/stack_aggregator request."""
+    return _job_status(external_request_id, 'stack_aggregator_v2')
+
+
+@app.route('/api/v2/stack_aggregator/cache', methods=['DELETE'])
+def stack_aggregator_v2_cache():
+    """Handle DELETE requests dropping cached v2 stack aggregation results.
+
+    Meant to be called after graph data change, e.g. a new CVE or package version
+    is ingested. Caches are local to the worker process serving the request, results
+    cached by other workers expire after STACK_RESULT_CACHE_TTL seconds.
+    """
+    invalidate_stack_result_cache()
+    logger.info('stack result cache invalidated')
+    return _jsonify({'status': 'success'}), 200
+
+
+@app.route('/api/v2/stack_analysis', methods=['POST'])
+def stack_analysis_v2():
+    """Handle POST requests that are sent to /api/v2/stack_analysis REST API endpoint.
+
+    Stack aggregation and recommendation of the same stack are done concurrently.
+    """
+    external_request_id = 'None'
+    started_at = time.time()
+    r = {'stack_analysis': 'failure', 'external_request_id': None}
+    status_code = 200
+
+    input_json = request.get_json()
+    if input_json and input_json.get('external_request_id'):
+        external_request_id = input_json['external_request_id']
+        logger.info('%s stack_analysis/ request with payload: %s',
+                    external_request_id, input_json)
+        try:
+            r = StackAnalysisV2().execute(
+                input_json, persist=request.args.get('persist', 'true') == 'true',
+                check_license=request.args.get('check_license', 'false') == 'true',
+                incremental=request.args.get('incremental', 'false') == 'true')
+        except Exception as e:
+            r = {
+                'stack_analysis': 'unexpected error',
+                'external_request_id': external_request_id,
+                'message': '%s' % e
+            }
+            status_code = 400
+            logger.error('%s failed %s', external_request_id, r)
+
+    logger.info('%s took %0.2f seconds for stack_analysis',
+                external_request_id, time.time() - started_at)
+    return _jsonify(r), status_code
 
 
 if __name__ == "__main__":
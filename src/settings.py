@@ -13,3 +13,50 @@ class Settings(BaseSettings):
     snyk_signin_url: HttpUrl = 'https://snyk.io/login'
     snyk_ecosystem_map: Dict[str, str] = {"pypi": "pip"}
     disable_unknown_package_flow: bool = False
+    # persistent connections kept per upstream host, see HttpSessionRegistry
+    http_pool_connections: int = 10
+    http_pool_maxsize: int = 20
+    # parsed versions memoized per process
+    version_cache_size: int = 16384
+    # bytes read at a time from streamed Gremlin responses
+    gremlin_stream_chunk_size: int = 65536
+    # Gremlin batches of a request fetched at a time
+    gremlin_batch_concurrency: int = 4
+    # requests of a worker process served by thread pools at a time, all pools are sized
+    # from it; further requests wait for a thread, keep it within the worker's
+    # connections (gunicorn --worker-connections)
+    worker_connections: int = 10
+    epv_cache_size: int = 10000
+    epv_cache_ttl: int = 900
+    unknown_epv_cache_size: int = 10000
+    unknown_epv_cache_ttl: int = 120
+    unknown_package_ingestion_workers: int = 2
+    unknown_package_ingestion_max_pending: int = 1000
+    shared_cache_path: str = ''
+    shared_cache_ttl: int = 900
+    # seconds to wait for a busy shared cache, SQLite calls block the gevent loop
+    shared_cache_timeout: float = 0.1
+    osio_user_count_cache_size: int = 10000
+    osio_user_count_cache_ttl: int = 900
+    stack_result_cache_size: int = 1000
+    stack_result_cache_ttl: int = 300
+    incremental_result_max_age: int = 900
+    async_job_workers: int = 4
+    async_job_max_pending: int = 50
+    async_job_ttl: int = 3600
+    # manifests of v1 stack aggregator request aggregated at a time
+    manifest_workers: int = 4
+    # graph and license fetches of a v1 recommender request running at a time
+    recommendation_workers: int = 3
+    # minimal: fetch only graph properties used by v2 stack aggregator, full: all of them
+    gremlin_projection: str = 'minimal'
+    gremlin_streaming: bool = False
+    # nested: vulnerable transitives are listed under each direct dependency, a transitive
+    # shared by several direct dependencies is serialized once per each of them,
+    # shared: listed once in vulnerable_transitives with back-references to dependents,
+    # only this layout deduplicates the response
+    transitive_layout: str = 'nested'
+    # validate result models built from graph data, slow, meant for debugging
+    strict_model_validation: bool = False
+    # JSON backend: auto, orjson or json, see src.json_codec
+    json_codec: str = 'auto'
@@ -7,15 +7,16 @@ Output: TBD
 
 """
 import datetime
+import inspect
 import time
-from flask import current_app
 import requests
-import copy
 from collections import defaultdict
+from functools import partial
+from src.ingestion import unknown_package_ingestion
 from src.settings import Settings
 from src.utils import (select_latest_version, server_create_analysis, LICENSE_SCORING_URL_REST,
                        post_http_request, GREMLIN_SERVER_URL_REST, persist_data_in_db,
-                       GREMLIN_QUERY_SIZE, format_date)
+                       GREMLIN_QUERY_SIZE, format_date, execute_concurrently)
 import logging
 
 logger = logging.getLogger(__file__)
@@ -23,10 +24,9 @@ logger = logging.getLogger(__file__)
 
 def get_recommended_version(ecosystem, name, version):
     """Fetch the recommended version in case of CVEs."""
-    query = "g.V().has('ecosystem', '{eco}').has('name', '{pkg}')" \
-            ".out('has_version').not(out('has_cve')).values('version');"\
-        .format(eco=ecosystem, pkg=name)
-    payload = {'gremlin': query}
+    query = "g.V().has('ecosystem', ecosystem).has('name', name)" \
+            ".out('has_version').not(out('has_cve')).values('version');"
+    payload = {'gremlin': query, 'bindings': {'ecosystem': ecosystem, 'name': name}}
     result = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
     if result:
         versions = result['result']['data']
@@ -283,7 +283,8 @@ def perform_license_analysis(license_score_list, dependencies):
         if not resp:
             raise requests.exceptions.RequestException
     except requests.exceptions.RequestException:
-        current_app.logger.exception("Unexpected error happened while invoking license analysis!")
+        # module logger, this runs in manifest pool threads without flask app context
+        logger.exception("Unexpected error happened while invoking license analysis!")
         flag_stack_license_exception = True
 
     msg = None
@@ -421,7 +422,8 @@ def create_dependency_data_set(resolved, ecosystem):
 def remove_duplicate_cve_data(epv_list):
     """Club all CVEs for an EPV."""
     graph_dict = {}
-    result = []
+    # (pv, cve_id) of CVEs clubbed so far
+    seen_cves = set()
     for data in epv_list['result']['data']:
         pv = data.get('version').get('pname')[0] + ":" + \
              data.get('version').get('version')[0]
@@ -434,21 +436,25 @@ def remove_duplicate_cve_data(epv_list):
             cve = graph_dict[pv].pop('cve')
             # Fixes Issue
             # https://github.com/fabric8-analytics/fabric8-analytics-vscode-extension/issues/328
-            if cve not in graph_dict[pv]['cves']:
+            cve_id = cve.get('cve_id', [None])[0]
+            # CVEs without an id are compared as whole records
+            if cve_id is None:
+                if cve not in graph_dict[pv]['cves']:
+                    graph_dict[pv]['cves'].append(cve)
+            elif (pv, cve_id) not in seen_cves:
+                seen_cves.add((pv, cve_id))
                 graph_dict[pv]['cves'].append(cve)
 
     # create a uniform structure for direct and transitive
-    for x, y in graph_dict.items():
-        z = list()
-        z.append(y)
-        data = {'data': z}
-        result.append(data)
-
-    return result
+    return [{'data': [y]} for y in graph_dict.values()]
 
 
 def add_transitive_details(epv_list, epv_set):
-    """Add transitive dict which affects direct dependencies."""
+    """Add transitive dict which affects direct dependencies.
+
+    Graph data of an EPV is shared by its direct and transitive entries,
+    the entries are read only.
+    """
     direct = epv_set['direct']
     transitive = epv_set['transitive']
     result = []
@@ -462,7 +468,7 @@ def add_transitive_details(epv_list, epv_set):
             epv['version']['version'][0]
 
         if epv_str in direct:
-            result.append(copy.deepcopy(data))
+            result.append(data)
         if epv_str in transitive:
             affected_deps = transitive[epv_str]
             trans_dict = {
@@ -478,66 +484,80 @@ def add_transitive_details(epv_list, epv_set):
                             "version": version
                         }
                     )
-            epv['transitive'] = trans_dict
-            result.append(copy.deepcopy(data))
+            # the direct entry of the same EPV stays without transitive dict
+            result.append({'data': [dict(epv, transitive=trans_dict)]})
 
     return result
 
 
-def get_tr_dependency_data(epv_set):
-    """Get transitive dependency data from graph."""
-    query = "epv=[];"
-    tr_epv_list = {
-        "result": {
-            "data": []
-        }
-    }
-    batch_query = "a = g.V().has('pecosystem', '{eco}').has('pname', '{name}')." \
-                  "has('version', '{ver}').dedup(); a.clone().as('version')." \
-                  "in('has_version').dedup().as('package').select('version')." \
-                  "coalesce(out('has_cve').as('cve')." \
-                  "select('package','version','cve').by(valueMap())," \
-                  "select('package','version').by(valueMap()))." \
-                  "fill(epv);"
-    i = 1
-    epvs = [x for x, y in epv_set['transitive'].items()]
-    tr_list = []
+def get_epv_batch_tasks(epvs):
+    """Split the given 'ecosystem|#|name|#|version' EPVs into graph query batches.
+
+    Return no-arg tasks fetching a batch each along with the list of (name, version)
+    of requested EPVs.
+    """
+    query = inspect.cleandoc("""
+        epv = [];
+        packages.each {
+            g.V().has('pecosystem', it.ecosystem).has('pname', it.name).
+            has('version', it.version).dedup().as('version').
+            in('has_version').dedup().as('package').select('version').
+            coalesce(out('has_cve').as('cve').
+                     select('package', 'version', 'cve').by(valueMap()),
+                     select('package', 'version').by(valueMap())).
+            fill(epv);
+        };
+        epv;
+    """)
+    dep_list = []
+    packages = []
     for epv in epvs:
         eco, name, ver = epv.split('|#|')
-        tr_list.append((name, ver))
-        query += batch_query.format(eco=eco, name=name, ver=ver)
-        if i >= GREMLIN_QUERY_SIZE:
-            i = 1
-            # call_gremlin in batch
-            payload = {'gremlin': query}
-            result = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
-            if result:
-                tr_epv_list['result']['data'] += result['result']['data']
-            query = "epv=[];"
-        i += 1
-
-    if i > 1:
-        payload = {'gremlin': query}
+        dep_list.append((name, ver))
+        packages.append({'ecosystem': eco, 'name': name, 'version': ver})
+
+    def fetch_batch(batch):
+        payload = {'gremlin': query, 'bindings': {'packages': batch}}
         time_start = time.time()
         result = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
         logger.info('elapsed_time for gremlin call: {}'.format(time.time() - time_start))
+        return result
+
+    tasks = [partial(fetch_batch, packages[i:i + GREMLIN_QUERY_SIZE])
+             for i in range(0, len(packages), GREMLIN_QUERY_SIZE)]
+    return tasks, dep_list
+
+
+def join_epv_batches(results):
+    """Join graph data of batch results in the order of batches."""
+    data = []
+    for result in results:
         if result:
-            tr_epv_list['result']['data'] += result['result']['data']
-    return tr_epv_list, tr_list
+            data += result['result']['data']
+    return data
+
+
+def index_epv_data(epv_data):
+    """Index graph response items by (name, version), the first item is kept for duplicates."""
+    index = {}
+    for knowndep in epv_data:
+        version_node = knowndep['version']
+        index.setdefault((version_node['pname'][0], version_node['version'][0]), knowndep)
+    return index
 
 
 def find_unknown_deps(epv_data, epv_list, dep_list, unknown_deps_list, is_transitive=False):
     """Find the list of unknown dependencies."""
+    epv_index = index_epv_data(epv_data)
     for pkg, ver in dep_list:
         known_flag = False
-        for knowndep in epv_data:
+        knowndep = epv_index.get((pkg, ver))
+        if knowndep is not None:
             version_node = knowndep['version']
-            if pkg == knowndep['version']['pname'][0] and ver == knowndep['version']['version'][0]:
-                if is_transitive and 'cve' in knowndep:
-                    epv_list['result']['data'].append(knowndep)
-                if version_node.get('licenses') or version_node.get('declared_licenses'):
-                    known_flag = True
-                break
+            if is_transitive and 'cve' in knowndep:
+                epv_list['result']['data'].append(knowndep)
+            if version_node.get('licenses') or version_node.get('declared_licenses'):
+                known_flag = True
         if not known_flag:
             unknown_deps_list.append({'name': pkg, 'version': ver})
     return epv_list, unknown_deps_list
@@ -552,38 +572,17 @@ def get_dependency_data(epv_set):
         }
     }
     unknown_deps_list = []
-    query = "epv=[];"
-    batch_query = "a = g.V().has('pecosystem', '{eco}').has('pname', '{name}')." \
-                  "has('version', '{ver}').dedup(); a.clone().as('version')." \
-                  "in('has_version').dedup().as('package').select('version')." \
-                  "coalesce(out('has_cve').as('cve')." \
-                  "select('package','version','cve').by(valueMap())," \
-                  "select('package','version').by(valueMap()))." \
-                  "fill(epv);"
-    i = 1
-    epvs = [x for x, y in epv_set['direct'].items()]
-    dep_list = []
-    for epv in epvs:
-        eco, name, ver = epv.split('|#|')
-        dep_list.append((name, ver))
-        query += batch_query.format(eco=eco, name=name, ver=ver)
-        if i >= GREMLIN_QUERY_SIZE:
-            i = 1
-            # call_gremlin in batch
-            payload = {'gremlin': query}
-            result = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
-            if result:
-                epv_list['result']['data'] += result['result']['data']
-            query = "epv=[];"
-        i += 1
-
-    if i > 1:
-        payload = {'gremlin': query}
-        result = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
-        if result:
-            epv_list['result']['data'] += result['result']['data']
-
-    tr_epv_list, tr_list = get_tr_dependency_data(epv_set)
+    # batches of direct and transitive dependencies are fetched concurrently
+    direct_tasks, dep_list = get_epv_batch_tasks(epv_set['direct'].keys())
+    tr_tasks, tr_list = get_epv_batch_tasks(epv_set['transitive'].keys())
+    results = execute_concurrently(direct_tasks + tr_tasks,
+                                   Settings().gremlin_batch_concurrency, name='gremlin')
+    epv_list['result']['data'] = join_epv_batches(results[:len(direct_tasks)])
+    tr_epv_list = {
+        "result": {
+            "data": join_epv_batches(results[len(direct_tasks):])
+        }
+    }
     transitive_count = len(tr_epv_list['result']['data'])
 
     # Identification of unknown direct dependencies
@@ -605,6 +604,36 @@ def get_dependency_data(epv_set):
 class StackAggregator:
     """Aggregate stack data from components."""
 
+    @staticmethod
+    def aggregate_manifest(result, show_transitive, current_stack_license, persist=True):
+        """Aggregate stack data of a manifest, return it with unknown dependencies."""
+        resolved = result['details'][0]['_resolved']
+        ecosystem = result['details'][0]['ecosystem']
+        manifest = result['details'][0]['manifest_file']
+        manifest_file_path = result['details'][0]['manifest_file_path']
+
+        epv_set = create_dependency_data_set(resolved, ecosystem)
+        finished = get_dependency_data(epv_set)
+
+        """ Direct deps can have 0 transitives. This condition is added
+        so that in ext, we get to know if deps are 0 or if the transitive flag
+        is false """
+        if show_transitive == "true":
+            transitive_count = finished.get('transitive_count', 0)
+        else:
+            transitive_count = -1
+        output = None
+        if finished is not None:
+            output = aggregate_stack_data(finished, manifest, ecosystem.lower(), resolved,
+                                          manifest_file_path, persist, transitive_count)
+            if output and output.get('user_stack_info'):
+                output['user_stack_info']['license_analysis'].update({
+                    "current_stack_license": current_stack_license
+                })
+        unknown_deps = [(ecosystem, dep['name'], dep['version'])
+                        for dep in finished['unknown_deps']]
+        return output, unknown_deps
+
     @staticmethod
     def execute(aggregated=None, persist=True):
         """Task code."""
@@ -616,31 +645,15 @@ class StackAggregator:
         # TODO multiple license file support
         current_stack_license = aggregated.get('current_stack_license', {}).get('1', {})
 
-        for result in aggregated['result']:
-            resolved = result['details'][0]['_resolved']
-            ecosystem = result['details'][0]['ecosystem']
-            manifest = result['details'][0]['manifest_file']
-            manifest_file_path = result['details'][0]['manifest_file_path']
-
-            epv_set = create_dependency_data_set(resolved, ecosystem)
-            finished = get_dependency_data(epv_set)
-
-            """ Direct deps can have 0 transitives. This condition is added
-            so that in ext, we get to know if deps are 0 or if the transitive flag
-            is false """
-            if show_transitive == "true":
-                transitive_count = finished.get('transitive_count', 0)
-            else:
-                transitive_count = -1
-            if finished is not None:
-                output = aggregate_stack_data(finished, manifest, ecosystem.lower(), resolved,
-                                              manifest_file_path, persist, transitive_count)
-                if output and output.get('user_stack_info'):
-                    output['user_stack_info']['license_analysis'].update({
-                        "current_stack_license": current_stack_license
-                    })
+        # manifests are aggregated concurrently, stack data keeps order of manifests
+        tasks = [partial(StackAggregator.aggregate_manifest, result, show_transitive,
+                         current_stack_license, persist=persist)
+                 for result in aggregated['result']]
+        for output, unknown_deps in execute_concurrently(tasks, Settings().manifest_workers,
+                                                         name='manifest'):
+            if output is not None:
                 stack_data.append(output)
-            unknown_dep_list.extend(finished['unknown_deps'])
+            unknown_dep_list.extend(unknown_deps)
         ended_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
         audit = {
             'started_at': started_at,
@@ -666,13 +679,8 @@ class StackAggregator:
         if Settings().disable_unknown_package_flow:
             logger.warning('Skipping unknown flow %s', unknown_dep_list)
         else:
-            try:
-                for dep in unknown_dep_list:
-                    server_create_analysis(ecosystem, dep['name'], dep['version'], api_flow=True,
-                                           force=False, force_graph_sync=True)
-            except Exception as e:
-                logger.error('Ingestion has been failed for ' + dep['name'])
-                logger.error(e)
-                pass
+            unknown_package_ingestion.submit(
+                unknown_dep_list, partial(server_create_analysis, api_flow=True, force=False,
+                                          force_graph_sync=True))
 
         return persiststatus
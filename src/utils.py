@@ -1,15 +1,23 @@
 """Various utility functions used across the repo."""
 
+import codecs
+import contextlib
 import datetime
+import functools
+import inspect
+import itertools
 import logging
 import os
+import threading
 import time
 import traceback
 
 import requests
 import semantic_version as sv
 
-from typing import Dict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 from f8a_utils.versions import get_versions_for_ep
 from f8a_worker.models import WorkerResult
 from f8a_worker.setup_celery import init_celery
@@ -20,7 +28,12 @@ from selinon import run_flow
 from sqlalchemy import create_engine
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from src import json_codec
+from src.cache import TTLCache
+from src.json_stream import iter_json_items
+from src.settings import Settings
 
 
 logger = logging.getLogger(__name__)
@@ -58,6 +71,20 @@ METRICS_COLLECTION_URL = "http://{base_url}:{port}/api/v1/prometheus".format(
     base_url=os.environ.get("METRICS_ENDPOINT_URL"),
     port=os.environ.get("METRICS_ENDPOINT_URL_PORT"))
 
+OSIO_USER_COUNTS_QUERY = inspect.cleandoc("""
+    counts = [];
+    packages.each {
+        counts.add([ecosystem: it.ecosystem, name: it.name, version: it.version,
+                    count: g.V().has('pecosystem', it.ecosystem).has('pname', it.name).
+                           has('version', it.version).in('uses').count().next()]);
+    };
+    counts;""")
+
+# (ecosystem, name, version) -> number of uses
+osio_user_count_cache = TTLCache(maxsize=Settings().osio_user_count_cache_size,
+                                 ttl=Settings().osio_user_count_cache_ttl,
+                                 name='osio_user_count_cache')
+
 
 class Postgres:
     """Postgres connection session handler."""
@@ -71,7 +98,7 @@ class Postgres:
                    pgbouncer_host=os.getenv('PGBOUNCER_SERVICE_HOST', 'bayesian-pgbouncer'),
                    pgbouncer_port=os.getenv('PGBOUNCER_SERVICE_PORT', '5432'),
                    database=os.getenv('POSTGRESQL_DATABASE'))
-        engine = create_engine(self.connection)
+        engine = create_engine(self.connection, json_serializer=json_codec.dumps)
 
         self.Session = sessionmaker(bind=engine)
         self.session = self.Session()
@@ -81,7 +108,8 @@ class Postgres:
         return self.session
 
 
-session = Postgres().session
+# thread local sessions, API requests and background jobs never share one
+session = scoped_session(Postgres().Session)
 
 
 def format_date(date):
@@ -95,30 +123,64 @@ def format_date(date):
     return date
 
 
-def get_osio_user_count(ecosystem, name, version):
-    """Send query to the graph database to get # of uses for the provided E+P+V."""
-    str_gremlin = "g.V().has('pecosystem','{}').has('pname','{}').has('version','{}').".format(
-        ecosystem, name, version)
-    str_gremlin += "in('uses').count();"
+def get_osio_user_counts(epvs: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], int]:
+    """Get # of uses for all the given (ecosystem, name, version) with one graph query.
+
+    Counts are cached per E+P+V, EPVs missing in the graph response get -1.
+    """
+    counts = {}
+    missing = []
+    for epv in dict.fromkeys(epvs):
+        count = osio_user_count_cache.get(epv)
+        if count is None:
+            missing.append(epv)
+        else:
+            counts[epv] = count
+    if not missing:
+        return counts
+
     payload = {
-        'gremlin': str_gremlin
+        'gremlin': OSIO_USER_COUNTS_QUERY,
+        'bindings': {
+            'packages': [{'ecosystem': ecosystem, 'name': name, 'version': version}
+                         for ecosystem, name, version in missing]
+        }
     }
-
     json_response = post_http_request(url=GREMLIN_SERVER_URL_REST, payload=payload)
-    return json_response.get('result').get('data', ['-1'])[0]
+    for item in json_response.get('result', {}).get('data') or []:
+        if isinstance(item, dict) and 'count' in item:
+            epv = (item.get('ecosystem'), item.get('name'), item.get('version'))
+            counts[epv] = item['count']
+            osio_user_count_cache.put(epv, item['count'])
+    for epv in missing:
+        counts.setdefault(epv, -1)
+    return counts
+
+
+def index_insights_packages(insights_packages: Iterable[Dict]) -> Dict[str, Dict]:
+    """Index package entries of insights response by package name, the last entry wins."""
+    return {pkg.get('package_name', ''): pkg for pkg in insights_packages}
+
 
+def create_package_dict(graph_results, alt_dict=None, insights_index=None):
+    """Convert Graph Results into the Recommendation Dict.
 
-def create_package_dict(graph_results, alt_dict=None):
-    """Convert Graph Results into the Recommendation Dict."""
+    Topics and co-occurrence stats are taken from insights_index, see
+    index_insights_packages(), packages missing in it have none.
+    """
     pkg_list = []
+    insights_index = insights_index or {}
+
+    epvs = [(epv.get('version', {}).get('pecosystem', [''])[0],
+             epv.get('version', {}).get('pname', [''])[0],
+             epv.get('version', {}).get('version', [''])[0]) for epv in graph_results]
+    osio_user_counts = get_osio_user_counts([epv for epv in epvs if all(epv)])
 
-    for epv in graph_results:
-        ecosystem = epv.get('version', {}).get('pecosystem', [''])[0]
-        name = epv.get('version', {}).get('pname', [''])[0]
-        version = epv.get('version', {}).get('version', [''])[0]
+    for epv, (ecosystem, name, version) in zip(graph_results, epvs):
         if ecosystem and name and version:
-            # TODO change this logic later to fetch osio_user_count
-            osio_user_count = get_osio_user_count(ecosystem, name, version)
+            osio_user_count = osio_user_counts[(ecosystem, name, version)]
+            package_name = epv['package'].get('name', [''])[0]
+            insights_pkg = insights_index.get(package_name, {}) if package_name else {}
             pkg_dict = {
                 'ecosystem': ecosystem,
                 'name': name,
@@ -131,9 +193,9 @@ def create_package_dict(graph_results, alt_dict=None):
                 ),
                 'security': [],
                 'osio_user_count': osio_user_count,
-                'topic_list': epv['package'].get('pgm_topics', []),
-                'cooccurrence_probability': epv['package'].get('cooccurrence_probability', 0),
-                'cooccurrence_count': epv['package'].get('cooccurrence_count', 0)
+                'topic_list': insights_pkg.get('topic_list', []),
+                'cooccurrence_probability': insights_pkg.get('cooccurrence_probability', 0),
+                'cooccurrence_count': insights_pkg.get('cooccurrence_count', 0)
             }
 
             # TODO: refactoring
@@ -200,32 +262,44 @@ def create_package_dict(graph_results, alt_dict=None):
     return pkg_list
 
 
+@functools.lru_cache(maxsize=Settings().version_cache_size)
+def _semantic_version(version):
+    """Parse raw version into semantic version, None if it can't be parsed."""
+    if version in ('', '-1', None):
+        version = '0.0.0'
+    # Needed for maven version like 1.5.2.RELEASE to be converted to
+    # 1.5.2 - RELEASE for semantic version to work.
+    version = version.replace('.', '-', 3)
+    version = version.replace('-', '.', 2)
+    # Needed to add this so that -RELEASE is account as a Version.build
+    version = version.replace('-', '+', 3)
+    try:
+        return sv.Version.coerce(version)
+    except ValueError:
+        return None
+
+
 def convert_version_to_proper_semantic(version, package_name=None):
     """Perform Semantic versioning.
 
+    Parsed versions are memoized, returned instances must not be modified.
+
     : type version: string
     : param version: The raw input version that needs to be converted.
     : type return: semantic_version.base.Version
     : return: The semantic version of raw input version.
     """
-    conv_version = sv.Version.coerce('0.0.0')
     try:
-        if version in ('', '-1', None):
-            version = '0.0.0'
-        """Needed for maven version like 1.5.2.RELEASE to be converted to
-        1.5.2 - RELEASE for semantic version to work."""
-        version = version.replace('.', '-', 3)
-        version = version.replace('-', '.', 2)
-        # Needed to add this so that -RELEASE is account as a Version.build
-        version = version.replace('-', '+', 3)
-        conv_version = sv.Version.coerce(version)
-    except ValueError:
+        conv_version = _semantic_version(version)
+    except Exception:
+        # unhashable or non string version
+        return zero_version
+    if conv_version is None:
         logger.info(
             "Unexpected ValueError for the package {} due to version {}"
             .format(package_name, version))
-        pass
-    finally:
-        return conv_version
+        return zero_version
+    return conv_version
 
 
 def version_info_tuple(version):
@@ -243,53 +317,117 @@ def version_info_tuple(version):
     return (0, 0, 0, tuple())
 
 
+def _version_key(version, package_name=None) -> Tuple[Tuple, bool]:
+    """Return (sort key, is zero version) for the raw version."""
+    sem_version = convert_version_to_proper_semantic(version, package_name)
+    return version_info_tuple(sem_version), sem_version == zero_version
+
+
+_cached_version_key = functools.lru_cache(maxsize=Settings().version_cache_size)(_version_key)
+
+
+def _get_version_key(version, package_name=None) -> Tuple[Tuple, bool]:
+    """Return memoized (sort key, is zero version) for the raw version."""
+    try:
+        return _cached_version_key(version)
+    except TypeError:
+        # unhashable version can't be memoized
+        return _version_key(version, package_name)
+
+
+def version_sort_key(version, package_name=None) -> Tuple:
+    """Return hashable key in form of (major, minor, patch, build) for raw version.
+
+    Keys of two raw versions compare the same way as version_info_tuple() of
+    their semantic versions.
+    """
+    return _get_version_key(version, package_name)[0]
+
+
 def select_latest_version(input_version='', libio='', anitya='', package_name=None):
     """Select latest version from input sequence(s)."""
-    libio_sem_version = convert_version_to_proper_semantic(libio, package_name)
-    anitya_sem_version = convert_version_to_proper_semantic(
-        anitya, package_name)
-    input_sem_version = convert_version_to_proper_semantic(
-        input_version, package_name)
-    return_version = ''
-    try:
-        if libio_sem_version == zero_version\
-                and anitya_sem_version == zero_version\
-                and input_sem_version == zero_version:
-            return_version = ''
-        else:
-            return_version = input_version
-            libio_tuple = version_info_tuple(libio_sem_version)
-            anitya_tuple = version_info_tuple(anitya_sem_version)
-            input_tuple = version_info_tuple(input_sem_version)
-            if libio_tuple >= anitya_tuple and libio_tuple >= input_tuple:
-                return_version = libio
-            elif anitya_tuple >= libio_tuple and anitya_tuple >= input_tuple:
-                return_version = anitya
-    except ValueError:
-        """In case of failure let's not show any latest version at all.
-        Also, no generation of stack trace,
-        as we are only intersted in the package that is causing the error."""
-        logger.info(
-            "Unexpected ValueError while selecting latest version for package {}. Debug:{}"
-            .format(package_name,
-                    {'input_version': input_version, 'libio': libio, 'anitya': anitya}))
-        return_version = ''
-        pass
-    finally:
-        return return_version
+    libio_key, libio_zero = _get_version_key(libio, package_name)
+    anitya_key, anitya_zero = _get_version_key(anitya, package_name)
+    input_key, input_zero = _get_version_key(input_version, package_name)
+
+    if libio_zero and anitya_zero and input_zero:
+        return ''
+    if libio_key >= anitya_key and libio_key >= input_key:
+        return libio
+    if anitya_key >= libio_key and anitya_key >= input_key:
+        return anitya
+    return input_version
 
 
 def get_session_retry(retries=3, backoff_factor=0.2, status_forcelist=(404, 500, 502, 504),
-                      session=None):
+                      session=None, pool_connections=requests.adapters.DEFAULT_POOLSIZE,
+                      pool_maxsize=requests.adapters.DEFAULT_POOLSIZE):
     """Set HTTP Adapter with retries to session."""
     session = session or requests.Session()
     retry = Retry(total=retries, read=retries, connect=retries,
                   backoff_factor=backoff_factor, status_forcelist=status_forcelist)
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_connections,
+                          pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
+    session.mount('https://', adapter)
     return session
 
 
+class HttpSessionRegistry:
+    """Process wide registry of persistent HTTP sessions keyed by upstream host.
+
+    Sessions keep connections alive across requests. A forked process (i.e.
+    gunicorn worker) must not share sockets with its parent, so sessions
+    inherited over fork are dropped and created afresh in the child.
+    """
+
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None):
+        """Initialize empty registry, pool sizes default to HTTP_POOL_* settings."""
+        settings = Settings()
+        self._pool_connections = pool_connections or settings.http_pool_connections
+        self._pool_maxsize = pool_maxsize or settings.http_pool_maxsize
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sessions: Dict[str, requests.Session] = {}
+
+    def get(self, url: str) -> requests.Session:
+        """Return persistent session for the host of the given url."""
+        if self._pid != os.getpid():
+            self.after_fork()
+        parts = urlsplit(url)
+        key = '{}://{}'.format(parts.scheme, parts.netloc)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = get_session_retry(pool_connections=self._pool_connections,
+                                            pool_maxsize=self._pool_maxsize)
+                self._sessions[key] = session
+            return session
+
+    def after_fork(self):
+        """Forget sessions inherited from parent process without closing their sockets."""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sessions = {}
+
+    def reset(self):
+        """Close all sessions of current process."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+http_sessions = HttpSessionRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=http_sessions.after_fork)
+
+
+def get_http_session(url: str) -> requests.Session:
+    """Return pooled, persistent session for the given url."""
+    return http_sessions.get(url)
+
+
 def persist_data_in_db(external_request_id, task_result, worker, started_at=None, ended_at=None):
     """Persist the data in Postgres."""
     try:
@@ -311,9 +449,9 @@ def persist_data_in_db(external_request_id, task_result, worker, started_at=None
 def post_http_request(url: str, payload: Dict):
     """Post the given payload to url."""
     try:
-        response = get_session_retry().post(url=url, json=payload)
+        response = get_http_session(url).post(url=url, json=payload)
         response.raise_for_status()
-        return response.json()
+        return json_codec.loads(response.content)
     except Exception as e:
         logger.error(traceback.format_exc())
         logger.error(
@@ -330,9 +468,10 @@ def post_gremlin(query: str, bindings: Dict = None) -> Dict:
         }
         if bindings:
             payload['bindings'] = bindings
-        response = get_session_retry().post(url=GREMLIN_SERVER_URL_REST, json=payload)
+        http_session = get_http_session(GREMLIN_SERVER_URL_REST)
+        response = http_session.post(url=GREMLIN_SERVER_URL_REST, json=payload)
         response.raise_for_status()
-        return response.json()
+        return json_codec.loads(response.content)
     except Exception as e:
         logger.error(traceback.format_exc())
         logger.error(
@@ -341,6 +480,106 @@ def post_gremlin(query: str, bindings: Dict = None) -> Dict:
         raise GremlinExeception from e
 
 
+def post_gremlin_stream(query: str, bindings: Dict = None) -> Iterator[Dict]:
+    """Post the given query and bindings to gremlin endpoint, yield result data items.
+
+    Items are parsed one at a time while the response is read, the response body
+    is never held in memory as a whole.
+    """
+    payload = {
+        'gremlin': query,
+    }
+    if bindings:
+        payload['bindings'] = bindings
+    response = None
+    try:
+        http_session = get_http_session(GREMLIN_SERVER_URL_REST)
+        response = http_session.post(url=GREMLIN_SERVER_URL_REST, json=payload, stream=True)
+        response.raise_for_status()
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        logger.error(
+            "HTTP error {code}. Error retrieving data for {query}.".format(
+                code=getattr(response, 'status_code', None), query=payload))
+        raise GremlinExeception from e
+
+    with contextlib.closing(response):
+        chunk_size = Settings().gremlin_stream_chunk_size
+        chunks = codecs.iterdecode(response.iter_content(chunk_size=chunk_size), 'utf-8')
+        try:
+            yield from iter_json_items(chunks, ('result', 'data'))
+        except (ValueError, requests.exceptions.RequestException) as e:
+            logger.error(traceback.format_exc())
+            raise GremlinExeception from e
+
+
+class ExecutorRegistry:
+    """Process wide thread pools keyed by name and size.
+
+    A pool is created at first use and never replaced while the process lives,
+    callers asking for another size of the same name get a pool of their own.
+    Threads don't survive fork, pools inherited from the parent process are
+    dropped and created afresh in the child.
+    """
+
+    def __init__(self):
+        """Initialize empty registry."""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._executors: Dict[Tuple[str, int], ThreadPoolExecutor] = {}
+
+    def get(self, name: str, max_workers: int) -> ThreadPoolExecutor:
+        """Return pool of the given name and size, create it on first use."""
+        if self._pid != os.getpid():
+            self.after_fork()
+        with self._lock:
+            executor = self._executors.get((name, max_workers))
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max_workers,
+                                              thread_name_prefix=name)
+                self._executors[(name, max_workers)] = executor
+            return executor
+
+    def after_fork(self):
+        """Forget pools inherited from parent process."""
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._executors = {}
+
+
+executors = ExecutorRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=executors.after_fork)
+
+
+def execute_concurrently(tasks: List[Callable], max_workers: int, name: str = 'default') -> List:
+    """Run the given no-arg callables on the process wide pool of the given name.
+
+    At most max_workers tasks of this call run at a time, the bound is per call.
+    The pool has max_workers threads per each of Settings().worker_connections
+    requests and is shared by all requests served by the process. Tasks must not
+    wait for other tasks of the same pool, otherwise the pool may deadlock.
+    Results are returned in the same order as tasks, the first exception raised
+    by any task is propagated to the caller and the tasks not started yet are
+    dropped. With a single task or max_workers <= 1 the tasks are executed inline.
+    """
+    if len(tasks) <= 1 or max_workers <= 1:
+        return [task() for task in tasks]
+
+    executor = executors.get(name, Settings().worker_connections * max_workers)
+    results = [None] * len(tasks)
+    queued = iter(enumerate(tasks))
+    pending = {executor.submit(task): index
+               for index, task in itertools.islice(queued, max_workers)}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+            for index, task in itertools.islice(queued, 1):
+                pending[executor.submit(task)] = index
+    return results
+
+
 def get_response_data(json_response, data_default):
     """Retrieve data from the JSON response.
 
@@ -349,6 +588,19 @@ def get_response_data(json_response, data_default):
     return json_response.get("result", {}).get("data", data_default)
 
 
+_celery_lock = threading.Lock()
+_celery_initialized = False
+
+
+def _init_celery_once():
+    """Initialize celery client of the process, flows are started from several threads."""
+    global _celery_initialized
+    with _celery_lock:
+        if not _celery_initialized:
+            init_celery(result_backend=False)
+            _celery_initialized = True
+
+
 def server_run_flow(flow_name, flow_args):
     """Run a flow.
 
@@ -359,7 +611,7 @@ def server_run_flow(flow_name, flow_args):
     logger.debug('Running flow {}'.format(flow_name))
     start = datetime.datetime.now()
 
-    init_celery(result_backend=False)
+    _init_celery_once()
     dispacher_id = run_flow(flow_name, flow_args)
 
     # compute the elapsed time
@@ -406,15 +658,86 @@ def select_from_db(external_request_id, worker):
     :param: worker: stack_aggregator / recommender
     """
     try:
-        return session.query(WorkerResult)\
+        row = session.query(WorkerResult)\
             .filter(
                 WorkerResult.external_request_id == external_request_id,
                 WorkerResult.worker == worker).first()
+        if row is not None:
+            # loaded attributes stay readable once the read transaction is ended
+            session.expunge(row)
+        return row
     except (SQLAlchemyError, Exception) as e:
         logger.error("Error %r." % e)
-        session.rollback()
         return {'recommendation': 'database error', 'external_request_id': external_request_id,
                 'message': '%s' % e, 'status': 501}
+    finally:
+        # end read transaction, its connection goes back to the pool
+        session.rollback()
+
+
+WORKER_RESULT_MANIFEST_INDEX = 'ix_worker_results_manifest'
+_worker_result_indexes_checked = False
+
+
+def check_worker_result_indexes() -> bool:
+    """Warn when index of worker_results used by incremental analysis is missing.
+
+    The index belongs to the f8a_worker schema and is created by its migrations as
+    CREATE INDEX ix_worker_results_manifest ON worker_results (worker,
+    (task_result->>'uuid'), (task_result->>'ecosystem'), (task_result->>'manifest_file_path')).
+    Without it previous results are looked up by a sequential scan of worker_results.
+
+    :return: False when the index is missing or could not be looked up
+    """
+    try:
+        found = session.execute(
+            "SELECT 1 FROM pg_indexes WHERE tablename = 'worker_results' AND indexname = :name",
+            {'name': WORKER_RESULT_MANIFEST_INDEX}).first() is not None
+    except Exception as e:
+        logger.warning("Failed to look up worker_results indexes %r." % e)
+        return False
+    finally:
+        session.rollback()
+    if not found:
+        logger.warning("Index %s of worker_results is missing, incremental analysis "
+                       "scans the whole table." % WORKER_RESULT_MANIFEST_INDEX)
+    return found
+
+
+def select_latest_worker_result(worker: str, ecosystem: str, manifest_file_path: str,
+                                uuid: str, max_age: int = None) -> Optional[Dict]:
+    """Read task result of the most recent successful analysis of the user's manifest.
+
+    Results are looked up by JSONB fields of task_result, through the expression index
+    checked by check_worker_result_indexes() on the first lookup of the process.
+
+    :param: worker: stack_aggregator_v2 / recommendation_v2
+    :param: uuid: results of other users are never returned
+    :param: max_age: ignore results older than max_age seconds
+    :return: task_result or None when there is none or it can't be read
+    """
+    global _worker_result_indexes_checked
+    if not _worker_result_indexes_checked:
+        _worker_result_indexes_checked = True
+        check_worker_result_indexes()
+    try:
+        query = session.query(WorkerResult.task_result).filter(
+            WorkerResult.worker == worker,
+            WorkerResult.error.is_(False),
+            WorkerResult.task_result['uuid'].astext == uuid,
+            WorkerResult.task_result['ecosystem'].astext == ecosystem,
+            WorkerResult.task_result['manifest_file_path'].astext == manifest_file_path)
+        if max_age:
+            query = query.filter(WorkerResult.ended_at >= datetime.datetime.utcnow() -
+                                 datetime.timedelta(seconds=max_age))
+        row = query.order_by(WorkerResult.id.desc()).first()
+        return row.task_result if row else None
+    except Exception as e:
+        logger.error("Error %r." % e)
+        return None
+    finally:
+        # end read transaction, its connection goes back to the pool
+        session.rollback()
 
 
 def get_time_delta(audit_data):
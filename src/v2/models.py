@@ -161,6 +161,12 @@ class PackageDataWithVulnerabilities(PackageDetails):  # noqa: D101
     )
 
 
+class VulnerableTransitive(PackageDataWithVulnerabilities):  # noqa: D101
+    dependents: Optional[List['Package']] = Field(
+        None, description='Direct dependencies which depend on the package.'
+    )
+
+
 class RecommendedPackageData(PackageDetails):  # noqa: D101
     cooccurrence_probability: Optional[float] = 0
     cooccurrence_count: int = 0
@@ -193,6 +199,12 @@ class StackAggregatorResult(BaseModel):  # noqa: D101
         None,
         description="All direct dependencies details regardless of it's vulnerability status\n",
     )
+    vulnerable_transitives: Optional[List['VulnerableTransitive']] = Field(
+        None,
+        description=('Vulnerable transitive dependencies listed once with their dependents, '
+                     'set instead of vulnerable_dependencies in shared transitive layout '
+                     'only, left out of the response otherwise.'),
+    )
 
 
 class StackAggregatorRequest(BaseModel):  # noqa: D101
@@ -231,4 +243,5 @@ class RecommenderRequest(StackAggregatorRequest):  # noqa: D101
 
 Package.update_forward_refs()
 PackageDataWithVulnerabilities.update_forward_refs()
+VulnerableTransitive.update_forward_refs()
 RecommendedPackageData.update_forward_refs()
@@ -1,4 +1,6 @@
 """Abstraction for various response models used in V2 implementation."""
+import hashlib
+import json
 from collections import defaultdict
 from typing import List, Tuple, Dict, Set
 
@@ -52,6 +54,15 @@ class NormalizedPackages:
         """Ecosystem value."""
         return self._ecosystem
 
+    @property
+    def canonical_hash(self) -> str:
+        """Hash of ecosystem and dependency graph, independent of order of packages."""
+        graph = sorted([package.name, package.version,
+                        sorted([trans.name, trans.version] for trans in transitives)]
+                       for package, transitives in self._dependency_graph.items())
+        canonical = json.dumps([self._ecosystem, graph], separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
 
 class GoNormalizedPackages(NormalizedPackages):
     """Duplicate free list of GoNormalised Packages."""
@@ -75,6 +86,13 @@ class GoNormalizedPackages(NormalizedPackages):
         """Get Tuple of Package Modules."""
         return tuple(set(self._modules))
 
+    @property
+    def canonical_hash(self) -> str:
+        """Hash of ecosystem, dependency graph and modules of pseudo version packages."""
+        canonical = json.dumps([super().canonical_hash, sorted(set(self._modules))],
+                               separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
     @property
     def version_map(self) -> Dict:
         """Map of Package_name: package_version."""
@@ -6,16 +6,19 @@ sourcing.
 
 import json
 import datetime
+import inspect
 import requests
 import os
 import time
 import logging
 from collections import defaultdict
 
-from src.utils import (create_package_dict, get_session_retry, select_latest_version,
-                       LICENSE_SCORING_URL_REST, convert_version_to_proper_semantic,
-                       get_response_data, version_info_tuple, persist_data_in_db,
-                       post_gremlin)
+from src.cache import fetch_with_shared_cache
+from src.utils import (create_package_dict, get_http_session, select_latest_version,
+                       LICENSE_SCORING_URL_REST, version_sort_key,
+                       get_response_data, persist_data_in_db,
+                       post_gremlin, index_insights_packages)
+from src.v2.license_service import get_license_service_request_payload
 from src.v2.models import RecommenderRequest, StackRecommendationResult
 from src.v2.stack_aggregator import extract_user_stack_package_licenses
 from src.v2.normalized_packages import NormalizedPackages
@@ -33,19 +36,30 @@ class GraphDB:
 
         Also remove EPVs with CVEs and ones not present in Graph
         """
-        str_query = "data=[]; "
-        for package in input_list:
-            str_query += "pkg = g.V().has('ecosystem', '{eco}').has('name', '{pkg}'); " \
-                         "lnv = []; pkg.clone().values('latest_non_cve_version', " \
-                         "'latest_version').fill(lnv); pkg.clone().as('package').V()." \
-                         "has('pecosystem', '{eco}').has('pname', '{pkg}')." \
-                         "has('version', within(lnv)).as('version')." \
-                         "select('package', 'version').by(valueMap()).fill(data);".format(
-                                                                                    eco=ecosystem,
-                                                                                    pkg=package)
-        str_query += "data"
+        return fetch_with_shared_cache(
+            'version_information', ecosystem, list(input_list),
+            lambda packages: GraphDB.get_version_information_from_graph(packages, ecosystem),
+            lambda epv: epv.get('package', {}).get('name', [''])[0])
+
+    @staticmethod
+    def get_version_information_from_graph(input_list, ecosystem):
+        """Fetch the version information for each of the packages from graph."""
+        query = inspect.cleandoc("""
+            data = [];
+            packages.each {
+                pkg = g.V().has('ecosystem', ecosystem).has('name', it);
+                lnv = [];
+                pkg.clone().values('latest_non_cve_version', 'latest_version').fill(lnv);
+                pkg.clone().as('package').V().
+                has('pecosystem', ecosystem).has('pname', it).
+                has('version', within(lnv)).as('version').
+                select('package', 'version').by(valueMap()).fill(data);
+            };
+            data;
+        """)
+        bindings = {'ecosystem': ecosystem, 'packages': list(input_list)}
         # Query Gremlin with packages list to get their version information
-        gremlin_response = post_gremlin(str_query)
+        gremlin_response = post_gremlin(query, bindings)
         if gremlin_response is None:
             return []
         response = get_response_data(gremlin_response, [{0: 0}])
@@ -111,10 +125,8 @@ class GraphDB:
             latest_version = epv.get('package').get('latest_version', [''])[0]
 
             # Convert version to a proper semantic case
-            semversion_tuple = version_info_tuple(
-                convert_version_to_proper_semantic(version, name))
-            input_stack_tuple = version_info_tuple(
-                convert_version_to_proper_semantic(input_stack.get(name, ''), name))
+            semversion_tuple = version_sort_key(version, name)
+            input_stack_tuple = version_sort_key(input_stack.get(name, ''), name)
 
             if name and version:
                 # Select highest version based on input or graph as latest version
@@ -161,22 +173,6 @@ class GraphDB:
         new_list = GraphDB.prepare_final_filtered_list(new_dict)
         return new_list, filtered_comp_list
 
-    @staticmethod
-    def get_topics_for_comp(comp_list, pgm_list):
-        """Get topics from pgm and associate with filtered versions from Graph."""
-        for epv in comp_list:
-            name = epv.get('package', {}).get('name', [''])[0]
-            if name:
-                for pgm_epv in pgm_list:
-                    if name == pgm_epv.get('package_name', ''):
-                        epv['package']['topic_list'] = pgm_epv.get('topic_list', [])
-                        epv['package']['cooccurrence_probability'] = pgm_epv.get(
-                            'cooccurrence_probability', 0)
-                        epv['package']['cooccurrence_count'] = pgm_epv.get(
-                            'cooccurrence_count', 0)
-
-        return comp_list
-
 
 class License:
     """License Analytics Class."""
@@ -194,7 +190,7 @@ class License:
         json_response = {}
         try:
             # Call License service to get license data
-            lic_response = get_session_retry().post(license_url, data=json.dumps(payload))
+            lic_response = get_http_session(license_url).post(license_url, data=json.dumps(payload))
             if lic_response.status_code != 200:
                 lic_response.raise_for_status()  # raise exception for bad http-status codes
             json_response = lic_response.json()
@@ -245,9 +241,16 @@ class License:
     @staticmethod
     def perform_license_analysis(
             packages, filtered_companion_packages,
-            filtered_comp_packages_graph, external_request_id):
-        """Apply License Filters and log the messages."""
-        list_user_stack_comp = extract_user_stack_package_licenses(packages)
+            filtered_comp_packages_graph, external_request_id, package_details=None):
+        """Apply License Filters and log the messages.
+
+        Licenses of user stack are taken from package_details when it is given,
+        otherwise they are fetched from graph.
+        """
+        if package_details is None:
+            list_user_stack_comp = extract_user_stack_package_licenses(packages)
+        else:
+            list_user_stack_comp = get_license_service_request_payload(package_details)
         license_filter_output = License.apply_license_filter(
             list_user_stack_comp,
             filtered_comp_packages_graph)
@@ -325,7 +328,7 @@ class RecommendationTask:
             # TODO remove hardcodedness for payloads with multiple ecosystems
 
             insights_url = RecommendationTask.get_insights_url(payload)
-            response = get_session_retry().post(insights_url, json=payload)
+            response = get_http_session(insights_url).post(insights_url, json=payload)
 
             if response.status_code != 200:
                 logger.error("HTTP error {}. Error retrieving insights data.".format(
@@ -340,13 +343,20 @@ class RecommendationTask:
             logger.error("%s" % e)
             return None
 
-    def execute(self, arguments=None, persist=True, check_license=False):
-        """Execute task."""
+    def execute(self, arguments=None, persist=True, check_license=False,
+                normalized_packages=None, package_details=None):
+        """Execute task.
+
+        normalized_packages and package_details let callers which analyze the same
+        stack share them, package_details is a callable returning details of the
+        user stack packages and is called only when licenses are checked.
+        """
         started_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
         request = RecommenderRequest(**arguments)
         external_request_id = request.external_request_id
 
-        normalized_packages = NormalizedPackages(request.packages, request.ecosystem)
+        if normalized_packages is None:
+            normalized_packages = NormalizedPackages(request.packages, request.ecosystem)
 
         recommendation = {
             'companion': [],
@@ -438,7 +448,8 @@ class RecommendationTask:
                             packages=normalized_packages,
                             filtered_comp_packages_graph=filtered_comp_packages_graph,
                             filtered_companion_packages=filtered_companion_packages,
-                            external_request_id=external_request_id
+                            external_request_id=external_request_id,
+                            package_details=package_details() if package_details else None
                         )
                     logger.info(
                         '%s took %0.2f secs for License.perform_license_analysis()',
@@ -446,13 +457,12 @@ class RecommendationTask:
                 else:
                     lic_filtered_comp_graph = filtered_comp_packages_graph
 
-                # Get Topics Added to Filtered Packages
-                topics_comp_packages_graph = GraphDB(). \
-                    get_topics_for_comp(lic_filtered_comp_graph,
-                                        insights_result.get('companion_packages', []))
-
-                # Create Companion Block
-                comp_packages = create_package_dict(topics_comp_packages_graph)
+                # Create Companion Block, topics and co-occurrence stats are looked
+                # up by package name in insights response
+                companion_index = index_insights_packages(
+                    insights_result.get('companion_packages', []))
+                comp_packages = create_package_dict(lic_filtered_comp_graph,
+                                                    insights_index=companion_index)
                 final_comp_packages = \
                     set_valid_cooccurrence_probability(comp_packages)
 
@@ -6,29 +6,140 @@ by stack-analyses endpoint
 
 import datetime
 import inspect
+import json
 import time
 import logging
 from collections import defaultdict
+from functools import partial
 from urllib.parse import quote
 
-from typing import Dict, List, Tuple, Set
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar, Set
 from f8a_utils.gh_utils import GithubUtils
 
+from src.cache import SingleFlight, TTLCache, get_shared_cache
+from src.ingestion import unknown_package_ingestion
 from src.settings import Settings
 from src.utils import (select_latest_version, server_create_analysis,
-                       persist_data_in_db, post_gremlin, GREMLIN_QUERY_SIZE,
-                       format_date)
+                       persist_data_in_db, post_gremlin, post_gremlin_stream, GREMLIN_QUERY_SIZE,
+                       execute_concurrently, select_latest_worker_result)
 from src.v2.models import (StackAggregatorRequest, GitHubDetails, PackageDetails,
                            VulnerabilityFields,
                            PackageDataWithVulnerabilities,
-                           Package, Audit, Ecosystem,
-                           StackAggregatorResult)
+                           Package, Audit, Ecosystem, Exploit, LicenseAnalysis,
+                           Severity, StackAggregatorResult, UsedByItem,
+                           VulnerableTransitive)
 from src.v2.normalized_packages import NormalizedPackages, GoNormalizedPackages
-from src.v2.license_service import (get_license_analysis_for_stack,
-                                    get_license_service_request_payload)
+from src.v2.license_service import get_license_analysis_for_stack
 
 logger = logging.getLogger(__name__)
 _TRUE = ['true', True, 1, '1']
+Model = TypeVar('Model')
+# (ecosystem, name, version) -> PackageDataWithVulnerabilities
+epv_cache = TTLCache(maxsize=Settings().epv_cache_size, ttl=Settings().epv_cache_ttl,
+                     name='epv')
+# (ecosystem, name, version) of EPVs missing in graph -> True once ingestion is initiated
+unknown_epv_cache = TTLCache(maxsize=Settings().unknown_epv_cache_size,
+                             ttl=Settings().unknown_epv_cache_ttl, name='unknown_epv')
+# coalesces concurrent graph lookups of the same (ecosystem, name, version)
+epv_single_flight = SingleFlight(name='epv')
+# (ecosystem, name, version) -> declared licenses
+epv_license_cache = TTLCache(maxsize=Settings().epv_cache_size, ttl=Settings().epv_cache_ttl,
+                             name='epv_license')
+# NormalizedPackages.canonical_hash -> StackAggregatorResult, dropped by
+# invalidate_stack_result_cache() once graph data change
+stack_result_cache = TTLCache(maxsize=Settings().stack_result_cache_size,
+                              ttl=Settings().stack_result_cache_ttl, name='stack_result')
+
+
+# properties of graph nodes read by _get_package_details(), _get_github_details() and
+# _get_vulnerability_fields(), other properties are not fetched unless
+# GREMLIN_PROJECTION=full
+VERSION_PROPERTIES = ('pecosystem', 'pname', 'version', 'declared_licenses')
+PACKAGE_PROPERTIES = (
+    'latest_version', 'latest_non_cve_version', 'libio_latest_version',
+    'libio_dependents_projects', 'libio_dependents_repos', 'libio_total_releases',
+    'libio_latest_release', 'libio_usedby',
+    'gh_issues_last_month_opened', 'gh_issues_last_month_closed',
+    'gh_issues_last_year_opened', 'gh_issues_last_year_closed',
+    'gh_prs_last_month_opened', 'gh_prs_last_month_closed',
+    'gh_prs_last_year_opened', 'gh_prs_last_year_closed',
+    'gh_stargazers', 'gh_forks', 'gh_open_issues_count', 'gh_contributors_count')
+VULNERABILITY_PROPERTIES = (
+    'snyk_vuln_id', 'snyk_pvt_vulnerability', 'cvss_scores', 'snyk_cve_ids', 'snyk_cvss_v3',
+    'snyk_cwes', 'severity', 'title', 'snyk_url', 'description', 'exploit', 'malicious',
+    'patch_exists', 'fixable', 'fixed_in')
+# empty list of properties makes valueMap() return all of them
+PACKAGE_DETAILS_QUERY = inspect.cleandoc("""
+    epv = [];
+    packages.each {
+        g.V().has('pecosystem', ecosystem).
+        has('pname', it.name).
+        has('version', it.version).as('version', 'vuln').
+        select('version').in('has_version').dedup().as('package').
+        select('package', 'version', 'vuln').
+        by(valueMap(package_properties as String[])).
+        by(valueMap(version_properties as String[])).
+        by(out('has_snyk_cve').valueMap(vulnerability_properties as String[]).fold()).
+        fill(epv);
+    }
+    epv;
+    """)
+# declared licenses of version nodes, without package and vulnerability nodes
+LICENSE_QUERY = inspect.cleandoc("""
+    epv = [];
+    packages.each {
+        g.V().has('pecosystem', ecosystem).
+        has('pname', it.name).
+        has('version', it.version).
+        valueMap('pecosystem', 'pname', 'version', 'declared_licenses').
+        fill(epv);
+    }
+    epv;
+    """)
+
+
+def get_projection_bindings() -> Dict[str, List[str]]:
+    """Get property lists bound to PACKAGE_DETAILS_QUERY, all properties in full mode."""
+    if Settings().gremlin_projection == 'full':
+        return {'package_properties': [], 'version_properties': [],
+                'vulnerability_properties': []}
+    return {'package_properties': list(PACKAGE_PROPERTIES),
+            'version_properties': list(VERSION_PROPERTIES),
+            'vulnerability_properties': list(VULNERABILITY_PROPERTIES)}
+
+
+def invalidate_stack_result_cache(stack_hash: str = None):
+    """Drop cached result of the stack with given canonical hash, all results by default.
+
+    Dropping all results also drops cached EPV details and licenses of this process and
+    the pod wide shared cache, otherwise recomputed results would be built from them.
+    """
+    if stack_hash is not None:
+        stack_result_cache.invalidate(stack_hash)
+        return
+    stack_result_cache.clear()
+    epv_cache.clear()
+    epv_license_cache.clear()
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.clear()
+
+
+def _build_model(model: Type[Model], **values) -> Model:
+    """Create model from values already converted to types of its fields.
+
+    Validation is skipped unless STRICT_MODEL_VALIDATION is set, values are
+    shaped by the aggregator from graph data and validating them again is
+    a large part of the time spent on big stacks.
+    """
+    if Settings().strict_model_validation:
+        return model(**values)
+    return model.construct(**values)
+
+
+def _str_or_none(value: Any) -> Optional[str]:
+    """Convert graph property value to str the way optional str fields are validated."""
+    return None if value is None else str(value)
 
 
 def _is_private_vulnerability(vulnerability_node):
@@ -38,17 +149,18 @@ def _is_private_vulnerability(vulnerability_node):
 
 def _get_vulnerability_fields(vuln_node: Dict[str, str]):
     """Get fields associated with vulnerability."""
+    exploit = vuln_node.get('exploit')[0]
     return {
         'id': vuln_node.get('snyk_vuln_id')[0],
-        'cvss': vuln_node.get('cvss_scores', [''])[0],
+        'cvss': float(vuln_node.get('cvss_scores', [''])[0]),
         'cve_ids': vuln_node.get('snyk_cve_ids', []),
         'cvss_v3': vuln_node.get('snyk_cvss_v3')[0],
         'cwes': vuln_node.get('snyk_cwes'),
-        'severity': vuln_node.get('severity')[0],
+        'severity': Severity(vuln_node.get('severity')[0]),
         'title': vuln_node.get('title')[0],
         'url': vuln_node.get('snyk_url')[0],
         'description': vuln_node.get('description')[0],
-        'exploit': vuln_node.get('exploit')[0],
+        'exploit': None if exploit is None else Exploit(exploit),
         'malicious': vuln_node.get('malicious', [''])[0] in _TRUE,
         'patch_exists': vuln_node.get('patch_exists', [''])[0] in _TRUE,
         'fixable': vuln_node.get('fixable', [''])[0] in _TRUE,
@@ -58,12 +170,11 @@ def _get_vulnerability_fields(vuln_node: Dict[str, str]):
 
 def _get_github_details(package_node) -> GitHubDetails:
     """Get fields associated with Github statistics of a package node."""
-    date = format_date(package_node.get("gh_refreshed_on", ["N/A"])[0])
     github_details = {
         "dependent_projects":
-            package_node.get("libio_dependents_projects", [-1])[0],
-        "dependent_repos": package_node.get("libio_dependents_repos", [-1])[0],
-        "total_releases": package_node.get("libio_total_releases", [-1])[0],
+            _str_or_none(package_node.get("libio_dependents_projects", [-1])[0]),
+        "dependent_repos": _str_or_none(package_node.get("libio_dependents_repos", [-1])[0]),
+        "total_releases": _str_or_none(package_node.get("libio_total_releases", [-1])[0]),
         "latest_release_duration":
             str(datetime.datetime.fromtimestamp(package_node.get(
                 "libio_latest_release", [1496302486.0])[0])),
@@ -84,24 +195,19 @@ def _get_github_details(package_node) -> GitHubDetails:
                 "opened": package_node.get("gh_prs_last_year_opened", [-1])[0],
                 "closed": package_node.get("gh_prs_last_year_closed", [-1])[0]
             }},
-        "stargazers_count": package_node.get("gh_stargazers", [-1])[0],
-        "forks_count": package_node.get("gh_forks", [-1])[0],
-        "refreshed_on": date,
-        "open_issues_count": package_node.get("gh_open_issues_count", [-1])[0],
-        "contributors": package_node.get("gh_contributors_count", [-1])[0],
+        "stargazers_count": _str_or_none(package_node.get("gh_stargazers", [-1])[0]),
+        "forks_count": _str_or_none(package_node.get("gh_forks", [-1])[0]),
+        "open_issues_count": _str_or_none(package_node.get("gh_open_issues_count", [-1])[0]),
+        "contributors": _str_or_none(package_node.get("gh_contributors_count", [-1])[0]),
         "size": "N/A"
     }
     used_by = package_node.get("libio_usedby", [])
     used_by_list = []
     for epvs in used_by:
         slc = epvs.split(':')
-        used_by_dict = {
-            'name': slc[0],
-            'stars': int(slc[1])
-        }
-        used_by_list.append(used_by_dict)
+        used_by_list.append(_build_model(UsedByItem, name=slc[0], stars=str(int(slc[1]))))
     github_details['used_by'] = used_by_list
-    return GitHubDetails(**github_details)
+    return _build_model(GitHubDetails, **github_details)
 
 
 def _get_pkg_from_graph_version_node(version_node) -> Tuple[Ecosystem, Package]:
@@ -112,12 +218,63 @@ def _get_pkg_from_graph_version_node(version_node) -> Tuple[Ecosystem, Package]:
     return ecosystem, Package(name=name, version=version)
 
 
+def get_package_licenses(ecosystem: str,
+                         packages: Tuple[Package]) -> Dict[Package, List[str]]:
+    """Get declared licenses of the given packages, packages missing in graph are left out.
+
+    Licenses are read from cached package details when available, otherwise
+    only the license properties of version nodes are fetched from graph.
+    """
+    licenses: Dict[Package, List[str]] = {}
+    missing: List[Package] = []
+    for pkg in packages:
+        epv = (ecosystem, pkg.name, pkg.version)
+        pkg_details = epv_cache.get(epv)
+        if pkg_details is not None:
+            pkg_licenses = pkg_details.licenses or []
+        else:
+            pkg_licenses = epv_license_cache.get(epv)
+        if pkg_licenses is None:
+            missing.append(pkg)
+        else:
+            licenses[pkg] = pkg_licenses
+
+    shared_cache = get_shared_cache()
+    if shared_cache and missing:
+        shared = shared_cache.get_many(
+            [_shared_cache_key(ecosystem, pkg, kind='epv_license') for pkg in missing])
+        for (_, _, name, version), payload in shared.items():
+            pkg = Package(name=name, version=version)
+            licenses[pkg] = json.loads(payload)
+            epv_license_cache.put((ecosystem, name, version), licenses[pkg])
+        missing = [pkg for pkg in missing if pkg not in licenses]
+
+    if not missing:
+        return licenses
+    tasks = [partial(post_gremlin, LICENSE_QUERY,
+                     {'ecosystem': ecosystem,
+                      'packages': [pkg.dict(exclude={'dependencies'}) for pkg in batch]})
+             for batch in _get_packages_in_batch(missing, GREMLIN_QUERY_SIZE)]
+    fetched = {}
+    for result in execute_concurrently(tasks, Settings().gremlin_batch_concurrency,
+                                       name='gremlin'):
+        for version_node in (result or {}).get('result', {}).get('data', []):
+            _, pkg = _get_pkg_from_graph_version_node(version_node)
+            licenses[pkg] = version_node.get('declared_licenses', [])
+            epv_license_cache.put((ecosystem, pkg.name, pkg.version), licenses[pkg])
+            fetched[_shared_cache_key(ecosystem, pkg, kind='epv_license')] = json.dumps(
+                licenses[pkg])
+    if shared_cache and fetched:
+        shared_cache.put_many(fetched)
+    return licenses
+
+
 # (fixme): This should be moved to v2/recommender
 def extract_user_stack_package_licenses(packages: NormalizedPackages):
-    """Extract user stack package licenses."""
-    normalized_package_details = (Aggregator(normalized_packages=packages).
-                                  get_package_details_from_graph(packages))
-    return get_license_service_request_payload(normalized_package_details)
+    """Extract licenses of direct dependencies of user stack as license service payload."""
+    licenses = get_package_licenses(packages.ecosystem, packages.direct_dependencies)
+    return [{'package': pkg.name, 'version': pkg.version, 'licenses': pkg_licenses}
+            for pkg, pkg_licenses in licenses.items()]
 
 
 def _get_packages_in_batch(dependencies: Tuple[Package], size: int) -> Tuple[Package]:
@@ -126,15 +283,20 @@ def _get_packages_in_batch(dependencies: Tuple[Package], size: int) -> Tuple[Pac
         yield dependencies[i:i + size]
 
 
+def _shared_cache_key(ecosystem: str, pkg: Package,
+                      kind: str = 'epv') -> Tuple[str, str, str, str]:
+    return kind, ecosystem, pkg.name, pkg.version
+
+
 def _has_vulnerability(pkg: PackageDetails) -> bool:
     return pkg and (pkg.public_vulnerabilities or pkg.private_vulnerabilities)
 
 
 # (fixme) link to snyk package should be identified during ingestion.
-def _get_snyk_package_link(ecosystem: str, package: str) -> str:
-    ecosystem = Settings().snyk_ecosystem_map.get(ecosystem, ecosystem)
-    return Settings().snyk_package_url_format.format(ecosystem=ecosystem,
-                                                     package=quote(package, safe=''))
+def _get_snyk_package_link(ecosystem: str, package: str, settings: Settings) -> str:
+    ecosystem = settings.snyk_ecosystem_map.get(ecosystem, ecosystem)
+    return settings.snyk_package_url_format.format(ecosystem=ecosystem,
+                                                   package=quote(package, safe=''))
 
 
 class Aggregator:
@@ -146,18 +308,110 @@ class Aggregator:
         """Initialize common fields."""
         self._request = request
         self._normalized_packages = normalized_packages
+        # read once, Settings() parses environment on every call
+        self._settings = Settings()
         self._normalized_package_details = None
         self._result = None
+        # package details of previous analysis of the same manifest, see fetch_details()
+        self._previous_package_details: Dict[Package, PackageDataWithVulnerabilities] = {}
 
     def get_package_details_from_graph(self) -> Dict[Package, PackageDetails]:
-        """Get dependency data from graph."""
-        graph_response = self._get_package_details_with_vulnerabilities()
-        package_details: List[Tuple[Package, PackageDetails]] = []
-        for pkg in graph_response:
-            package_details.append(self._get_package_details(pkg))
+        """Get dependency data from graph, details of previous analysis are reused.
+
+        Previous result holds details of direct and vulnerable transitive dependencies
+        only. Other transitives, known or not, and previously unknown packages are
+        treated as changed, they are looked up again so that unknown ones are ingested.
+        """
+        packages = self._normalized_packages.all_dependencies
+        if not self._previous_package_details:
+            return self._get_cached_package_details(packages)
+
+        reused = {}
+        changed = []
+        for pkg in packages:
+            if pkg in self._previous_package_details:
+                reused[pkg] = self._previous_package_details[pkg]
+            else:
+                changed.append(pkg)
+        logger.info('%s incremental analysis reuses %d packages, fetches %d packages',
+                    self._request.external_request_id, len(reused), len(changed))
+        package_details = self._get_cached_package_details(changed)
+        package_details.update(reused)
+        return package_details
 
-        # covert list of (pkg, package_details) into map
-        return dict(package_details)
+    def _get_cached_package_details(
+            self, packages: Tuple[Package]) -> Dict[Package, PackageDetails]:
+        """Get package details from caches, only cache misses are fetched from graph.
+
+        Lookup goes through in-process epv_cache first, then through the optional
+        pod wide shared cache.
+        """
+        ecosystem = self._normalized_packages.ecosystem
+        package_details: Dict[Package, PackageDetails] = {}
+        missing: List[Package] = []
+        for pkg in packages:
+            pkg_details = epv_cache.get((ecosystem, pkg.name, pkg.version))
+            if pkg_details is None:
+                missing.append(pkg)
+            else:
+                package_details[pkg] = pkg_details
+
+        # recently seen unknowns are not looked up in graph again
+        missing = [pkg for pkg in missing
+                   if unknown_epv_cache.get((ecosystem, pkg.name, pkg.version)) is None]
+
+        shared_cache = get_shared_cache()
+        if shared_cache and missing:
+            shared = shared_cache.get_many([_shared_cache_key(ecosystem, pkg) for pkg in missing])
+            for key, payload in shared.items():
+                pkg_details = PackageDataWithVulnerabilities.parse_raw(payload)
+                pkg = Package(name=pkg_details.name, version=pkg_details.version)
+                epv_cache.put((ecosystem, pkg.name, pkg.version), pkg_details)
+                package_details[pkg] = pkg_details
+            missing = [pkg for pkg in missing if pkg not in package_details]
+
+        if missing:
+            fetched = epv_single_flight.fetch_many(
+                [(ecosystem, pkg.name, pkg.version) for pkg in missing],
+                self._fetch_package_details)
+            for pkg in missing:
+                pkg_details = fetched.get((ecosystem, pkg.name, pkg.version))
+                if pkg_details is not None:
+                    package_details[pkg] = pkg_details
+
+        logger.info('%s epv cache misses %d out of %d; cache stats %s; single flight stats %s',
+                    self._request.external_request_id, len(missing), len(packages),
+                    epv_cache.stats(), epv_single_flight.stats())
+        return package_details
+
+    def _fetch_package_details(
+            self, epvs: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], PackageDetails]:
+        """Fetch package details of the given EPVs from graph and store them into caches.
+
+        EPVs missing in graph are left out of result and recorded in unknown_epv_cache.
+        """
+        ecosystem = self._normalized_packages.ecosystem
+        shared_cache = get_shared_cache()
+        packages = [Package(name=name, version=version) for _, name, version in epvs]
+        package_details = {}
+        fetched = {}
+        if Settings().gremlin_streaming:
+            details = self._stream_package_details(packages)
+        else:
+            details = map(self._get_package_details,
+                          self._get_package_details_with_vulnerabilities(packages))
+        for pkg, pkg_details in details:
+            epv = (ecosystem, pkg.name, pkg.version)
+            package_details[epv] = pkg_details
+            epv_cache.put(epv, pkg_details)
+            if shared_cache:
+                fetched[_shared_cache_key(ecosystem, pkg)] = pkg_details.json()
+        if shared_cache:
+            shared_cache.put_many(fetched)
+        for epv in epvs:
+            if epv not in package_details:
+                unknown_epv_cache.put(epv, False)
+        return package_details
 
     def _get_vulnerabilities(self, vulnerability_nodes):
         """Get list of vulnerabilities associated with a package."""
@@ -165,9 +419,11 @@ class Aggregator:
         private_vulns = []
         for vuln in vulnerability_nodes:
             if _is_private_vulnerability(vuln):
-                private_vulns.append(VulnerabilityFields(**_get_vulnerability_fields(vuln)))
+                private_vulns.append(
+                    _build_model(VulnerabilityFields, **_get_vulnerability_fields(vuln)))
             else:
-                public_vulns.append(VulnerabilityFields(**_get_vulnerability_fields(vuln)))
+                public_vulns.append(
+                    _build_model(VulnerabilityFields, **_get_vulnerability_fields(vuln)))
         return public_vulns, private_vulns
 
     def _get_package_details(self, component):
@@ -186,88 +442,141 @@ class Aggregator:
             pkg_node.get("latest_version", [""])[0],
             pkg.name
         )
-        return pkg, PackageDataWithVulnerabilities(**pkg.dict(), ecosystem=ecosystem,
-                                                   latest_version=latest_version,
-                                                   github=github_details, licenses=licenses,
-                                                   # (fixme) this is incorrect
-                                                   url=_get_snyk_package_link(ecosystem,
-                                                                              pkg.name),
-                                                   private_vulnerabilities=private_vulns,
-                                                   public_vulnerabilities=public_vulns,
-                                                   recommended_version=recommended_latest_version)
-
-    def _get_package_details_with_vulnerabilities(self) -> List[Dict[str, object]]:
+        return pkg, _build_model(PackageDataWithVulnerabilities,
+                                 name=pkg.name, version=pkg.version,
+                                 ecosystem=Ecosystem(ecosystem),
+                                 latest_version=latest_version,
+                                 github=github_details, licenses=licenses,
+                                 # (fixme) this is incorrect
+                                 url=_get_snyk_package_link(ecosystem, pkg.name, self._settings),
+                                 private_vulnerabilities=private_vulns,
+                                 public_vulnerabilities=public_vulns,
+                                 recommended_version=recommended_latest_version)
+
+    def _get_package_details_with_vulnerabilities(
+            self, packages: List[Package] = None) -> List[Dict[str, object]]:
         """Get package data from graph along with vulnerability."""
+        if packages is None:
+            packages = self._normalized_packages.all_dependencies
         time_start = time.time()
         pkgs_with_vuln = {
             "result": {
                 "data": []
             }
         }
-        query = """
-                epv = [];
-                packages.each {
-                    g.V().has('pecosystem', ecosystem).
-                    has('pname', it.name).
-                    has('version', it.version).as('version', 'vuln').
-                    select('version').in('has_version').dedup().as('package').
-                    select('package', 'version', 'vuln').
-                    by(valueMap()).
-                    by(valueMap()).
-                    by(out('has_snyk_cve').valueMap().fold()).
-                    fill(epv);
-                }
-                epv;
-                """
-        # get rid of leading white spaces
-        query = inspect.cleandoc(query)
-        bindings = {
-            'ecosystem': self._normalized_packages.ecosystem,
-            'packages': []
-        }
-        # call gremlin in batches of GREMLIN_QUERY_SIZE
-        for pkgs in _get_packages_in_batch(self._normalized_packages.all_dependencies,
-                                           GREMLIN_QUERY_SIZE):
-            # convert Tuple[Package] into List[{name:.., version:..}]
-            bindings['packages'] = [pkg.dict(exclude={'dependencies'}) for pkg in pkgs]
-
-            started_at = time.time()
-
-            result = post_gremlin(query, bindings)
-
-            logger.info(
-                '%s took %0.2f secs for post_gremlin() batch request',
-                self._request.external_request_id, time.time() - started_at)
-            if result:
-                pkgs_with_vuln['result']['data'] += result['result']['data']
+        # convert Tuple[Package] into List[{name:.., version:..}]
+        packages = [pkg.dict(exclude={'dependencies'}) for pkg in packages]
+        pkgs_with_vuln['result']['data'] = self._post_gremlin_in_batches(
+            PACKAGE_DETAILS_QUERY, packages, get_projection_bindings())
 
         logger.info('%s took %0.2f secs for get_package_details_with_'
                     'vulnerabilities() for total_results %d', self._request.external_request_id,
                     time.time() - time_start, len(pkgs_with_vuln['result']['data']))
         return pkgs_with_vuln['result']['data']
 
-    def _get_denormalized_package_details(self) -> List[PackageDetails]:
-        """Pack PackageDetails according to it's dependency graph structure."""
+    def _stream_package_details(
+            self, packages: List[Package]) -> List[Tuple[Package, PackageDetails]]:
+        """Get package details from graph, built while graph responses are read."""
+        packages = [pkg.dict(exclude={'dependencies'}) for pkg in packages]
+        return self._post_gremlin_in_batches(
+            PACKAGE_DETAILS_QUERY, packages, get_projection_bindings(),
+            handle_items=lambda components: [self._get_package_details(component)
+                                             for component in components])
+
+    def _post_gremlin_batch(self, query: str, bindings: Dict,
+                            handle_items: Callable[[Iterable[Dict]], List] = None) -> List:
+        """Post a single batch to gremlin and return handle_items() of its result data.
+
+        With GREMLIN_STREAMING result data items are passed to handle_items while
+        the response is read, so raw items of the batch are never held at once.
+        """
+        started_at = time.time()
+        handle_items = handle_items or list
+        if Settings().gremlin_streaming:
+            data = handle_items(post_gremlin_stream(query, bindings))
+        else:
+            result = post_gremlin(query, bindings)
+            data = handle_items(result['result']['data'] if result else [])
+        logger.info(
+            '%s took %0.2f secs for post_gremlin() batch request of %d packages',
+            self._request.external_request_id, time.time() - started_at,
+            len(bindings['packages']))
+        return data
+
+    def _post_gremlin_in_batches(self, query: str, packages, bindings: Dict = None,
+                                 handle_items: Callable[[Iterable[Dict]], List] = None
+                                 ) -> List:
+        """Call gremlin concurrently in batches of GREMLIN_QUERY_SIZE.
+
+        Batch results are merged in the order of batches irrespective of
+        the order in which they complete. Given bindings are passed to every batch,
+        result data of every batch is passed through handle_items when given.
+        """
+        # get rid of leading white spaces
+        query = inspect.cleandoc(query)
+        ecosystem = self._normalized_packages.ecosystem
+        tasks = [partial(self._post_gremlin_batch, query,
+                         dict(bindings or {}, ecosystem=ecosystem, packages=list(pkgs)),
+                         handle_items)
+                 for pkgs in _get_packages_in_batch(packages, GREMLIN_QUERY_SIZE)]
+        results = execute_concurrently(tasks, Settings().gremlin_batch_concurrency,
+                                       name='gremlin')
+        return [data for result in results for data in result]
+
+    def _get_denormalized_package_details(
+            self, shared_transitives: bool = False) -> List[PackageDetails]:
+        """Pack PackageDetails according to it's dependency graph structure.
+
+        Details of vulnerable transitives are referenced by every dependent, not
+        copied, they must not be modified. With shared_transitives they are left
+        out, see _get_vulnerable_transitives().
+        """
         package_details = []
         for package, transitives in self._normalized_packages.dependency_graph.items():
             package_detail = self._normalized_package_details.get(package)
-            if package_detail:
-                package_detail = package_detail.copy()
-            else:
+            if not package_detail:
                 continue  # pragma: no cover
-            transitive_details = []
-            for transitive in transitives:
-                transitive_detail = self._normalized_package_details.get(transitive)
-                if _has_vulnerability(transitive_detail):
-                    transitive_detail = transitive_detail.copy()
-                else:
-                    continue  # pragma: no cover
-                transitive_details.append(transitive_detail)
+            # details are cached across stacks, fields are set on a shallow copy only
+            package_detail = package_detail.copy()
             package_detail.dependencies = list(transitives)
-            package_detail.vulnerable_dependencies = transitive_details
+            if not shared_transitives:
+                package_detail.vulnerable_dependencies = [
+                    self._normalized_package_details[transitive] for transitive in transitives
+                    if _has_vulnerability(self._normalized_package_details.get(transitive))]
             package_details.append(package_detail)
         return package_details
 
+    def _get_vulnerable_transitives(self) -> List[VulnerableTransitive]:
+        """Get each vulnerable transitive once, with direct dependencies depending on it."""
+        dependents: Dict[Package, List[Package]] = defaultdict(list)
+        for package, transitives in self._normalized_packages.dependency_graph.items():
+            if package not in self._normalized_package_details:
+                continue  # pragma: no cover
+            for transitive in transitives:
+                dependents[transitive].append(package)
+        vulnerable_transitives = []
+        for transitive, packages in dependents.items():
+            transitive_detail = self._normalized_package_details.get(transitive)
+            if _has_vulnerability(transitive_detail):
+                vulnerable_transitives.append(_build_model(
+                    VulnerableTransitive, **dict(transitive_detail), dependents=packages))
+        return vulnerable_transitives
+
+    @property
+    def normalized_packages(self) -> NormalizedPackages:
+        """Packages of the request without duplicates."""
+        return self._normalized_packages
+
+    def get_direct_package_details(self) -> List[PackageDetails]:
+        """Get details of known direct dependencies, available once details are fetched."""
+        if self._result is not None:
+            return list(self._result.analyzed_dependencies or [])
+        if self._normalized_package_details is None:
+            return []
+        return [self._normalized_package_details[pkg]
+                for pkg in self._normalized_packages.direct_dependencies
+                if pkg in self._normalized_package_details]
+
     def get_all_unknown_packages(self) -> Set[Package]:
         """Get list of all unknowns from the normalized_package_details."""
         all_dependencies = set(self._normalized_packages.all_dependencies)
@@ -280,14 +589,70 @@ class Aggregator:
         analyzed_dependencies = set(self._normalized_package_details.keys())
         return all_dependencies.difference(analyzed_dependencies)
 
-    def fetch_details(self):
-        """Fetch package & vulnerability info from graph."""
+    def fetch_details(self, incremental: bool = False):
+        """Fetch package & vulnerability info from graph, unless the stack result is cached.
+
+        In incremental mode only packages added or changed since the previous analysis
+        of the same manifest are fetched.
+        """
+        self._result = stack_result_cache.get(self._normalized_packages.canonical_hash)
+        if self._result is not None:
+            logger.info('%s stack result served from cache; cache stats %s',
+                        self._request.external_request_id, stack_result_cache.stats())
+            return
+        if incremental:
+            self._load_previous_result()
         self._normalized_package_details = self.get_package_details_from_graph()
 
+    def _load_previous_result(self):
+        """Load package details from the previous analysis of the same manifest."""
+        if not self._request.uuid:
+            # manifest paths are not unique across users, results are never shared
+            logger.info('%s incremental analysis needs uuid, running full analysis',
+                        self._request.external_request_id)
+            return
+        task_result = select_latest_worker_result(
+            'stack_aggregator_v2', ecosystem=self._normalized_packages.ecosystem,
+            manifest_file_path=self._request.manifest_file_path, uuid=self._request.uuid,
+            max_age=Settings().incremental_result_max_age)
+        if not task_result:
+            logger.info('%s no previous result, running full analysis',
+                        self._request.external_request_id)
+            return
+        try:
+            # vulnerable transitives are listed under each of their direct dependencies,
+            # or once in vulnerable_transitives, depending on transitive layout
+            for transitive in task_result.get('vulnerable_transitives') or []:
+                details = PackageDataWithVulnerabilities(**transitive)
+                pkg = Package(name=details.name, version=details.version)
+                self._previous_package_details[pkg] = details
+            for direct in task_result.get('analyzed_dependencies') or []:
+                details = PackageDataWithVulnerabilities(**direct)
+                for transitive in details.vulnerable_dependencies or []:
+                    pkg = Package(name=transitive.name, version=transitive.version)
+                    self._previous_package_details[pkg] = transitive.copy(
+                        update={'dependencies': None, 'vulnerable_dependencies': None})
+                pkg = Package(name=details.name, version=details.version)
+                self._previous_package_details[pkg] = details.copy(
+                    update={'dependencies': None, 'vulnerable_dependencies': None})
+        except (ValueError, TypeError) as e:
+            logger.error('%s can not reuse previous result, running full analysis: %r',
+                         self._request.external_request_id, e)
+            self._previous_package_details = {}
+
     def get_result(self) -> StackAggregatorResult:
         """Aggregate stack data."""
+        if self._result is not None:
+            # cached result of the same stack, only request specific fields differ
+            request_fields = self._request.dict(
+                include=set(StackAggregatorResult.__fields__), exclude={'packages'})
+            return self._result.copy(update=request_fields)
+
         # denormalize package details according to request.dependencies relations
-        package_details = self._get_denormalized_package_details()
+        shared_transitives = self._settings.transitive_layout == 'shared'
+        package_details = self._get_denormalized_package_details(shared_transitives)
+        vulnerable_transitives = (self._get_vulnerable_transitives()
+                                  if shared_transitives else None)
         unknown_dependencies = self._get_direct_unknown_packages()
         started_at = time.time()
 
@@ -296,57 +661,92 @@ class Aggregator:
         logger.info(
             '%s took %0.2f secs for get_license_analysis_for_stack()',
             self._request.external_request_id, time.time() - started_at)
-        return StackAggregatorResult(**self._request.dict(exclude={'packages'}),
-                                     analyzed_dependencies=package_details,
-                                     unknown_dependencies=unknown_dependencies,
-                                     license_analysis=license_analysis,
-                                     registration_link=Settings().snyk_signin_url)
+        request_fields = self._request.dict(
+            include=set(StackAggregatorResult.__fields__), exclude={'packages'})
+        result = _build_model(StackAggregatorResult, **request_fields,
+                              analyzed_dependencies=package_details,
+                              vulnerable_transitives=vulnerable_transitives,
+                              unknown_dependencies=list(unknown_dependencies),
+                              license_analysis=license_analysis,
+                              registration_link=Settings().snyk_signin_url)
+        if license_analysis is None or license_analysis == LicenseAnalysis():
+            # license service failed, don't serve the incomplete result to repeated stacks
+            logger.info('%s result is not cached, license analysis is missing',
+                        self._request.external_request_id)
+        else:
+            stack_result_cache.put(self._normalized_packages.canonical_hash, result)
+        return result
 
     def initiate_unknown_package_ingestion(self):
         """Ingestion of Unknown dependencies."""
+        if self._result is not None:
+            # ingestion was initiated when the cached result was computed
+            return
         if Settings().disable_unknown_package_flow:
             logger.warning('Skipping unknown flow %s', self.get_all_unknown_packages())
             return
 
         ecosystem = self._normalized_packages.ecosystem
-        try:
-            for dep in self.get_all_unknown_packages():
-                server_create_analysis(ecosystem, dep.name, dep.version, api_flow=True,
-                                       force=False, force_graph_sync=True)
-        except Exception as e:  # pylint:disable=W0703,C0103
-            logger.error('Ingestion failed for {%s, %s, %s}',
-                         ecosystem, dep.name, dep.version)
-            logger.error(e)
+        epvs = []
+        for dep in self.get_all_unknown_packages():
+            key = (ecosystem, dep.name, dep.version)
+            if unknown_epv_cache.get(key):
+                logger.debug('Ingestion already initiated for %s', key)
+                continue
+            epvs.append(key)
+
+        queued = unknown_package_ingestion.submit(
+            epvs, partial(server_create_analysis, api_flow=True, force=False,
+                          force_graph_sync=True))
+        # dropped EPVs are retried by the next request which finds them unknown
+        for key in queued:
+            unknown_epv_cache.put(key, True)
+        logger.info('%s queued %d unknown packages for ingestion',
+                    self._request.external_request_id, len(queued))
 
 
 class StackAggregator:
     """Aggregate stack data from components."""
 
     @staticmethod
-    def process_request(request: Dict) -> Aggregator:
-        """Task code."""
-        request = StackAggregatorRequest(**request)
-
+    def create_aggregator(request: StackAggregatorRequest) -> Aggregator:
+        """Normalize packages of the request and create aggregator of its ecosystem."""
         # Always generate registered user report for the given stack, API server
         # shall filter the report fields based on registration status.
         # This will avoid analysis of stack upon user registration.
         if request.ecosystem == 'golang':
             normalized_packages = GoNormalizedPackages(request.packages, request.ecosystem)
-            aggregator = GoAggregator(request, normalized_packages)
-        else:
-            normalized_packages = NormalizedPackages(request.packages, request.ecosystem)
-            aggregator = Aggregator(request, normalized_packages)
-        aggregator.fetch_details()
-        return aggregator
+            return GoAggregator(request, normalized_packages)
+        normalized_packages = NormalizedPackages(request.packages, request.ecosystem)
+        return Aggregator(request, normalized_packages)
 
     @staticmethod
-    def execute(request: Dict, persist=True):
+    def process_request(request: Dict, incremental: bool = False) -> Aggregator:
         """Task code."""
+        aggregator = StackAggregator.create_aggregator(StackAggregatorRequest(**request))
+        aggregator.fetch_details(incremental=incremental)
+        return aggregator
+
+    @staticmethod
+    def execute(request: Dict, persist=True, incremental=False):
+        """Task code.
+
+        With incremental=True details of packages unchanged since the previous
+        analysis of the same manifest are reused instead of fetched from graph.
+        """
         # (fixme): Use timestamp instead of str representation.
         started_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
-        aggregator = StackAggregator.process_request(request)
+        aggregator = StackAggregator.process_request(request, incremental=incremental)
+        return StackAggregator.complete(aggregator, started_at, persist=persist)
+
+    @staticmethod
+    def complete(aggregator: Aggregator, started_at: str, persist=True):
+        """Create result of aggregator with fetched details, persist it and ingest unknowns."""
         output = aggregator.get_result()
-        output_dict = output.dict()
+        # vulnerable_transitives is set in shared transitive layout only, responses of
+        # the default layout keep their shape
+        output_dict = output.dict(exclude=None if output.vulnerable_transitives is not None
+                                  else {'vulnerable_transitives'})
         ended_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
         # (fixme): Remove _ to make it as part of pydantic model.
         output_dict["_audit"] = Audit(started_at=started_at, ended_at=ended_at,
@@ -381,50 +781,42 @@ class GoAggregator(Aggregator):
 
     def initiate_unknown_package_ingestion(self):
         """Ingestion of Unknown dependencies."""
+        if self._result is not None:
+            return
         if Settings().disable_unknown_package_flow:
             logger.warning('Skipping unknown flow %s', self.get_all_unknown_packages())
             return
         logger.error('Ingestion is Not active for Golang.')
 
-    def _get_package_details_with_vulnerabilities(self) -> List[Dict[str, object]]:
+    def _load_previous_result(self):
+        """Pseudo versions need module level lookup, incremental analysis is not supported."""
+        logger.info('%s incremental analysis is not supported for golang',
+                    self._request.external_request_id)
+
+    def _get_package_details_with_vulnerabilities(
+            self, packages: List[Package] = None) -> List[Dict[str, object]]:
         """Get package data from graph along with vulnerability."""
-        get_package_details_with_vul_query = """
-                epv = [];
-                packages.each {
-                    g.V().has('pecosystem', ecosystem).
-                    has('pname', it.name).
-                    has('version', it.version).as('version', 'vuln').
-                    select('version').in('has_version').dedup().as('package').
-                    select('package', 'version', 'vuln').
-                    by(valueMap()).
-                    by(valueMap()).
-                    by(out('has_snyk_cve').valueMap().fold()).
-                    fill(epv);
-                }
-                epv;
-                """
-        packages = self._normalized_packages.all_deps_without_pseudo
+        if packages is None:
+            packages = self._normalized_packages.all_deps_without_pseudo
         packages = [pkg.dict(exclude={'dependencies'}) for pkg in packages]
         data = self._get_data_from_graph(
-            packages, get_package_details_with_vul_query, '_get_pkg_details_with_vuls')
+            packages, PACKAGE_DETAILS_QUERY, '_get_pkg_details_with_vuls',
+            bindings=get_projection_bindings())
         return data['result']['data']
 
     def get_package_details_from_graph(self) -> Dict[Package, PackageDetails]:
         """Get dependency data from graph."""
-        graph_response = self._get_package_details_with_vulnerabilities()
-        package_details: List[Tuple[Package, PackageDetails]] = []
-        for pkg in graph_response:
-            package_details.append(self._get_package_details(pkg))
+        package_details = self._get_cached_package_details(
+            self._normalized_packages.all_deps_without_pseudo)
 
         psedo_pkgs_data = self._get_package_details_from_graph_for_pseudo_versions()
         for pseudo_pkg in psedo_pkgs_data:
-            pseudo_pkg_details = self._get_golang_package_details(pseudo_pkg)
-            package_details.append(pseudo_pkg_details)
+            pkg, pkg_details = self._get_golang_package_details(pseudo_pkg)
+            package_details[pkg] = pkg_details
 
-        # covert list of (pkg, package_details) into map
-        return dict(package_details)
+        return package_details
 
-    def _get_data_from_graph(self, packages, query, caller=None) -> Dict:
+    def _get_data_from_graph(self, packages, query, caller=None, bindings=None) -> Dict:
         """Get package data from graph along with vulnerability."""
         logger.info('Executing _get_data_from_db.')
         time_start = time.time()
@@ -433,22 +825,8 @@ class GoAggregator(Aggregator):
                 "data": []
             }
         }
-        # get rid of leading white spaces
-        query = inspect.cleandoc(query)
-        bindings = {
-            'ecosystem': self._normalized_packages.ecosystem,
-            'packages': []
-        }
-        # call gremlin in batches of GREMLIN_QUERY_SIZE
-        for packages in _get_packages_in_batch(packages, GREMLIN_QUERY_SIZE):
-            bindings['packages'] = list(packages)
-            started_at = time.time()
-            result = post_gremlin(query, bindings)
-            logger.info(
-                '%s took %0.2f secs for post_gremlin() batch request',
-                self._request.external_request_id, time.time() - started_at)
-            if result:
-                pkgs_with_vuln['result']['data'] += result['result']['data']
+        pkgs_with_vuln['result']['data'] = self._post_gremlin_in_batches(
+            query, packages, bindings)
 
         logger.info('%s took %0.2f secs for %s'
                     'for total_results %d', self._request.external_request_id,
@@ -483,13 +861,14 @@ class GoAggregator(Aggregator):
         public_vulns, private_vulns = self._get_vulnerabilities(
             self.filtered_vul.get(pkg_name, []))
         recommended_latest_version = pkg_node.get("latest_non_cve_version", [""])[0]
-        pkg_details = PackageDataWithVulnerabilities(
-            **pkg.dict(),
-            ecosystem=ecosystem,
+        pkg_details = _build_model(
+            PackageDataWithVulnerabilities,
+            name=pkg.name, version=pkg.version,
+            ecosystem=Ecosystem(ecosystem),
             latest_version=latest_version,
-            github={},
+            github=_build_model(GitHubDetails),
             licenses=[],
-            url=_get_snyk_package_link(ecosystem, pkg_name),
+            url=_get_snyk_package_link(ecosystem, pkg_name, self._settings),
             private_vulnerabilities=private_vulns,
             public_vulnerabilities=public_vulns,
             recommended_version=recommended_latest_version)
@@ -510,13 +889,22 @@ class GoAggregator(Aggregator):
                         .valueMap()
                         """
         started_at = time.time()
-        # 1. Get All Vulnerabilities attached to Module
-        module_vulnerabilities = self._get_data_from_graph(
-            self._normalized_packages.modules, get_modules_query, 'module_vulnerabilities')
-        module_vulnerabilities = module_vulnerabilities['result']['data']
+        if Settings().gremlin_streaming:
+            # 1. & 2. vulnerabilities out of range are dropped while responses are read
+            self.filtered_vul = defaultdict(list)
+            for package_name, vulnerabilities in self._post_gremlin_in_batches(
+                    get_modules_query, self._normalized_packages.modules,
+                    handle_items=lambda vulns: list(
+                        self._filter_vulnerable_packages(vulns).items())):
+                self.filtered_vul[package_name].extend(vulnerabilities)
+        else:
+            # 1. Get All Vulnerabilities attached to Module
+            module_vulnerabilities = self._get_data_from_graph(
+                self._normalized_packages.modules, get_modules_query, 'module_vulnerabilities')
+            module_vulnerabilities = module_vulnerabilities['result']['data']
 
-        # 2. Filter out all Vulnerabilities where commit sha is out of Vulnerability range.
-        self.filtered_vul = self._filter_vulnerable_packages(module_vulnerabilities)
+            # 2. Filter out all Vulnerabilities where commit sha is out of Vulnerability range.
+            self.filtered_vul = self._filter_vulnerable_packages(module_vulnerabilities)
 
         # 3. ADD Package Meta Data sourced from DB
         pckg_response = self._get_data_from_graph(
@@ -0,0 +1,61 @@
+"""Stack aggregation and recommendation of the same stack in one request.
+
+Packages are normalized once, aggregation runs on a pool thread while recommendation
+runs in the calling thread. License filtering of recommendation reads the user stack
+details fetched by the aggregator instead of fetching them from graph again.
+"""
+
+import datetime
+import logging
+import threading
+from typing import Dict, List
+
+from src.settings import Settings
+from src.utils import executors
+from src.v2.models import PackageDetails, StackAggregatorRequest
+from src.v2.recommender import RecommendationTask
+from src.v2.stack_aggregator import StackAggregator
+
+logger = logging.getLogger(__name__)
+
+
+class StackAnalysis:
+    """Aggregate and recommend the given stack concurrently."""
+
+    @staticmethod
+    def execute(request: Dict, persist=True, check_license=False, incremental=False):
+        """Task code.
+
+        Both results are persisted under their own worker, as if they were
+        requested separately.
+        """
+        started_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        aggregator = StackAggregator.create_aggregator(StackAggregatorRequest(**request))
+        fetched = threading.Event()
+
+        def aggregate():
+            try:
+                aggregator.fetch_details(incremental=incremental)
+            finally:
+                fetched.set()
+            return StackAggregator.complete(aggregator, started_at, persist=persist)
+
+        def package_details() -> List[PackageDetails]:
+            fetched.wait()
+            return aggregator.get_direct_package_details()
+
+        # recommendation waits for the aggregation, it must not run on the same pool
+        future = executors.get('stack_analysis', Settings().worker_connections).submit(aggregate)
+        try:
+            recommendation = RecommendationTask().execute(
+                request, persist=persist, check_license=check_license,
+                normalized_packages=aggregator.normalized_packages,
+                package_details=package_details)
+        finally:
+            aggregation = future.result()
+
+        logger.info('%s stack analysis completed', aggregation['external_request_id'])
+        return {'stack_analysis': 'success',
+                'external_request_id': aggregation['external_request_id'],
+                'aggregation': aggregation,
+                'recommendation': recommendation}
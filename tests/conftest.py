@@ -2,6 +2,10 @@
 
 import pytest
 
+from src.utils import osio_user_count_cache
+from src.v2.stack_aggregator import (epv_cache, epv_license_cache, unknown_epv_cache,
+                                     stack_result_cache)
+
 
 @pytest.fixture
 def client():
@@ -9,3 +13,19 @@ def client():
     from src.rest_api import app
     with app.test_client() as client:
         yield client
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test with empty in-process caches."""
+    epv_cache.clear()
+    epv_license_cache.clear()
+    unknown_epv_cache.clear()
+    osio_user_count_cache.clear()
+    stack_result_cache.clear()
+    yield
+    epv_cache.clear()
+    epv_license_cache.clear()
+    unknown_epv_cache.clear()
+    osio_user_count_cache.clear()
+    stack_result_cache.clear()
@@ -0,0 +1,229 @@
+"""Tests for the 'cache' module."""
+
+import json
+import sqlite3
+import threading
+from unittest import mock
+
+from pytest import raises
+
+from src.cache import (TTLCache, SingleFlight, SqliteCache, get_shared_cache,
+                       fetch_with_shared_cache)
+
+
+def test_ttl_cache_hit_and_miss():
+    """Test cache returns stored values and counts hits/misses."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    assert cache.get(('pypi', 'six', '1.0')) is None
+    cache.put(('pypi', 'six', '1.0'), 'six')
+    assert cache.get(('pypi', 'six', '1.0')) == 'six'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['size'] == 1
+
+
+def test_ttl_cache_lru_eviction():
+    """Test least recently used entry is evicted when cache is full."""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # make 'a' recently used
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+@mock.patch('src.cache.time.monotonic')
+def test_ttl_cache_expiry(_mock_time):
+    """Test entries expire after ttl."""
+    _mock_time.return_value = 100
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.put('a', 1)
+    _mock_time.return_value = 109
+    assert cache.get('a') == 1
+    _mock_time.return_value = 111
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_disabled():
+    """Test cache with maxsize 0 never stores anything."""
+    cache = TTLCache(maxsize=0, ttl=10)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_invalidate_and_clear():
+    """Test explicit invalidation."""
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.invalidate('a')
+    assert cache.get('a') is None
+    cache.clear()
+    assert cache.get('b') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_single_flight_coalesces_concurrent_fetches():
+    """Test callers wait on in-flight fetch of the same keys instead of fetching again."""
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch(keys):
+        calls.append(keys)
+        started.set()
+        release.wait(5)
+        return {key: key.upper() for key in keys if key != 'unknown'}
+
+    results = {}
+    leader = threading.Thread(
+        target=lambda: results.update(leader=single_flight.fetch_many(['a', 'b'], slow_fetch)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.update(
+        follower=single_flight.fetch_many(['b', 'unknown'], lambda keys: calls.append(keys) or {})))
+    follower.start()
+    # follower fetches only the key not in flight and waits for the rest
+    for _ in range(100):
+        if len(calls) == 2:
+            break
+        release.wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert calls == [['a', 'b'], ['unknown']]
+    assert results['leader'] == {'a': 'A', 'b': 'B'}
+    assert results['follower'] == {'b': 'B', 'unknown': None}
+    assert single_flight.stats() == {'name': 'single_flight', 'fetches': 2, 'fetched': 3,
+                                     'coalesced': 1, 'in_flight': 0}
+
+    # nothing in flight anymore, keys are fetched again
+    assert single_flight.fetch_many(['a', 'a'], lambda keys: {'a': len(keys)}) == {'a': 1}
+    single_flight.reset()
+    assert single_flight.stats()['fetches'] == 0
+
+
+def test_single_flight_error():
+    """Test error of the fetch is raised and keys are released."""
+    single_flight = SingleFlight()
+
+    def failing_fetch(_keys):
+        raise ValueError('graph down')
+
+    with raises(ValueError):
+        single_flight.fetch_many(['a'], failing_fetch)
+    assert single_flight.stats()['in_flight'] == 0
+    assert single_flight.fetch_many(['a'], lambda keys: {'a': 1}) == {'a': 1}
+
+
+def test_sqlite_cache(tmp_path):
+    """Test values are shared between cache instances using same file."""
+    path = str(tmp_path / 'cache.db')
+    cache = SqliteCache(path, ttl=60)
+    assert cache.get_many([('epv', 'pypi', 'six', '1.0')]) == {}
+    cache.put_many({('epv', 'pypi', 'six', '1.0'): '{"name": "six"}',
+                    ('epv', 'pypi', 'flask', '1.0'): '{"name": "flask"}'})
+
+    other = SqliteCache(path, ttl=60)
+    assert other.get_many([('epv', 'pypi', 'six', '1.0'), ('epv', 'pypi', 'foo', '1.0')]) == {
+        ('epv', 'pypi', 'six', '1.0'): '{"name": "six"}'}
+    journal_mode = sqlite3.connect(path).execute('PRAGMA journal_mode').fetchone()[0]
+    assert journal_mode == 'wal'
+
+    other.clear()
+    assert cache.get_many([('epv', 'pypi', 'six', '1.0')]) == {}
+
+
+def test_sqlite_cache_connection(tmp_path):
+    """Test connection is shared by threads, reopened after fork and after close."""
+    cache = SqliteCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.put_many({('a',): '1'})
+    conn = cache._conn
+    thread = threading.Thread(target=cache.get_many, args=([('a',)],))
+    thread.start()
+    thread.join()
+    assert cache._conn is conn
+
+    with mock.patch('src.cache.os.getpid', return_value=-1):
+        assert cache.get_many([('a',)]) == {('a',): '1'}
+        assert cache._conn is not conn
+    conn.close()
+
+    cache.close()
+    assert cache._conn is None
+    assert cache.get_many([('a',)]) == {('a',): '1'}
+    cache.close()
+
+
+@mock.patch('src.cache.time.time')
+def test_sqlite_cache_expiry(_mock_time, tmp_path):
+    """Test expired entries are not returned."""
+    _mock_time.return_value = 100
+    cache = SqliteCache(str(tmp_path / 'cache.db'), ttl=10)
+    cache.put_many({('a',): '1'})
+    _mock_time.return_value = 109
+    assert cache.get_many([('a',)]) == {('a',): '1'}
+    _mock_time.return_value = 111
+    assert cache.get_many([('a',)]) == {}
+
+
+@mock.patch('src.cache.time.time')
+def test_sqlite_cache_purge(_mock_time, tmp_path):
+    """Test expired entries are purged by a write once per purge interval."""
+    _mock_time.return_value = 100
+    path = str(tmp_path / 'cache.db')
+    cache = SqliteCache(path, ttl=10, purge_interval=30)
+
+    def _count():
+        return sqlite3.connect(path).execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    cache.put_many({('a',): '1'})
+    _mock_time.return_value = 125
+    cache.put_many({('b',): '2'})
+    assert _count() == 2
+    _mock_time.return_value = 131
+    cache.put_many({('c',): '3'})
+    assert _count() == 2
+    assert cache.get_many([('a',), ('b',), ('c',)]) == {('b',): '2', ('c',): '3'}
+
+
+def test_sqlite_cache_error(tmp_path):
+    """Test database errors are treated as cache miss."""
+    cache = SqliteCache(str(tmp_path / 'missing' / 'cache.db'), ttl=10)
+    cache.put_many({('a',): '1'})
+    assert cache.get_many([('a',)]) == {}
+
+
+def test_get_shared_cache(tmp_path, monkeypatch):
+    """Test shared cache is configured by env."""
+    assert get_shared_cache() is None
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.db'))
+    assert get_shared_cache() is get_shared_cache()
+    assert get_shared_cache().path == str(tmp_path / 'cache.db')
+
+
+def test_fetch_with_shared_cache(tmp_path, monkeypatch):
+    """Test only names missing in shared cache are fetched."""
+    def _fetch(names):
+        return [{'name': name} for name in names if name != 'unknown']
+
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.db'))
+    fetch = mock.Mock(side_effect=_fetch)
+    rows = fetch_with_shared_cache('test', 'pypi', ['six', 'unknown'], fetch,
+                                   lambda row: row['name'])
+    assert rows == [{'name': 'six'}]
+    fetch.assert_called_once_with(['six', 'unknown'])
+    rows = fetch_with_shared_cache('test', 'pypi', ['six', 'flask', 'unknown'], fetch,
+                                   lambda row: row['name'])
+    assert rows == [{'name': 'six'}, {'name': 'flask'}]
+    fetch.assert_called_with(['flask', 'unknown'])
+    assert json.loads(get_shared_cache().get_many([('test', 'pypi', 'flask')])[
+        ('test', 'pypi', 'flask')]) == [{'name': 'flask'}]
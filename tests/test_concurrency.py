@@ -0,0 +1,81 @@
+"""Tests for the process wide thread pools of the 'utils' module."""
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from pytest import raises
+from src.utils import GremlinExeception, execute_concurrently, ExecutorRegistry
+
+
+def test_execute_concurrently():
+    """Test results are returned in the order of tasks."""
+    def _task(val):
+        time.sleep(0.01 * (5 - val))
+        return val
+
+    tasks = [functools.partial(_task, i) for i in range(5)]
+    assert execute_concurrently(tasks, max_workers=5) == [0, 1, 2, 3, 4]
+    assert execute_concurrently(tasks, max_workers=1) == [0, 1, 2, 3, 4]
+    assert execute_concurrently([], max_workers=5) == []
+
+
+@mock.patch('src.utils.executors')
+def test_execute_concurrently_pool_size(_mock_executors, monkeypatch):
+    """Test pool is sized from WORKER_CONNECTIONS and the per call bound."""
+    monkeypatch.setenv('WORKER_CONNECTIONS', '3')
+    _mock_executors.get.return_value.submit.side_effect = ThreadPoolExecutor(2).submit
+    assert execute_concurrently([lambda: 1, lambda: 2], 2, 'gremlin') == [1, 2]
+    _mock_executors.get.assert_called_once_with('gremlin', 6)
+
+
+def test_execute_concurrently_exception():
+    """Test exception raised by a task is propagated."""
+    def _failing_task():
+        raise GremlinExeception('mocked exception')
+
+    with raises(GremlinExeception):
+        execute_concurrently([lambda: 1, _failing_task], max_workers=2)
+
+
+def test_execute_concurrently_per_call_limit():
+    """Test concurrency is bounded per call, not across concurrent callers."""
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def _task():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    execute_concurrently([_task] * 6, 2, 'test')
+    assert len(peak) == 6
+    assert max(peak) <= 2
+
+    peak.clear()
+    callers = [threading.Thread(target=execute_concurrently, args=([_task] * 4, 2, 'test'))
+               for _ in range(3)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    assert len(peak) == 12
+    assert max(peak) <= 6
+
+
+def test_executor_registry():
+    """Test pools are shared per name and size, never replaced and not reused after fork."""
+    registry = ExecutorRegistry()
+    pool = registry.get('gremlin', 2)
+    assert registry.get('gremlin', 2) is pool
+    assert registry.get('other', 2) is not pool
+    # pool of another size is a pool of its own, the existing one stays usable
+    assert registry.get('gremlin', 3) is not pool
+    assert pool.submit(lambda: 1).result() == 1
+    assert registry.get('gremlin', 2) is pool
+    with mock.patch('src.utils.os.getpid', return_value=-1):
+        assert registry.get('gremlin', 2) is not pool
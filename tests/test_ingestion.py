@@ -0,0 +1,82 @@
+"""Tests for the 'ingestion' module."""
+
+import threading
+from unittest import mock
+
+from src.ingestion import IngestionQueue
+from src.utils import server_run_flow
+
+
+def test_ingestion_queue():
+    """Test EPVs are ingested in background, failures don't stop the rest."""
+    ingest = mock.Mock(side_effect=[Exception('mocked exception'), None, None])
+    ingestion = IngestionQueue(workers=2, max_pending=10)
+    queued = ingestion.submit([('npm', 'foo', '1.0'), ('npm', 'bar', '1.0'),
+                               ('npm', 'baz', '1.0')], ingest)
+    ingestion.join()
+    assert len(queued) == 3
+    assert ingest.call_count == 3
+    ingest.assert_any_call('npm', 'baz', '1.0')
+
+
+def test_ingestion_queue_deduplication():
+    """Test EPV waiting in the queue is not queued again."""
+    blocker = threading.Event()
+    ingest = mock.Mock(side_effect=lambda *_: blocker.wait(5))
+    ingestion = IngestionQueue(workers=1, max_pending=10)
+    assert ingestion.submit([('npm', 'foo', '1.0')], ingest) == [('npm', 'foo', '1.0')]
+    assert ingestion.submit([('npm', 'bar', '1.0'), ('npm', 'bar', '1.0')], ingest) == \
+        [('npm', 'bar', '1.0')]
+    assert ingestion.submit([('npm', 'bar', '1.0')], ingest) == []
+    blocker.set()
+    ingestion.join()
+    assert ingest.call_count == 2
+
+
+def test_ingestion_queue_full():
+    """Test EPVs over max_pending are dropped."""
+    blocker = threading.Event()
+    taken = threading.Event()
+
+    def _ingest(*_):
+        taken.set()
+        blocker.wait(5)
+
+    ingest = mock.Mock(side_effect=_ingest)
+    ingestion = IngestionQueue(workers=1, max_pending=2)
+    assert ingestion.submit([('npm', 'foo', '1.0')], ingest) == [('npm', 'foo', '1.0')]
+    # foo is taken by the worker, it no longer waits in the queue
+    assert taken.wait(5)
+    assert ingestion.submit([('npm', 'bar', '1.0'), ('npm', 'baz', '1.0'),
+                             ('npm', 'qux', '1.0')], ingest) == \
+        [('npm', 'bar', '1.0'), ('npm', 'baz', '1.0')]
+    blocker.set()
+    ingestion.join()
+    assert ingest.call_count == 3
+    assert mock.call('npm', 'qux', '1.0') not in ingest.call_args_list
+
+
+def test_ingestion_queue_inline():
+    """Test EPVs are ingested inline without workers."""
+    ingest = mock.Mock()
+    ingestion = IngestionQueue(workers=0, max_pending=10)
+    assert ingestion.submit([('npm', 'foo', '1.0'), ('npm', 'foo', '1.0')], ingest) == \
+        [('npm', 'foo', '1.0')]
+    ingest.assert_called_once_with('npm', 'foo', '1.0')
+
+
+@mock.patch('src.utils.run_flow', return_value='dispatcher-id')
+@mock.patch('src.utils.init_celery')
+def test_ingestion_queue_celery_init(_mock_init, _mock_run):
+    """Test celery client is initialized once for flows started by worker threads."""
+    def _ingest(ecosystem, name, version):
+        server_run_flow('bayesianApiFlow', {'ecosystem': ecosystem, 'name': name,
+                                            'version': version})
+
+    ingestion = IngestionQueue(workers=3, max_pending=10)
+    with mock.patch('src.utils._celery_initialized', False):
+        ingestion.submit([('npm', 'foo', '1.0'), ('npm', 'bar', '1.0'),
+                          ('npm', 'baz', '1.0')], _ingest)
+        ingestion.join()
+    _mock_init.assert_called_once_with(result_backend=False)
+    assert _mock_run.call_count == 3
@@ -0,0 +1,51 @@
+"""Tests for the 'jobs' module."""
+
+import threading
+
+from src.jobs import JobQueue, DONE, FAILED, PENDING, RUNNING
+
+
+def _wait(queue, job_id):
+    """Wait until all the jobs are finished."""
+    queue._executor.shutdown(wait=True)
+    return queue.get(job_id)
+
+
+def test_job_queue():
+    """Test job status and error are recorded, results are not kept."""
+    queue = JobQueue(workers=2, max_pending=5, ttl=60)
+    assert queue.submit('ok', lambda: 42)['job_id'] == 'ok'
+    assert queue.submit('ko', lambda: 1 / 0) is not None
+    assert _wait(queue, 'ok')['status'] == DONE
+    assert 'result' not in queue.get('ok')
+    assert queue.get('ko')['status'] == FAILED
+    assert queue.get('ko')['error'] == 'division by zero'
+    assert queue.get('unknown') is None
+
+
+def test_job_queue_task_error():
+    """Test job returning task result which is not a success is failed."""
+    queue = JobQueue(workers=1, max_pending=5, ttl=60)
+    queue.submit('pgm', lambda: {'recommendation': 'pgm_error', 'message': 'PGM Fetching error'})
+    queue.submit('ok', lambda: {'aggregation': 'success', 'result': {}})
+    assert _wait(queue, 'pgm')['status'] == FAILED
+    assert queue.get('pgm')['error'] == 'PGM Fetching error'
+    assert queue.get('ok')['status'] == DONE
+
+
+def test_job_queue_bounded():
+    """Test duplicate submissions are coalesced and queue size is bounded."""
+    queue = JobQueue(workers=1, max_pending=2, ttl=60)
+    release = threading.Event()
+    try:
+        first = queue.submit('a', release.wait)
+        assert first['status'] in (PENDING, RUNNING)
+        assert queue.submit('a', release.wait) is first
+        assert queue.submit('b', release.wait) is not None
+        # queue is full
+        assert queue.submit('c', release.wait) is None
+    finally:
+        release.set()
+    assert _wait(queue, 'a')['status'] == DONE
+    assert queue.get('b')['status'] == DONE
+    assert queue._pending == 0
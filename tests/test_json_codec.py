@@ -0,0 +1,78 @@
+"""Tests for the 'json_codec' module."""
+
+import datetime
+import json
+from unittest import mock
+
+import pytest
+from pytest import raises
+
+from src import json_codec
+from src.json_codec import JsonCodec, OrjsonCodec, get_codec, orjson
+from src.settings import Settings
+
+needs_orjson = pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+
+
+def test_codecs_are_interchangeable():
+    """Test both codecs encode and decode the same documents."""
+    with open('tests/v2/data/graph_response_2_public_vuln.json') as f:
+        document = json.load(f)
+    for codec in [JsonCodec()] + ([OrjsonCodec()] if orjson else []):
+        assert codec.loads(codec.dumps(document)) == document
+        assert codec.loads(codec.dumpb(document)) == document
+        assert json.loads(codec.dumps(document)) == document
+        assert codec.loads(json.dumps(document)) == document
+
+
+@needs_orjson
+def test_orjson_codec_fallback():
+    """Test values orjson can't handle are handled by json module."""
+    codec = OrjsonCodec()
+    assert codec.loads(codec.dumps({'count': 2 ** 70})) == {'count': 2 ** 70}
+    assert codec.loads(codec.dumps({1: 'a'})) == {'1': 'a'}
+    assert str(codec.loads('{"probability": NaN}')['probability']) == 'nan'
+    with raises(ValueError):
+        codec.loads('{"probability": ')
+
+
+@needs_orjson
+def test_get_codec(monkeypatch):
+    """Test codec selection."""
+    assert get_codec('json').name == 'json'
+    assert get_codec('orjson').name == 'orjson'
+    assert get_codec().name == 'orjson'
+    monkeypatch.setenv('JSON_CODEC', 'json')
+    assert get_codec(Settings().json_codec).name == 'json'
+
+
+def test_get_codec_without_orjson():
+    """Test json module is used when orjson isn't installed."""
+    with mock.patch('src.json_codec.orjson', None):
+        assert get_codec().name == 'json'
+        assert get_codec('orjson').name == 'json'
+    with raises(ValueError):
+        get_codec('yaml')
+
+
+def test_dumpb_sorted():
+    """Test both codecs encode compact JSON with sorted keys and use the given default."""
+    def _default(value):
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        raise TypeError(value)
+
+    document = {'b': [1, {'z': 2 ** 70, 'a': datetime.date(2020, 1, 2)}], 'a': None}
+    expected = b'{"a":null,"b":[1,{"a":"2020-01-02","z":1180591620717411303424}]}'
+    for codec in [JsonCodec()] + ([OrjsonCodec()] if orjson else []):
+        assert codec.dumpb_sorted(document, default=_default) == expected
+        with raises(TypeError):
+            codec.dumpb_sorted({'a': object()}, default=_default)
+
+
+def test_module_functions():
+    """Test module level functions use the configured codec."""
+    with mock.patch('src.json_codec.codec', JsonCodec()):
+        assert json_codec.dumps({'a': [1]}) == '{"a": [1]}'
+        assert json_codec.dumpb({'a': [1]}) == b'{"a": [1]}'
+        assert json_codec.loads(b'{"a": [1]}') == {'a': [1]}
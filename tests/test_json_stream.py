@@ -0,0 +1,60 @@
+"""Tests for the 'json_stream' module."""
+
+import json
+
+from pytest import raises
+
+from src.json_stream import iter_json_items
+
+PATH = ('result', 'data')
+
+
+def _chunks(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def test_iter_json_items():
+    """Test items are the same irrespective of how document is split into chunks."""
+    with open('tests/v2/data/golang_module_vuls_graph_response.json') as f:
+        document = json.load(f)
+    text = json.dumps(document, indent=2)
+    for size in (1, 7, 1000, len(text)):
+        assert list(iter_json_items(_chunks(text, size), PATH)) == document['result']['data']
+
+
+def test_iter_json_items_siblings():
+    """Test values around the path are skipped, numbers split across chunks are complete."""
+    text = json.dumps({
+        'requestId': 'id', 'status': {'code': 200, 'message': '', 'attributes': {}},
+        'result': {'meta': {'data': [0]}, 'data': [12345, -1.5e3, 'a}"[', None, {'x': []}],
+                   'other': 1}})
+    for size in (1, 2, 3):
+        assert list(iter_json_items(_chunks(text, size), PATH)) == \
+            [12345, -1.5e3, 'a}"[', None, {'x': []}]
+
+
+def test_iter_json_items_missing():
+    """Test nothing is yielded when path is missing."""
+    assert list(iter_json_items(['{"result": {"data": []}}'], PATH)) == []
+    assert list(iter_json_items(['{"result": {"meta": {}}}'], PATH)) == []
+    assert list(iter_json_items(['{"result": {"data": null}}'], PATH)) == []
+    assert list(iter_json_items(['{"result": null, "data": [1]}'], PATH)) == []
+    assert list(iter_json_items(['{}'], PATH)) == []
+    assert list(iter_json_items(['[]'], PATH)) == []
+
+
+def test_iter_json_items_truncated():
+    """Test truncated document fails after items parsed so far."""
+    items = iter_json_items(_chunks('{"result": {"data": [1, {"a": 2}, {"b"', 4), PATH)
+    assert next(items) == 1
+    assert next(items) == {'a': 2}
+    with raises(ValueError):
+        next(items)
+
+
+def test_iter_json_items_numbers():
+    """Test numbers split after a digit, a point or an exponent are decoded whole."""
+    numbers = [1.5, 10, -2.25e-3, 0.125, 3E+2, 42, 6.0]
+    text = json.dumps({'result': {'data': numbers}}, separators=(',', ':'))
+    for size in (1, 2, 3, 5):
+        assert list(iter_json_items(_chunks(text, size), PATH)) == numbers
@@ -1,8 +1,10 @@
 """Tests for the recommender module."""
 from unittest import TestCase
 from unittest import mock
+import copy
 import json
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +35,7 @@ def mocked_requests_get(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -86,6 +89,7 @@ def mocked_response_graph(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -107,6 +111,7 @@ def mocked_response_license(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -157,6 +162,95 @@ def test_execute_with_insights(_mock1, _mock2, _mock3):
     assert out['recommendation'] == "success"
 
 
+@mock.patch('src.recommender.RecommendationTask.call_insights_recommender')
+@mock.patch('src.recommender.GraphDB.get_version_information')
+@mock.patch('src.recommender.extract_user_stack_package_licenses')
+@mock.patch('src.recommender.License.perform_license_analysis')
+def test_execute_concurrent_fetches(_mock_license, _mock_user_licenses, _mock_graph,
+                                    _mock_insights):
+    """Test companion, alternate and user stack license fetches run at the same time."""
+    insights = copy.deepcopy(insights_comp_resp)
+    insights[0]['alternate_packages'] = {
+        'io.vertx:vertx-web': [{'package_name': 'io.vertx:vertx-alt', 'similarity_score': 0.9}]}
+    _mock_insights.return_value = insights
+    # each fetch waits for the others, fetches made one by one would time out
+    barrier = threading.Barrier(3, timeout=5)
+
+    def graph(packages, _ecosystem):
+        barrier.wait()
+        return [] if packages == ['io.vertx:vertx-alt'] else graph_resp['result']['data']
+
+    def user_licenses(_resolved, _ecosystem):
+        barrier.wait()
+        return [{'package': 'io.vertx:vertx-web', 'version': '3.4.2', 'licenses': ['MIT']}]
+
+    _mock_graph.side_effect = graph
+    _mock_user_licenses.side_effect = user_licenses
+    _mock_license.side_effect = lambda **kwargs: (kwargs['filtered_alt_packages_graph'],
+                                                  kwargs['filtered_comp_packages_graph'])
+    with open("tests/data/stack_aggregator_execute_input.json", "r") as f:
+        payload = json.load(f)
+
+    out = RecommendationTask().execute(arguments=payload, persist=False, check_license=True)
+    assert out['recommendation'] == "success"
+    assert _mock_graph.call_count == 2
+    assert _mock_license.call_args[1]['user_stack_licenses'] == [
+        {'package': 'io.vertx:vertx-web', 'version': '3.4.2', 'licenses': ['MIT']}]
+
+
+@mock.patch('src.recommender.GraphDB.get_version_information')
+@mock.patch('src.recommender.extract_user_stack_package_licenses')
+def test_get_fetch_tasks(_mock_user_licenses, _mock_graph):
+    """Test alternates and user stack licenses are fetched only when needed."""
+    resolved = [{'package': 'io.vertx:vertx-web', 'version': '3.4.2'}]
+    tasks = RecommendationTask.get_fetch_tasks(['comp'], [], resolved, 'maven', False)
+    assert len(tasks) == 1
+    tasks[0]()
+    _mock_graph.assert_called_once_with(['comp'], 'maven')
+
+    _mock_graph.reset_mock()
+    tasks = RecommendationTask.get_fetch_tasks(['comp'], ['alt'], resolved, 'maven', True)
+    assert len(tasks) == 3
+    for task in tasks:
+        task()
+    assert _mock_graph.call_args_list == [mock.call(['comp'], 'maven'),
+                                          mock.call(['alt'], 'maven')]
+    _mock_user_licenses.assert_called_once_with(resolved, 'maven')
+
+
+def test_unpack_fetched():
+    """Test results are split in the order of fetch tasks, missing ones get defaults."""
+    assert RecommendationTask.unpack_fetched(['comp'], [], False) == ('comp', [], None)
+    assert RecommendationTask.unpack_fetched(['comp', 'lic'], [], True) == ('comp', [], 'lic')
+    assert RecommendationTask.unpack_fetched(['comp', 'alt'], ['a'], False) == \
+        ('comp', 'alt', None)
+    assert RecommendationTask.unpack_fetched(['comp', 'alt', 'lic'], ['a'], True) == \
+        ('comp', 'alt', 'lic')
+
+
+@mock.patch('src.recommender.create_package_dict', return_value=[])
+@mock.patch('src.recommender.RecommendationTask.call_insights_recommender')
+@mock.patch('src.recommender.GraphDB.get_version_information',
+            return_value=graph_resp['result']['data'])
+def test_execute_alternate_topics(_mock_graph, _mock_insights, _mock_create):
+    """Test alternates take only topics from insights, companions co-occurrence stats too."""
+    insights = copy.deepcopy(insights_comp_resp)
+    insights[0]['alternate_packages'] = {
+        'io.vertx:vertx-web': [{'package_name': 'io.vertx:vertx-alt', 'similarity_score': 0.9,
+                                'topic_list': ['alt'], 'cooccurrence_probability': 0.5,
+                                'cooccurrence_count': 5}]}
+    _mock_insights.return_value = insights
+    with open("tests/data/stack_aggregator_execute_input.json", "r") as f:
+        payload = json.load(f)
+
+    out = RecommendationTask().execute(arguments=payload, persist=False, check_license=False)
+    assert out['recommendation'] == "success"
+    companion_call, alternate_call = _mock_create.call_args_list
+    assert companion_call[1]['insights_index'] == {
+        pkg['package_name']: pkg for pkg in insights[0]['companion_packages']}
+    assert alternate_call[1]['insights_index'] == {'io.vertx:vertx-alt': {'topic_list': ['alt']}}
+
+
 @mock.patch('src.recommender.persist_data_in_db')
 @mock.patch('src.recommender.RecommendationTask.call_insights_recommender', return_value=[])
 def test_execute_empty_resolved(_mock_call_insights, _mock_db):
@@ -238,20 +332,6 @@ def test_get_version_information(_mock1):
     assert len(out) == 1
 
 
-def test_get_topics():
-    """Test the function get topics."""
-    alt_list = GraphDB.get_topics_for_alt(graph_resp['result']['data'],
-                                          insights_resp[0]['alternate_packages'])
-    comp_list = GraphDB.get_topics_for_comp(graph_resp['result']['data'],
-                                            insights_resp[0]['companion_packages'])
-
-    assert alt_list is not None
-    assert isinstance(alt_list, list)
-
-    assert comp_list is not None
-    assert isinstance(comp_list, list)
-
-
 def test_get_topmost_alternate():
     """Test the function get topmost alternate recommendation."""
     input_stack = {"io.vertx:vertx-core": "3.4.1"}
@@ -309,5 +389,4 @@ if __name__ == '__main__':
     test_apply_license_filter()
     test_perform_license_analysis()
     test_get_topmost_alternate()
-    test_get_topics()
     test_prepare_final_filtered_list()
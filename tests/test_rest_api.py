@@ -1,5 +1,7 @@
 """Tests for the REST API of the backbone service."""
+import datetime
 import json
+import time
 from unittest import mock
 
 payload = {
@@ -92,6 +94,17 @@ def test_liveness_endpoint(client):
     assert json_data == {}, "Empty JSON response expected"
 
 
+@mock.patch('src.rest_api.session')
+def test_session_removed_after_request(_mock_session):
+    """Test DB session of the request is released once the request is served."""
+    from src.rest_api import app
+    # the client is not used as context manager, which would keep the app context
+    # of the last request open
+    response = app.test_client().get("/api/readiness")
+    assert response.status_code == 200
+    _mock_session.remove.assert_called_once_with()
+
+
 @mock.patch('src.stack_aggregator.StackAggregator.execute', return_value=response)
 def test_stack_api_endpoint(_mock, client):
     """Check the /stack_aggregator REST API endpoint."""
@@ -124,6 +137,137 @@ def test_recommendation_api_endpoint_exception(_mock_object, client):
     assert jsn['external_request_id'] == payload['external_request_id']
 
 
+def _poll(client, route, job_id):
+    """Poll async job until it is finished."""
+    for _ in range(100):
+        resp = client.get('/api/v2/{}/{}'.format(route, job_id))
+        if resp.status_code != 202:
+            return resp
+        time.sleep(0.01)
+    return resp
+
+
+@mock.patch('src.rest_api.select_from_db')
+@mock.patch('src.v2.stack_aggregator.StackAggregator.execute', return_value=response)
+def test_stack_api_async(_mock, _mock_db, client):
+    """Check async submission and polling of /api/v2/stack_aggregator."""
+    _mock_db.return_value = mock.Mock(task_result=response['result'])
+    resp = client.post('/api/v2/stack_aggregator?async=true',
+                       data=json.dumps({'external_request_id': 'async-sa'}),
+                       content_type='application/json')
+    assert resp.status_code == 202
+    jsn = get_json_from_response(resp)
+    assert jsn['job_id'] == 'async-sa'
+    assert resp.headers['Location'].endswith('/api/v2/stack_aggregator/async-sa')
+
+    resp = _poll(client, 'stack_aggregator', 'async-sa')
+    assert resp.status_code == 200
+    jsn = get_json_from_response(resp)
+    assert jsn['status'] == 'done'
+    # result is read from RDS, not kept in memory
+    assert jsn['result']['result'] == response['result']
+    _mock.assert_called_once_with({'external_request_id': 'async-sa'}, persist=True,
+                                  incremental=False)
+    _mock_db.assert_called_with(external_request_id='async-sa', worker='stack_aggregator_v2')
+
+
+@mock.patch('src.v2.recommender.RecommendationTask.execute', side_effect=Exception('boom'))
+def test_recommendation_api_async_failure(_mock, client):
+    """Check failure of async /api/v2/recommender job is reported."""
+    resp = client.post('/api/v2/recommender?async=true',
+                       data=json.dumps({'external_request_id': 'async-rec'}),
+                       content_type='application/json')
+    assert resp.status_code == 202
+    resp = _poll(client, 'recommender', 'async-rec')
+    assert resp.status_code == 400
+    jsn = get_json_from_response(resp)
+    assert jsn['status'] == 'failed'
+    assert jsn['message'] == 'boom'
+
+
+def test_async_api_invalid_request(client):
+    """Check async submission requires external_request_id and persisted result."""
+    resp = client.post('/api/v2/stack_aggregator?async=true', data=json.dumps({}),
+                       content_type='application/json')
+    assert resp.status_code == 400
+    resp = client.post('/api/v2/stack_aggregator?async=true&persist=false',
+                       data=json.dumps({'external_request_id': 'async-no-persist'}),
+                       content_type='application/json')
+    assert resp.status_code == 400
+
+
+@mock.patch('src.rest_api.async_jobs.submit', return_value=None)
+def test_async_api_queue_full(_mock, client):
+    """Check submission is rejected when too many jobs are pending."""
+    resp = client.post('/api/v2/stack_aggregator?async=true',
+                       data=json.dumps({'external_request_id': 'async-full'}),
+                       content_type='application/json')
+    assert resp.status_code == 503
+
+
+@mock.patch('src.rest_api.select_from_db')
+def test_async_api_status_from_db(_mock, client):
+    """Check status of jobs unknown to the process is read from RDS."""
+    _mock.return_value = None
+    resp = client.get('/api/v2/stack_aggregator/unknown-job')
+    # may be running in another worker process
+    assert resp.status_code == 202
+    assert get_json_from_response(resp)['status'] == 'pending or unknown'
+
+    _mock.return_value = mock.Mock(task_result={'external_request_id': 'db-job'})
+    resp = client.get('/api/v2/stack_aggregator/db-job')
+    assert resp.status_code == 200
+    jsn = get_json_from_response(resp)
+    assert jsn['result']['result'] == {'external_request_id': 'db-job'}
+    _mock.assert_called_with(external_request_id='db-job', worker='stack_aggregator_v2')
+
+
+@mock.patch('src.v2.stack_analysis.StackAnalysis.execute')
+def test_stack_analysis_api(_mock, client):
+    """Check /api/v2/stack_analysis runs aggregation and recommendation in one request."""
+    _mock.return_value = {'stack_analysis': 'success', 'external_request_id': 'sa-rec'}
+    resp = client.post('/api/v2/stack_analysis?check_license=true',
+                       data=json.dumps({'external_request_id': 'sa-rec'}),
+                       content_type='application/json')
+    assert resp.status_code == 200
+    assert get_json_from_response(resp)['stack_analysis'] == 'success'
+    _mock.assert_called_once_with({'external_request_id': 'sa-rec'}, persist=True,
+                                  check_license=True, incremental=False)
+
+    _mock.side_effect = Exception('boom')
+    resp = client.post('/api/v2/stack_analysis',
+                       data=json.dumps({'external_request_id': 'sa-rec'}),
+                       content_type='application/json')
+    assert resp.status_code == 400
+    assert get_json_from_response(resp)['message'] == 'boom'
+
+
+@mock.patch('src.rest_api.invalidate_stack_result_cache')
+def test_stack_result_cache_api(_mock, client):
+    """Check cached v2 stack results are dropped on request."""
+    resp = client.delete('/api/v2/stack_aggregator/cache')
+    assert resp.status_code == 200
+    assert get_json_from_response(resp) == {'status': 'success'}
+    _mock.assert_called_once_with()
+
+
+def test_jsonify_matches_flask():
+    """Check responses are encoded like flask.jsonify encodes them, with either codec."""
+    from flask import jsonify
+    from src.json_codec import JsonCodec, OrjsonCodec, orjson
+    from src.rest_api import app, _jsonify
+    obj = {'result': {'z': 1, 'a': [None, True, 'x']},
+           'started_at': datetime.datetime(2020, 1, 2, 3, 4, 5),
+           'ended_at': datetime.date(2020, 1, 2)}
+    with app.app_context():
+        expected = jsonify(obj)
+        for codec in [JsonCodec()] + ([OrjsonCodec()] if orjson else []):
+            with mock.patch('src.json_codec.codec', codec):
+                resp = _jsonify(obj)
+            assert resp.get_data() == expected.get_data()
+            assert resp.mimetype == expected.mimetype
+
+
 if __name__ == '__main__':
     test_readiness_endpoint()
     test_liveness_endpoint()
@@ -49,6 +49,7 @@ def mock_dependency_response(*_args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -96,6 +97,28 @@ def test_execute_unknown_with_disable_unknown_package_flow(_mock_unknown, _mock_
     _mock_unknown.assert_not_called()
 
 
+@mock.patch('requests.get', side_effect=mock_dependency_response)
+@mock.patch('requests.Session.post', side_effect=mock_dependency_response)
+@mock.patch('src.stack_aggregator.unknown_package_ingestion')
+def test_execute_manifests(_mock_ingestion, _mock_get, _mock_post):
+    """Test manifests aggregated concurrently are reported in order."""
+    with open("tests/data/stack_aggregator_execute_input.json", "r") as f:
+        payload = json.loads(f.read())
+    manifests = ['pom-{}.xml'.format(i) for i in range(5)]
+    details = payload['result'][0]['details'][0]
+    payload['result'] = []
+    for manifest in manifests:
+        manifest_details = dict(details, manifest_file=manifest)
+        manifest_details['_resolved'] = details['_resolved'] + [
+            {'package': manifest, 'version': '1.0'}]
+        payload['result'].append({'details': [manifest_details]})
+
+    out = stack_aggregator.StackAggregator().execute(payload, False)
+    assert [data['manifest_name'] for data in out['result']['stack_data']] == manifests
+    unknown_deps = _mock_ingestion.submit.call_args[0][0]
+    assert unknown_deps == [('maven', manifest, '1.0') for manifest in manifests]
+
+
 def mock_licenses_resp_component_conflict(*_args, **_kwargs):
     """Mock the call to the insights service."""
     class MockResponse:
@@ -105,6 +128,7 @@ def mock_licenses_resp_component_conflict(*_args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -152,6 +176,7 @@ def mock_licenses_resp_unknown(*_args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -204,6 +229,104 @@ def test_get_unknown_dependency_data(_mock_get, _mock_post):
     assert len(out['unknown_deps']) == 1
 
 
+@mock.patch('src.stack_aggregator.GREMLIN_QUERY_SIZE', 1)
+@mock.patch('src.stack_aggregator.execute_concurrently',
+            side_effect=lambda tasks, *_, **__: [task() for task in tasks])
+@mock.patch('requests.Session.post', side_effect=mock_dependency_response)
+def test_get_dependency_data_batches(_mock_post, _mock_execute):
+    """Test direct and transitive batches are fetched by a single call on gremlin pool."""
+    resolved = [{
+        "package": "io.vertx:vertx-core",
+        "version": "3.4.2",
+        "deps": [{"package": "io.vertx:vertx-web", "version": "3.4.2"}]
+    }]
+    epv_set = stack_aggregator.create_dependency_data_set(resolved, "maven")
+    out = stack_aggregator.get_dependency_data(epv_set)
+    assert len(out['result']) == 2
+    _mock_execute.assert_called_once()
+    assert len(_mock_execute.call_args[0][0]) == 2
+    assert _mock_execute.call_args[1]['name'] == 'gremlin'
+
+
+def test_add_transitive_details():
+    """Test the function add_transitive_details."""
+    def node(cve_id):
+        return {'version': {'pecosystem': ['maven'], 'pname': ['a'], 'version': ['1']},
+                'cve': {'cve_id': [cve_id], 'cvss_v2': [5.0]}}
+
+    epv_list = {'result': {'data': [node('CVE-1'), node('CVE-2'), node('CVE-1')]}}
+    epv_set = stack_aggregator.create_dependency_data_set(
+        [{'package': 'a', 'version': '1'},
+         {'package': 'b', 'version': '2', 'deps': [{'package': 'a', 'version': '1'}]}],
+        'maven')
+    result = stack_aggregator.add_transitive_details(epv_list, epv_set)
+    assert len(result) == 2
+    direct, transitive = result[0]['data'][0], result[1]['data'][0]
+    assert [cve['cve_id'] for cve in direct['cves']] == [['CVE-1'], ['CVE-2']]
+    assert 'transitive' not in direct
+    assert transitive['transitive'] == {
+        'isTransitive': True, 'affected_direct_deps': [{'package': 'b', 'version': '2'}]}
+    assert transitive['cves'] == direct['cves']
+    assert all('cve' in data for data in epv_list['result']['data'])
+
+
+def test_remove_duplicate_cve_data():
+    """Test CVEs are clubbed by id, CVEs without an id by the whole record."""
+    def node(cve):
+        return {'version': {'pecosystem': ['maven'], 'pname': ['a'], 'version': ['1']},
+                'cve': cve}
+
+    cves = [{'cve_id': ['CVE-1'], 'cvss_v2': [5.0]}, {'cve_id': ['CVE-1'], 'cvss_v2': [5.0]},
+            {'cvss_v2': [5.0]}, {'cvss_v2': [7.0]}, {'cvss_v2': [7.0]}]
+    result = stack_aggregator.remove_duplicate_cve_data(
+        {'result': {'data': [node(cve) for cve in cves]}})
+    assert len(result) == 1
+    assert result[0]['data'][0]['cves'] == [cves[0], cves[2], cves[3]]
+
+
+def test_find_unknown_deps():
+    """Test the function find_unknown_deps."""
+    def node(name, version, licenses, cve=False):
+        knowndep = {'version': {'pname': [name], 'version': [version],
+                                'declared_licenses': licenses}}
+        if cve:
+            knowndep['cve'] = {}
+        return knowndep
+
+    epv_data = [node('a', '1', ['MIT'], cve=True), node('a', '1', []),
+                node('b', '1', []), node('c', '2', ['MIT'])]
+    epv_list = {'result': {'data': []}}
+    epv_list, unknown = stack_aggregator.find_unknown_deps(
+        epv_data, epv_list, [('a', '1'), ('b', '1'), ('c', '1'), ('c', '2')], [], True)
+    # first item of duplicates is used, packages without licenses are unknown
+    assert epv_list['result']['data'] == [epv_data[0]]
+    assert unknown == [{'name': 'b', 'version': '1'}, {'name': 'c', 'version': '1'}]
+
+
+@mock.patch('src.stack_aggregator.GREMLIN_QUERY_SIZE', 2)
+@mock.patch('src.stack_aggregator.post_http_request', return_value={'result': {'data': [1]}})
+def test_get_epv_batch_tasks(_mock_post):
+    """Test the function get_epv_batch_tasks."""
+    epvs = ['maven|#|io.vertx:vertx-core|#|3.4.2', 'maven|#|io.vertx:vertx-web|#|3.4.2',
+            'maven|#|io.vertx:vertx-auth|#|3.4.1']
+    tasks, dep_list = stack_aggregator.get_epv_batch_tasks(epvs)
+    assert len(tasks) == 2
+    data = stack_aggregator.join_epv_batches([task() for task in tasks])
+    assert data == [1, 1]
+    assert dep_list == [('io.vertx:vertx-core', '3.4.2'), ('io.vertx:vertx-web', '3.4.2'),
+                        ('io.vertx:vertx-auth', '3.4.1')]
+    assert _mock_post.call_count == 2
+    first, second = (call[1]['payload'] for call in _mock_post.call_args_list)
+    # packages are passed as bindings of a fixed script
+    assert first['gremlin'] == second['gremlin']
+    assert 'io.vertx' not in first['gremlin']
+    assert first['bindings']['packages'] == [
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-core', 'version': '3.4.2'},
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-web', 'version': '3.4.2'}]
+    assert second['bindings']['packages'] == [
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-auth', 'version': '3.4.1'}]
+
+
 def test_aggregate_stack_data():
     """Test the function aggregate_stack_data."""
     out = stack_aggregator.aggregate_stack_data(
@@ -227,6 +350,7 @@ def test_get_recommended_version(_mock1):
     """Test get_recommended_version."""
     rec_ver = stack_aggregator.get_recommended_version('maven', 'pkg', '2.0.0')
     assert rec_ver == '2.1.5'
+    assert _mock1.call_args[1]['payload']['bindings'] == {'ecosystem': 'maven', 'name': 'pkg'}
 
     rec_ver = stack_aggregator.get_recommended_version('maven', 'pkg', '2.2.2')
     assert rec_ver is None
@@ -1,6 +1,7 @@
 """Tests for the 'utils' module."""
 import os
 import json
+import requests
 import semantic_version as sv
 from unittest import mock
 from pytest import raises
@@ -8,10 +9,12 @@ from tests.test_rest_api import response
 from src.utils import push_data, get_time_delta
 from src.utils import (
     convert_version_to_proper_semantic as cvs, GREMLIN_SERVER_URL_REST, format_date,
-    version_info_tuple as vt, select_latest_version as slv,
-    get_osio_user_count, create_package_dict, post_http_request,
-    server_create_analysis, select_from_db, total_time_elapsed, post_gremlin,
-    GremlinExeception, RequestException)
+    version_info_tuple as vt, select_latest_version as slv, version_sort_key,
+    get_osio_user_counts, create_package_dict, post_http_request,
+    server_create_analysis, select_from_db, select_latest_worker_result,
+    check_worker_result_indexes,
+    total_time_elapsed, post_gremlin, post_gremlin_stream,
+    GremlinExeception, RequestException, HttpSessionRegistry, index_insights_packages)
 
 METRICS_COLLECTION_URL = "http://{base_url}:{port}/api/v1/prometheus".format(
     base_url='metrics-accumulator-deepak1725-fabric8-analytics.devtools-dev.ext.devshift.net',
@@ -27,6 +30,7 @@ def mock_error_response(*_args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -48,6 +52,7 @@ def mock_get_osio_user_count(*_args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -146,21 +151,113 @@ def test_select_latest_version():
     assert result_version == ""
 
 
-@mock.patch('requests.get', side_effect=mock_get_osio_user_count)
-@mock.patch('requests.Session.post', side_effect=mock_get_osio_user_count)
-def test_get_osio_user_count(_mock_get, _mock_post):
-    """Test the function get_osio_user_count."""
-    out = get_osio_user_count("maven", "io.vertx:vertx-core", "3.4.2")
-    assert isinstance(out, int)
-
-
-@mock.patch('src.utils.get_osio_user_count', return_value=1)
+def test_select_latest_version_parity():
+    """Check slv() picks the same version as comparing semantic versions directly."""
+    versions = ['', '-1', '1.2.3', '1.2.10', '2.0.rc1', '2.0.0', '1.5.2.RELEASE',
+                '1.5.2', 'abc', '1.5.2.Final', '10.0.0-beta']
+    for input_version in versions:
+        for libio in versions:
+            for anitya in versions:
+                input_tuple = vt(cvs(input_version))
+                libio_tuple = vt(cvs(libio))
+                anitya_tuple = vt(cvs(anitya))
+                if cvs(input_version) == cvs(libio) == cvs(anitya) == sv.Version('0.0.0'):
+                    expected = ''
+                elif libio_tuple >= anitya_tuple and libio_tuple >= input_tuple:
+                    expected = libio
+                elif anitya_tuple >= libio_tuple and anitya_tuple >= input_tuple:
+                    expected = anitya
+                else:
+                    expected = input_version
+                assert slv(input_version, libio, anitya) == expected
+
+
+def test_version_sort_key():
+    """Check version_sort_key() orders versions the same way as vt()."""
+    versions = ['1.2.10', '1.2.3', '', '2.0.rc1', '1.5.2.RELEASE', 'abc', '2.0.0']
+    assert sorted(versions, key=version_sort_key) == sorted(versions, key=lambda v: vt(cvs(v)))
+    assert version_sort_key('1.5.2.RELEASE') == (1, 5, 2, ('RELEASE',))
+    assert version_sort_key(None) == (0, 0, 0, tuple())
+    # unhashable input is not memoized but still handled
+    assert version_sort_key(['1.0.0']) == (0, 0, 0, tuple())
+
+
+def test_version_parsing_is_memoized():
+    """Check repeated versions are parsed only once."""
+    cvs('3.14.15')
+    with mock.patch('src.utils.sv.Version.coerce') as coerce:
+        assert cvs('3.14.15') == sv.Version('3.14.15')
+        assert slv('3.14.15', '', '') == '3.14.15'
+        coerce.assert_not_called()
+
+
+def mock_osio_user_counts(payload, **_kwargs):
+    """Mock the batched osio user count query, every EPV is used once."""
+    return {'result': {'data': [dict(epv, count=1) for epv in payload['bindings']['packages']]}}
+
+
+@mock.patch('src.utils.post_http_request', side_effect=mock_osio_user_counts)
 def test_create_package_dict(_mock_count):
-    """Test the function get_osio_user_count."""
+    """Test the function create_package_dict."""
     with open('tests/data/companion_pkg_graph.json', 'r') as f:
         resp = json.loads(f.read())
     out = create_package_dict(resp)
     assert len(out) > 1
+    assert all(pkg['osio_user_count'] == 1 for pkg in out)
+    # counts for all the EPVs are fetched with a single query
+    _mock_count.assert_called_once()
+
+
+@mock.patch('src.utils.post_http_request', side_effect=mock_osio_user_counts)
+def test_create_package_dict_insights_index(_mock_count):
+    """Test topics and co-occurrence stats are looked up in insights index by package name."""
+    with open('tests/data/companion_pkg_graph.json', 'r') as f:
+        resp = json.loads(f.read())
+    names = sorted({epv['package']['name'][0] for epv in resp})
+    insights = [{'package_name': name, 'topic_list': [name], 'cooccurrence_probability': i,
+                 'cooccurrence_count': i} for i, name in enumerate(names)]
+    # the last of duplicate entries wins
+    insights.append(dict(insights[0], topic_list=['last']))
+
+    out = create_package_dict(resp, insights_index=index_insights_packages(insights))
+    assert len(out) == len(resp)
+    stats = [(pkg['topic_list'], pkg['cooccurrence_count']) for pkg in out]
+    expected = {name: ([name], i) for i, name in enumerate(names)}
+    expected[names[0]] = (['last'], 0)
+    assert stats == [expected[epv['package']['name'][0]] for epv in resp]
+    out = create_package_dict(resp)
+    assert all(pkg['topic_list'] == [] and pkg['cooccurrence_count'] == 0 for pkg in out)
+
+
+@mock.patch('src.utils.post_http_request', side_effect=mock_osio_user_counts)
+def test_get_osio_user_counts(_mock_post):
+    """Test the function get_osio_user_counts."""
+    epvs = [('maven', 'io.vertx:vertx-core', '3.4.2'), ('maven', 'io.vertx:vertx-web', '3.4.2')]
+    assert get_osio_user_counts(epvs + epvs[:1]) == {epv: 1 for epv in epvs}
+    _mock_post.assert_called_once()
+    assert _mock_post.call_args[1]['payload']['bindings']['packages'] == [
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-core', 'version': '3.4.2'},
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-web', 'version': '3.4.2'}]
+
+    # cached EPVs are not queried again
+    new_epv = ('maven', 'io.vertx:vertx-auth', '3.4.2')
+    assert get_osio_user_counts(epvs + [new_epv]) == {epv: 1 for epv in epvs + [new_epv]}
+    assert _mock_post.call_count == 2
+    assert _mock_post.call_args[1]['payload']['bindings']['packages'] == [
+        {'ecosystem': 'maven', 'name': 'io.vertx:vertx-auth', 'version': '3.4.2'}]
+    assert get_osio_user_counts(epvs) == {epv: 1 for epv in epvs}
+    assert _mock_post.call_count == 2
+    assert get_osio_user_counts([]) == {}
+    assert _mock_post.call_count == 2
+
+
+@mock.patch('src.utils.post_http_request', return_value={'result': {'data': []}})
+def test_get_osio_user_counts_missing(_mock_post):
+    """Test EPVs missing in the graph response get -1 and are not cached."""
+    epv = ('npm', 'left-pad', '1.0.0')
+    assert get_osio_user_counts([epv]) == {epv: -1}
+    assert get_osio_user_counts([epv]) == {epv: -1}
+    assert _mock_post.call_count == 2
 
 
 @mock.patch('requests.Session.post', side_effect=mock_error_response)
@@ -186,6 +283,14 @@ def test_select_from_db():
     assert sf_db.get('external_request_id') == 'req-id'
 
 
+def test_select_latest_worker_result():
+    """Test previous result and its index are not available when DB can't be read."""
+    assert select_latest_worker_result('stack_aggregator_v2', ecosystem='pypi',
+                                       manifest_file_path='/foo/bar', uuid='uuid',
+                                       max_age=60) is None
+    assert check_worker_result_indexes() is False
+
+
 @mock.patch('src.utils.select_from_db', return_value=None)
 def test_total_time_elapsed(_mock1):
     """Check Total Time Elapsed Method."""
@@ -245,11 +350,57 @@ def test_post_gremlin_normal(_mock_post):
     assert kwargs['bindings'] == {'val': 123}
 
 
+@mock.patch('requests.Session.post')
+def test_post_gremlin_stream(_mock_post):
+    """Test result data items are parsed from streamed response."""
+    body = json.dumps({'result': {'data': [{'pname': ['caf\u00e9']}, {'pname': ['six']}],
+                                  'meta': {}}}, ensure_ascii=False).encode('utf-8')
+    # multi byte character is split between chunks
+    _mock_post.return_value.iter_content.return_value = (body[i:i + 3]
+                                                         for i in range(0, len(body), 3))
+    items = post_gremlin_stream(query='gremlin_query', bindings={'val': 123})
+    assert list(items) == [{'pname': ['caf\u00e9']}, {'pname': ['six']}]
+    assert _mock_post.call_args[1]['stream'] is True
+    assert _mock_post.call_args[1]['json']['bindings'] == {'val': 123}
+    _mock_post.return_value.close.assert_called_once()
+
+    _mock_post.return_value.iter_content.return_value = iter([b'{"result": {"data": [1,'])
+    with raises(GremlinExeception):
+        list(post_gremlin_stream(query='gremlin_query'))
+
+    _mock_post.side_effect = requests.exceptions.ConnectionError()
+    with raises(GremlinExeception):
+        list(post_gremlin_stream(query='gremlin_query'))
+
+
+def test_http_session_registry():
+    """Test sessions are reused per upstream host."""
+    registry = HttpSessionRegistry(pool_connections=2, pool_maxsize=4)
+    gremlin = registry.get('http://gremlin:8182')
+    assert gremlin is registry.get('http://gremlin:8182/')
+    assert gremlin is not registry.get('http://license:6162/api/v1/stack_license')
+    adapter = gremlin.get_adapter('http://gremlin:8182')
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 3
+    assert gremlin.get_adapter('https://gremlin:8182') is adapter
+
+
+def test_http_session_registry_after_fork():
+    """Test sessions inherited from parent process are not reused."""
+    registry = HttpSessionRegistry()
+    gremlin = registry.get('http://gremlin:8182')
+    with mock.patch('src.utils.os.getpid', return_value=-1):
+        assert gremlin is not registry.get('http://gremlin:8182')
+
+    registry.reset()
+    assert gremlin is not registry.get('http://gremlin:8182')
+
+
 if __name__ == '__main__':
     test_semantic_versioning()
     test_version_info_tuple()
     test_select_latest_version()
-    test_get_osio_user_count()
     test_post_http_request()
     test_create_package_dict()
     test_server_create_analysis()
@@ -0,0 +1,195 @@
+"""Tests for caching of EPV details and stack results in the v2 stack aggregator."""
+
+import json
+from unittest import mock
+
+from src.v2 import stack_aggregator as sa
+from src.v2.stack_aggregator import StackAggregator
+from src.v2.models import Package, LicenseAnalysis, StackAggregatorRequest
+from src.v2.normalized_packages import NormalizedPackages
+from tests.v2.test_stack_aggregator import _request_body
+
+
+_SIX = Package(name='six', version='3.2.1')
+
+
+@mock.patch('src.v2.stack_aggregator.server_create_analysis')
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_unknown_epv_cache(_mock_license, _mock_gremlin, _mock_unknown):
+    """Test recent unknowns are neither queried nor ingested again."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    payload = _request_body()
+    payload['packages'].append(_SIX.dict())
+    StackAggregator().execute(payload, persist=False)
+    sa.unknown_package_ingestion.join()
+    _mock_unknown.assert_called_once_with('pypi', 'six', '3.2.1', api_flow=True,
+                                          force=False, force_graph_sync=True)
+
+    _mock_gremlin.reset_mock()
+    _mock_unknown.reset_mock()
+    sa.epv_cache.clear()
+    sa.stack_result_cache.clear()
+    resp = StackAggregator().execute(payload, persist=False)
+    sa.unknown_package_ingestion.join()
+    # six is skipped in graph batches and ingestion is not initiated again
+    for call in _mock_gremlin.call_args_list:
+        assert {'name': 'six', 'version': '3.2.1'} not in call[0][1]['packages']
+    _mock_unknown.assert_not_called()
+    assert resp['result']['unknown_dependencies'] == [_SIX.dict()]
+
+
+@mock.patch('src.v2.stack_aggregator.unknown_package_ingestion')
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_unknown_epv_cache_dropped(_mock_license, _mock_gremlin, _mock_ingestion):
+    """Test unknowns dropped by a full ingestion queue are not cached."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+    _mock_ingestion.submit.return_value = []
+
+    payload = _request_body()
+    payload['packages'].append(_SIX.dict())
+    StackAggregator().execute(payload, persist=False)
+    assert _mock_ingestion.submit.call_args[0][0] == [('pypi', 'six', '3.2.1')]
+    assert len(sa.unknown_epv_cache) == 0
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_epv_cache(_mock_license, _mock_gremlin):
+    """Test cached EPVs are not fetched from graph again."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    first = StackAggregator().execute(_request_body(), persist=False)
+    _mock_gremlin.assert_called_once()
+    assert len(sa.epv_cache) == 2
+
+    _mock_gremlin.reset_mock()
+    payload = _request_body()
+    payload['packages'].append(_SIX.dict())
+    second = StackAggregator().execute(payload, persist=False)
+    # only six is a cache miss
+    _mock_gremlin.assert_called_once()
+    assert _mock_gremlin.call_args[0][1]['packages'] == [{'name': 'six', 'version': '3.2.1'}]
+    assert first['result']['analyzed_dependencies'] == \
+        second['result']['analyzed_dependencies']
+    assert second['result']['unknown_dependencies'] == [_SIX.dict()]
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+def test_extract_user_stack_package_licenses(_mock_gremlin, monkeypatch, tmp_path):
+    """Test licenses of user stack are fetched with license only projection and cached."""
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.db'))
+    _mock_gremlin.return_value = {'result': {'data': [
+        {'pecosystem': ['pypi'], 'pname': ['flask'], 'version': ['0.12'],
+         'declared_licenses': ['BSD']}]}}
+    packages = NormalizedPackages(StackAggregatorRequest(**_request_body()).packages, 'pypi')
+
+    licenses = sa.extract_user_stack_package_licenses(packages)
+    assert licenses == [{'package': 'flask', 'version': '0.12', 'licenses': ['BSD']}]
+    _mock_gremlin.assert_called_once()
+    query, bindings = _mock_gremlin.call_args[0]
+    assert query == sa.LICENSE_QUERY
+    assert 'has_snyk_cve' not in query
+    assert sorted(pkg['name'] for pkg in bindings['packages']) == ['django', 'flask']
+
+    # flask is cached, django missing in graph is looked up again
+    _mock_gremlin.reset_mock()
+    sa.extract_user_stack_package_licenses(packages)
+    assert _mock_gremlin.call_args[0][1]['packages'] == [{'name': 'django', 'version': '1.2.1'}]
+
+    # full package details and shared cache serve licenses as well
+    _mock_gremlin.reset_mock()
+    sa.epv_license_cache.clear()
+    sa.epv_cache.put(('pypi', 'django', '1.2.1'), mock.Mock(licenses=['MIT']))
+    licenses = sa.extract_user_stack_package_licenses(packages)
+    _mock_gremlin.assert_not_called()
+    assert sorted(licenses, key=lambda pkg: pkg['package']) == [
+        {'package': 'django', 'version': '1.2.1', 'licenses': ['MIT']},
+        {'package': 'flask', 'version': '0.12', 'licenses': ['BSD']}]
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_shared_epv_cache(_mock_license, _mock_gremlin, monkeypatch, tmp_path):
+    """Test EPVs are served from shared cache when in-process cache is cold."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.db'))
+    first = StackAggregator().execute(_request_body(), persist=False)
+    _mock_gremlin.assert_called_once()
+
+    # simulate another worker process
+    sa.epv_cache.clear()
+    sa.stack_result_cache.clear()
+    _mock_gremlin.reset_mock()
+    second = StackAggregator().execute(_request_body(), persist=False)
+    _mock_gremlin.assert_not_called()
+    assert first['result']['analyzed_dependencies'] == \
+        second['result']['analyzed_dependencies']
+
+
+@mock.patch('src.v2.stack_aggregator.persist_data_in_db')
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_stack_result_cache(_mock_license, _mock_gremlin, _mock_store):
+    """Test repeated stack skips graph and license calls."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    first = StackAggregator().execute(_request_body(), persist=True)
+    _mock_gremlin.assert_called_once()
+    _mock_license.assert_called_once()
+
+    payload = _request_body()
+    payload['external_request_id'] = 'another_test_id'
+    payload['packages'].reverse()
+    second = StackAggregator().execute(payload, persist=True)
+    _mock_gremlin.assert_called_once()
+    _mock_license.assert_called_once()
+    assert _mock_store.call_count == 2
+    assert second['external_request_id'] == 'another_test_id'
+    assert second['result']['external_request_id'] == 'another_test_id'
+    assert second['result']['_audit'] is not None
+    assert first['result']['analyzed_dependencies'] == \
+        second['result']['analyzed_dependencies']
+
+    # different ecosystem is a different stack
+    payload['ecosystem'] = 'npm'
+    StackAggregator().execute(payload, persist=False)
+    assert _mock_gremlin.call_count == 2
+
+    sa.epv_cache.clear()
+    sa.invalidate_stack_result_cache(
+        NormalizedPackages(StackAggregatorRequest(**payload).packages, 'npm').canonical_hash)
+    StackAggregator().execute(payload, persist=False)
+    assert _mock_gremlin.call_count == 3
+    StackAggregator().execute(_request_body(), persist=False)
+    assert _mock_gremlin.call_count == 3
+
+    # graph data changed, results and EPV details are fetched again
+    sa.invalidate_stack_result_cache()
+    assert len(sa.stack_result_cache) == len(sa.epv_cache) == 0
+    StackAggregator().execute(_request_body(), persist=False)
+    assert _mock_gremlin.call_count == 4
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_stack_result_cache_license_failure(_mock_license, _mock_gremlin):
+    """Test result without license analysis is not cached."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    for license_analysis in (None, LicenseAnalysis()):
+        _mock_license.reset_mock()
+        _mock_license.return_value = license_analysis
+        StackAggregator().execute(_request_body(), persist=False)
+        StackAggregator().execute(_request_body(), persist=False)
+        assert _mock_license.call_count == 2
+        assert len(sa.stack_result_cache) == 0
@@ -0,0 +1,102 @@
+"""Tests for fetching of EPV details from graph in the v2 stack aggregator."""
+
+import json
+import time
+from unittest import mock
+
+from src.v2 import stack_aggregator as sa
+from src.v2.stack_aggregator import StackAggregator
+from src.v2.models import Package, StackAggregatorRequest
+from tests.v2.test_stack_aggregator import _request_body, _get_normalized_packages
+
+
+_DJANGO = Package(name='django', version='1.2.1')
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+def test_gremlin_batch_results_order(_mock_gremlin, monkeypatch):
+    """Test concurrent batch results are merged in the order of batches."""
+    packages = _get_normalized_packages()
+    names = [pkg.name for pkg in packages.all_dependencies]
+
+    def _mocked_post_gremlin(query, bindings):
+        # delay first batches, so that they complete last.
+        time.sleep(0.01 * (len(names) - names.index(bindings['packages'][0]['name'])))
+        return {'result': {'data': [pkg['name'] for pkg in bindings['packages']]}}
+
+    _mock_gremlin.side_effect = _mocked_post_gremlin
+    monkeypatch.setenv('GREMLIN_BATCH_CONCURRENCY', '5')
+    aggregator = sa.Aggregator(request=StackAggregatorRequest(
+        registration_status="REGISTERED", external_request_id='test_request_id',
+        ecosystem='pypi', manifest_file_path='/tmp/bin', packages=[_DJANGO]),
+        normalized_packages=packages)
+    with mock.patch('src.v2.stack_aggregator.GREMLIN_QUERY_SIZE', 1):
+        result = aggregator._get_package_details_with_vulnerabilities()
+    assert _mock_gremlin.call_count == 5
+    assert result == names
+
+
+def test_projection_covers_package_details():
+    """Test projected graph response gives the same package details as the full one."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        components = json.load(fin)['result']['data']
+
+    def _project(node, properties):
+        return {key: value for key, value in node.items() if key in properties}
+
+    aggregator = sa.Aggregator()
+    for component in components:
+        projected = {
+            'package': _project(component['package'], sa.PACKAGE_PROPERTIES),
+            'version': _project(component['version'], sa.VERSION_PROPERTIES),
+            'vuln': [_project(vuln, sa.VULNERABILITY_PROPERTIES) for vuln in component['vuln']]
+        }
+        assert aggregator._get_package_details(projected) == \
+            aggregator._get_package_details(component)
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_gremlin_projection(_mock_license, _mock_gremlin, monkeypatch):
+    """Test only properties read by stack aggregator are fetched unless full mode is set."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    StackAggregator().execute(_request_body(), persist=False)
+    query, bindings = _mock_gremlin.call_args[0]
+    assert query == sa.PACKAGE_DETAILS_QUERY
+    assert 'valueMap()' not in query
+    assert bindings['package_properties'] == list(sa.PACKAGE_PROPERTIES)
+    assert bindings['version_properties'] == list(sa.VERSION_PROPERTIES)
+    assert bindings['vulnerability_properties'] == list(sa.VULNERABILITY_PROPERTIES)
+
+    monkeypatch.setenv('GREMLIN_PROJECTION', 'full')
+    sa.epv_cache.clear()
+    sa.stack_result_cache.clear()
+    StackAggregator().execute(_request_body(), persist=False)
+    bindings = _mock_gremlin.call_args[0][1]
+    assert bindings['package_properties'] == bindings['version_properties'] == \
+        bindings['vulnerability_properties'] == []
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin_stream')
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_gremlin_streaming(_mock_license, _mock_gremlin, _mock_stream, monkeypatch):
+    """Test streamed graph responses give the same result as parsed ones."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+    expected = StackAggregator().execute(_request_body(), persist=False)
+
+    sa.epv_cache.clear()
+    sa.stack_result_cache.clear()
+    _mock_gremlin.reset_mock()
+    monkeypatch.setenv('GREMLIN_STREAMING', 'true')
+    _mock_stream.side_effect = lambda query, bindings: iter(
+        _mock_gremlin.return_value['result']['data'])
+    result = StackAggregator().execute(_request_body(), persist=False)
+    _mock_gremlin.assert_not_called()
+    _mock_stream.assert_called_once()
+    assert _mock_stream.call_args[0][0] == sa.PACKAGE_DETAILS_QUERY
+    assert result['result']['analyzed_dependencies'] == \
+        expected['result']['analyzed_dependencies']
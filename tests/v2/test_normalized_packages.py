@@ -1,7 +1,7 @@
 """Tests for the v2 normalized package module."""
 
 from src.v2.models import Package, Ecosystem
-from src.v2.normalized_packages import NormalizedPackages
+from src.v2.normalized_packages import NormalizedPackages, GoNormalizedPackages
 
 
 def test_normalized_packages_golang():
@@ -157,3 +157,30 @@ def test_normalized_packages_dependency_graph():
     assert pip not in normalized.dependency_graph[foo]
     assert pip in normalized.dependency_graph[bar]
     assert six in normalized.dependency_graph[bar]
+
+
+def test_normalized_packages_canonical_hash():
+    """Test canonical hash ignores order of packages and duplicates."""
+    six = Package(name='six', version='1.2')
+    pip = Package(name='pip', version='10')
+    flask = Package(name='flask', version='0.12', dependencies=[six, pip])
+    reordered = Package(name='flask', version='0.12', dependencies=[pip, six])
+    first = NormalizedPackages([flask, pip], 'pypi')
+    assert first.canonical_hash == NormalizedPackages([pip, reordered, pip], 'pypi').canonical_hash
+    assert first.canonical_hash != NormalizedPackages([flask, pip], 'npm').canonical_hash
+    assert first.canonical_hash != NormalizedPackages([flask], 'pypi').canonical_hash
+    assert first.canonical_hash != NormalizedPackages([six, pip], 'pypi').canonical_hash
+
+
+def test_go_normalized_packages_canonical_hash():
+    """Test canonical hash of golang stack includes modules of pseudo version packages."""
+    pseudo = 'v0.0.0-20190718012654-fb15b899a751'
+    first = GoNormalizedPackages(
+        [Package(name='github.com/foo/bar/pkg@github.com/foo/bar', version=pseudo)], 'golang')
+    second = GoNormalizedPackages(
+        [Package(name='github.com/foo/bar/pkg@github.com/foo/baz', version=pseudo)], 'golang')
+    assert first.direct_dependencies == second.direct_dependencies
+    assert first.canonical_hash != second.canonical_hash
+    assert first.canonical_hash == GoNormalizedPackages(
+        [Package(name='github.com/foo/bar/pkg@github.com/foo/bar', version=pseudo)] * 2,
+        'golang').canonical_hash
@@ -33,6 +33,7 @@ def mocked_requests_get(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -86,6 +87,7 @@ def mocked_response_graph(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -107,6 +109,7 @@ def mocked_response_license(*args, **_kwargs):
             """Create a mock json response."""
             self.json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data).encode('utf-8')
 
         def json(self):
             """Get the mock json response."""
@@ -153,6 +156,23 @@ def test_execute_with_insights(_mock1, _mock2, _mock3):
     assert out['recommendation'] == "success"
 
 
+@mock.patch('src.v2.recommender.create_package_dict', return_value=[])
+@mock.patch('src.v2.recommender.RecommendationTask.call_insights_recommender',
+            side_effect=[insights_comp_resp])
+@mock.patch('src.v2.recommender.GraphDB.get_version_information',
+            side_effect=[graph_resp['result']['data']])
+def test_execute_insights_index(_mock1, _mock2, _mock_create):
+    """Test companion topics are looked up in insights index by package name."""
+    with open("tests/v2/data/stack_aggregator_execute_input.json", "r") as f:
+        payload = json.load(f)
+
+    out = RecommendationTask().execute(arguments=payload, persist=False, check_license=False)
+    assert out['recommendation'] == "success"
+    insights_index = _mock_create.call_args[1]['insights_index']
+    assert insights_index == {pkg['package_name']: pkg
+                              for pkg in insights_comp_resp[0]['companion_packages']}
+
+
 @mock.patch('src.v2.recommender.persist_data_in_db')
 @mock.patch('src.v2.recommender.RecommendationTask.call_insights_recommender', return_value=[])
 def test_execute_empty_resolved(_mock_call_insights, _mock_db):
@@ -227,15 +247,24 @@ def test_get_version_information(_mock1):
     """Test the function get_version_information."""
     out = GraphDB().get_version_information(['io.vertx:vertx-web'], 'maven')
     assert len(out) == 1
+    payload = _mock1.call_args[1]['json']
+    assert payload['bindings'] == {'ecosystem': 'maven', 'packages': ['io.vertx:vertx-web']}
+    assert 'io.vertx' not in payload['gremlin']
 
+    # same script is sent for any package
+    GraphDB().get_version_information(['io.vertx:vertx-core'], 'npm')
+    assert _mock1.call_args[1]['json']['gremlin'] == payload['gremlin']
 
-def test_get_topics():
-    """Test the function get topics."""
-    comp_list = GraphDB.get_topics_for_comp(graph_resp['result']['data'],
-                                            insights_resp[0]['companion_packages'])
 
-    assert comp_list is not None
-    assert isinstance(comp_list, list)
+@mock.patch('requests.Session.post', side_effect=mocked_response_graph)
+def test_get_version_information_shared_cache(_mock1, monkeypatch, tmp_path):
+    """Test version information is served from shared cache."""
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.db'))
+    out = GraphDB().get_version_information(['io.vertx:vertx-core'], 'maven')
+    assert len(out) == 1
+    _mock1.assert_called_once()
+    assert GraphDB().get_version_information(['io.vertx:vertx-core'], 'maven') == out
+    _mock1.assert_called_once()
 
 
 @mock.patch('src.v2.recommender.extract_user_stack_package_licenses', return_value=[])
@@ -281,5 +310,4 @@ if __name__ == '__main__':
     test_get_version_information()
     test_apply_license_filter()
     test_perform_license_analysis()
-    test_get_topics()
     test_prepare_final_filtered_list()
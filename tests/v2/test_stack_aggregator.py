@@ -7,7 +7,7 @@ from unittest import mock, TestCase
 from src.v2 import stack_aggregator as sa
 from src.v2.stack_aggregator import StackAggregator
 from src.v2.models import (Package, VulnerabilityFields,
-                           StackAggregatorResult,
+                           StackAggregatorResult, LicenseAnalysis,
                            StackAggregatorRequest)
 from src.v2.normalized_packages import NormalizedPackages
 
@@ -217,6 +217,7 @@ def test_unknown_flow_with_disabled_flag(_mock_gremlin, _mock_unknown, monkeypat
     # Disabled unknown flow check
     monkeypatch.setenv('DISABLE_UNKNOWN_PACKAGE_FLOW', '1')
     StackAggregator().execute(payload, persist=False)
+    sa.unknown_package_ingestion.join()
     _mock_unknown.assert_not_called()
 
 
@@ -235,6 +236,7 @@ def test_unknown_flow(_mock_license, _mock_gremlin, _mock_unknown):
     payload['packages'][0]['dependencies'].append(_SIX.dict())
     payload['packages'][0]['dependencies'].append(_FOO_UNKNOWN.dict())
     resp = StackAggregator().execute(payload, persist=False)
+    sa.unknown_package_ingestion.join()
     _mock_license.assert_called_once()
     _mock_gremlin.assert_called()
     _mock_unknown.assert_called()
@@ -254,6 +256,8 @@ def test_unknown_flow(_mock_license, _mock_gremlin, _mock_unknown):
 
     _mock_unknown.reset_mock()
     _mock_unknown.side_effect = Exception('mocked exception')
+    sa.unknown_epv_cache.clear()
+    sa.stack_result_cache.clear()
     resp = StackAggregator().execute(payload, persist=False)
     # unknown ingestion failure is fine.
     assert resp['aggregation'] == 'success'
@@ -311,22 +315,24 @@ def _gremlin_batch_test(_mock_gremlin, size: int):
     _mock_gremlin.return_value = None
     with mock.patch('src.v2.stack_aggregator.GREMLIN_QUERY_SIZE', size):
         _mock_gremlin.reset_mock()
+        # nothing is found in graph, forget about unknowns of previous run.
+        sa.unknown_epv_cache.clear()
         sa.Aggregator(request=StackAggregatorRequest(registration_status="REGISTERED",
                       uuid="3fa85f64-5717-4562-b3fc-2c963f66afa6",
                       external_request_id='test_request_id',
                       ecosystem='pypi', manifest_file_path='/tmp/bin', packages=[_DJANGO]),
                       normalized_packages=packages).get_package_details_from_graph()
-        ith = 0
-        last = 0
-        for i, call in enumerate(_mock_gremlin.call_args_list, start=1):
+        batch_sizes = []
+        for call in _mock_gremlin.call_args_list:
             args, kwargs = call
             assert len(args) == 2
             assert args[0].startswith('epv')
             assert isinstance(args[1], dict)
-            if i == len(_mock_gremlin.call_args_list):
-                last = len(args[1]['packages'])
-            else:
-                ith = len(args[1]['packages'])
+            batch_sizes.append(len(args[1]['packages']))
+        # batches are sent concurrently, so order of calls is not fixed.
+        batch_sizes.sort(reverse=True)
+        ith = batch_sizes[0] if len(batch_sizes) > 1 else 0
+        last = batch_sizes[-1] if batch_sizes else 0
         return _mock_gremlin.call_count, ith, last
 
 
@@ -352,6 +358,92 @@ def test_gremlin_batch_call(_mock_gremlin):
     assert (1, 0, 5) == _gremlin_batch_test(_mock_gremlin, 5)
 
 
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_strict_model_validation(_mock_license, _mock_gremlin, monkeypatch):
+    """Test models built without validation are the same as validated ones."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        resp = json.load(fin)
+    resp['result']['data'][0]['vuln'][1]['snyk_pvt_vulnerability'] = [True]
+    for component in resp['result']['data']:
+        component['package']['libio_usedby'] = ['org/repo:12']
+    _mock_gremlin.return_value = resp
+    _mock_license.return_value = LicenseAnalysis(status='Successful')
+
+    results = []
+    for strict in (False, True):
+        sa.epv_cache.clear()
+        sa.stack_result_cache.clear()
+        monkeypatch.setenv('STRICT_MODEL_VALIDATION', str(strict))
+        result = StackAggregator().execute(_request_body(), persist=False)['result']
+        result.pop('_audit')
+        results.append(result)
+    # repr tells apart values of different types, e.g. -1 and '-1'
+    assert repr(results[0]) == repr(results[1])
+    github = results[0]['analyzed_dependencies'][0]['github']
+    assert github['used_by'] == [{'name': 'org/repo', 'stars': '12'}]
+    assert set(github) == set(sa.GitHubDetails.__fields__)
+
+
+@mock.patch('src.v2.stack_aggregator.server_create_analysis')
+@mock.patch('src.v2.stack_aggregator.select_latest_worker_result')
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_incremental_analysis(_mock_license, _mock_gremlin, _mock_previous, _mock_unknown):
+    """Test only packages changed since the previous analysis are fetched."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        _mock_gremlin.return_value = json.load(fin)
+
+    payload = _request_body()
+    payload['packages'][0]['dependencies'].append(_FOO_UNKNOWN.dict())
+    first = StackAggregator().execute(payload, persist=False)
+    sa.unknown_package_ingestion.join()
+    _mock_unknown.assert_called_once()
+    _mock_previous.return_value = first['result']
+    sa.epv_cache.clear()
+    sa.unknown_epv_cache.clear()
+    _mock_gremlin.reset_mock()
+    _mock_unknown.reset_mock()
+
+    payload['external_request_id'] = 'incremental_id'
+    payload['packages'].append(_SIX.dict())
+    second = StackAggregator().execute(payload, persist=False, incremental=True)
+    sa.unknown_package_ingestion.join()
+    _mock_previous.assert_called_once_with(
+        'stack_aggregator_v2', ecosystem='pypi', manifest_file_path='/foo/bar',
+        uuid='3fa85f64-5717-4562-b3fc-2c963f66afa6', max_age=900)
+    # the added package and previously unknown transitive foo are fetched and ingested
+    _mock_gremlin.assert_called_once()
+    assert sorted(_mock_gremlin.call_args[0][1]['packages'], key=lambda pkg: pkg['name']) == \
+        [{'name': 'foo_unknown', 'version': '0.0.0'}, {'name': 'six', 'version': '3.2.1'}]
+    assert _mock_unknown.call_count == 2
+    _mock_unknown.assert_any_call('pypi', 'foo_unknown', '0.0.0', api_flow=True,
+                                  force=False, force_graph_sync=True)
+    _mock_unknown.assert_any_call('pypi', 'six', '3.2.1', api_flow=True,
+                                  force=False, force_graph_sync=True)
+    assert first['result']['analyzed_dependencies'] == \
+        second['result']['analyzed_dependencies']
+    assert second['result']['unknown_dependencies'] == [_SIX.dict()]
+
+    # without previous result everything is fetched
+    _mock_previous.return_value = None
+    _mock_gremlin.reset_mock()
+    sa.epv_cache.clear()
+    sa.unknown_epv_cache.clear()
+    sa.stack_result_cache.clear()
+    StackAggregator().execute(payload, persist=False, incremental=True)
+    sa.unknown_package_ingestion.join()
+    assert len(_mock_gremlin.call_args[0][1]['packages']) == 4
+
+    # results are looked up per user only
+    _mock_previous.reset_mock()
+    sa.stack_result_cache.clear()
+    payload['uuid'] = None
+    StackAggregator().execute(payload, persist=False, incremental=True)
+    sa.unknown_package_ingestion.join()
+    _mock_previous.assert_not_called()
+
+
 class TestStackAggregator(TestCase):
     """Test for the Stack Aggregator class."""
 
@@ -0,0 +1,73 @@
+"""Tests for the stack analysis module."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from src.v2.models import LicenseAnalysis
+from src.v2.stack_analysis import StackAnalysis
+from tests.v2.test_stack_aggregator import _request_body
+
+with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as f:
+    graph_resp = json.load(f)
+
+with open("tests/data/kronos_score_comp_response.json", "r") as f:
+    insights_comp_resp = json.load(f)
+
+with open("tests/data/graph_response.json", "r") as f:
+    version_resp = json.load(f)
+
+
+@mock.patch('src.v2.recommender.create_package_dict', return_value=[])
+@mock.patch('src.v2.recommender.persist_data_in_db')
+@mock.patch('src.v2.stack_aggregator.persist_data_in_db')
+@mock.patch('src.v2.recommender.extract_user_stack_package_licenses')
+@mock.patch('src.v2.recommender.License.invoke_license_analysis_service', return_value={})
+@mock.patch('src.v2.recommender.GraphDB.get_version_information',
+            return_value=version_resp['result']['data'])
+@mock.patch('src.v2.recommender.RecommendationTask.call_insights_recommender',
+            return_value=insights_comp_resp)
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack',
+            return_value=LicenseAnalysis(status='Successful'))
+@mock.patch('src.v2.stack_aggregator.post_gremlin', return_value=graph_resp)
+def test_execute(_mock_gremlin, _mock_stack_license, _mock_insights, _mock_versions,
+                 _mock_license, _mock_extract, _mock_sa_db, _mock_rec_db, _mock_pkg_dict):
+    """Test aggregation and recommendation share fetched package details."""
+    out = StackAnalysis.execute(_request_body(), persist=True, check_license=True)
+    assert out['stack_analysis'] == 'success'
+    assert out['external_request_id'] == 'test_id'
+    assert out['aggregation']['aggregation'] == 'success'
+    assert len(out['aggregation']['result']['analyzed_dependencies']) == 2
+    assert out['recommendation']['recommendation'] == 'success'
+
+    # user stack licenses are taken from the aggregator, graph is queried once
+    _mock_gremlin.assert_called_once()
+    _mock_extract.assert_not_called()
+    user_stack = _mock_license.call_args[0][0]
+    assert sorted(pkg['package'] for pkg in user_stack) == ['django', 'flask']
+    assert {'package': 'flask', 'version': '0.12', 'licenses': ['BSD']} in user_stack
+
+    assert _mock_sa_db.call_args[1]['worker'] == 'stack_aggregator_v2'
+    assert _mock_rec_db.call_args[1]['worker'] == 'recommendation_v2'
+
+
+@mock.patch('src.v2.recommender.RecommendationTask.call_insights_recommender', return_value=[])
+@mock.patch('src.v2.stack_aggregator.post_gremlin', side_effect=Exception('graph down'))
+def test_execute_aggregation_failure(_mock_gremlin, _mock_insights):
+    """Test failure of aggregation fails the stack analysis."""
+    with pytest.raises(Exception, match='graph down'):
+        StackAnalysis.execute(_request_body(), persist=False)
+
+
+@mock.patch('src.v2.stack_analysis.RecommendationTask')
+@mock.patch('src.v2.stack_analysis.StackAggregator')
+@mock.patch('src.v2.stack_analysis.executors')
+def test_execute_pool_size(_mock_executors, _mock_aggregator, _mock_recommender, monkeypatch):
+    """Test aggregation runs on a pool of WORKER_CONNECTIONS threads."""
+    monkeypatch.setenv('WORKER_CONNECTIONS', '3')
+    _mock_executors.get.return_value.submit.return_value.result.return_value = {
+        'external_request_id': 'test_id'}
+    out = StackAnalysis.execute(_request_body(), persist=False)
+    assert out['stack_analysis'] == 'success'
+    _mock_executors.get.assert_called_once_with('stack_analysis', 3)
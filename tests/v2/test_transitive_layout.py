@@ -0,0 +1,53 @@
+"""Tests for layouts of vulnerable transitives in the v2 stack aggregator."""
+
+import copy
+import json
+from unittest import mock
+
+from src.v2 import stack_aggregator as sa
+from src.v2.stack_aggregator import StackAggregator
+from src.v2.models import Package, StackAggregatorResult
+from tests.v2.test_stack_aggregator import _request_body
+
+
+_DJANGO = Package(name='django', version='1.2.1')
+_FLASK = Package(name='flask', version='0.12')
+
+
+@mock.patch('src.v2.stack_aggregator.post_gremlin')
+@mock.patch('src.v2.stack_aggregator.get_license_analysis_for_stack')
+def test_transitive_layout(_mock_license, _mock_gremlin, monkeypatch):
+    """Test vulnerable transitives shared by direct dependencies in both layouts."""
+    with open("tests/v2/data/graph_response_2_public_vuln.json", "r") as fin:
+        resp = json.load(fin)
+    requests = copy.deepcopy(resp['result']['data'][1])
+    requests['version']['pname'] = ['requests']
+    resp['result']['data'].append(requests)
+    _mock_gremlin.return_value = resp
+    body = _request_body()
+    body['packages'].append({'name': 'requests', 'version': '0.12',
+                             'dependencies': [{'name': 'django', 'version': '1.2.1'}]})
+    requests_pkg = Package(name='requests', version='0.12')
+
+    aggregator = StackAggregator.process_request(body)
+    result = aggregator.get_result()
+    assert result.vulnerable_transitives is None
+    flask, requests = (result.analyzed_dependencies[result.analyzed_dependencies.index(pkg)]
+                       for pkg in (_FLASK, requests_pkg))
+    # the same details are referenced by both dependents
+    assert flask.vulnerable_dependencies[0] is requests.vulnerable_dependencies[0]
+    assert flask.vulnerable_dependencies == [_DJANGO]
+    # response of the default layout has no vulnerable_transitives key
+    assert 'vulnerable_transitives' not in StackAggregator.complete(
+        aggregator, 'started', persist=False)['result']
+
+    monkeypatch.setenv('TRANSITIVE_LAYOUT', 'shared')
+    sa.epv_cache.clear()
+    sa.stack_result_cache.clear()
+    result = StackAggregatorResult(**StackAggregator().execute(body, persist=False)['result'])
+    assert all(pkg.vulnerable_dependencies is None for pkg in result.analyzed_dependencies)
+    assert len(result.vulnerable_transitives) == 1
+    django = result.vulnerable_transitives[0]
+    assert django == _DJANGO
+    assert len(django.public_vulnerabilities) == 2
+    assert django.dependents == [_FLASK, requests_pkg]
@@ -0,0 +1,76 @@
+"""Micro-benchmark of JSON codecs.
+
+JSON documents recorded in tests/ are encoded and decoded with the json module
+codec and with the orjson codec, documents are also merged into one large
+document resembling a big stack analysis result.
+
+Usage:
+python3 tools/benchmark_json_codec.py [rounds]
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.json_codec import JsonCodec, OrjsonCodec, orjson  # noqa: E402
+
+
+def load_corpus():
+    """Return JSON documents found in the recorded test data."""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+    documents = []
+    for path in sorted(glob.glob(os.path.join(root, '**', '*.json'), recursive=True)):
+        with open(path) as f:
+            try:
+                documents.append(json.load(f))
+            except ValueError:
+                continue
+    return documents
+
+
+def measure(codec, documents, rounds):
+    """Return best times of encoding and decoding all documents rounds times."""
+    encoded = [codec.dumpb(document) for document in documents]
+
+    def encode():
+        for document in documents:
+            codec.dumpb(document)
+
+    def decode():
+        for data in encoded:
+            codec.loads(data)
+
+    return (min(timeit.repeat(encode, number=rounds, repeat=3)),
+            min(timeit.repeat(decode, number=rounds, repeat=3)))
+
+
+def main():
+    """Entry to the benchmark."""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    if orjson is None:
+        print('orjson is not installed, nothing to compare')
+        return
+    documents = load_corpus()
+    # one large document, sized like the biggest stack results
+    large = [documents]
+    while len(json.dumps(large)) < 5 * 1024 * 1024:
+        large = large + large
+    corpora = [('fixtures', documents), ('5MB document', [large])]
+
+    for name, corpus in corpora:
+        size = sum(len(JsonCodec.dumpb(document)) for document in corpus)
+        print('{}: {} documents, {:.1f} MB'.format(name, len(corpus), size / 1024 / 1024))
+        json_encode, json_decode = measure(JsonCodec(), corpus, rounds)
+        orjson_encode, orjson_decode = measure(OrjsonCodec(), corpus, rounds)
+        print('  encode json: {:.4f}s, orjson: {:.4f}s, speedup: {:.1f}x'.format(
+            json_encode, orjson_encode, json_encode / orjson_encode))
+        print('  decode json: {:.4f}s, orjson: {:.4f}s, speedup: {:.1f}x'.format(
+            json_decode, orjson_decode, json_decode / orjson_decode))
+
+
+if __name__ == '__main__':
+    main()
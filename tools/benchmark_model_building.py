@@ -0,0 +1,73 @@
+"""Micro-benchmark of building v2 stack aggregator result models.
+
+A synthetic stack of 1000 packages is made from the recorded graph response in
+tests/, package details and the stack result are built from it and converted to
+dict with and without validation of the models.
+
+Usage:
+python3 tools/benchmark_model_building.py [packages] [rounds]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.v2 import stack_aggregator  # noqa: E402
+from src.v2.models import (StackAggregatorRequest, StackAggregatorResult,  # noqa: E402
+                           LicenseAnalysis, Ecosystem)
+from src.v2.normalized_packages import NormalizedPackages  # noqa: E402
+
+
+def load_components(count):
+    """Return count graph response components of distinct packages."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'v2',
+                        'data', 'graph_response_2_public_vuln.json')
+    with open(path) as f:
+        recorded = json.load(f)['result']['data']
+    components = []
+    for i in range(count):
+        component = json.loads(json.dumps(recorded[i % len(recorded)]))
+        component['version']['pname'] = ['package-{}'.format(i)]
+        component['package']['libio_usedby'] = ['org/repo-{}:{}'.format(j, j) for j in range(5)]
+        components.append(component)
+    return components
+
+
+def build_result(aggregator, components):
+    """Build package details and stack result from graph components, return result dict."""
+    details = [aggregator._get_package_details(component)[1] for component in components]
+    result = stack_aggregator._build_model(
+        StackAggregatorResult, external_request_id='benchmark', ecosystem=Ecosystem.pypi,
+        analyzed_dependencies=details, unknown_dependencies=[],
+        license_analysis=LicenseAnalysis(), registration_link='https://snyk.io/login')
+    return result.dict()
+
+
+def main():
+    """Entry to the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    components = load_components(count)
+    request = StackAggregatorRequest(
+        registration_status='REGISTERED', external_request_id='benchmark', ecosystem='pypi',
+        manifest_file_path='requirements.txt', packages=[])
+    aggregator = stack_aggregator.Aggregator(request, NormalizedPackages([], 'pypi'))
+    print('Stack: {} packages'.format(count))
+
+    times = {}
+    results = {}
+    for strict in (True, False):
+        stack_aggregator.strict_model_validation = strict
+        results[strict] = build_result(aggregator, components)
+        times[strict] = min(timeit.repeat(lambda: build_result(aggregator, components),
+                                          number=rounds, repeat=3))
+    assert repr(results[True]) == repr(results[False])
+    print('validated: {:.4f}s, constructed: {:.4f}s, speedup: {:.1f}x'.format(
+        times[True], times[False], times[True] / times[False]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Micro-benchmark of unknown dependency matching in v1 stack aggregator.
+
+find_unknown_deps() is timed against the nested loop matching it replaced on
+synthetic graph responses of 100, 1k and 10k dependencies, a tenth of them
+unknown.
+
+Usage:
+python3 tools/benchmark_unknown_deps.py [rounds]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.stack_aggregator import find_unknown_deps  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+
+
+def nested_loop_find_unknown_deps(epv_data, epv_list, dep_list, unknown_deps_list,
+                                  is_transitive=False):
+    """Find unknown dependencies scanning epv_data for every dependency, as done before."""
+    for pkg, ver in dep_list:
+        known_flag = False
+        for knowndep in epv_data:
+            version_node = knowndep['version']
+            if pkg == knowndep['version']['pname'][0] and ver == knowndep['version']['version'][0]:
+                if is_transitive and 'cve' in knowndep:
+                    epv_list['result']['data'].append(knowndep)
+                if version_node.get('licenses') or version_node.get('declared_licenses'):
+                    known_flag = True
+                break
+        if not known_flag:
+            unknown_deps_list.append({'name': pkg, 'version': ver})
+    return epv_list, unknown_deps_list
+
+
+def make_stack(size):
+    """Return graph response items and dependency list of size dependencies."""
+    dep_list = [('package-{}'.format(i), '1.0.{}'.format(i % 7)) for i in range(size)]
+    epv_data = []
+    for i, (pkg, ver) in enumerate(dep_list):
+        if i % 10 == 0:
+            continue  # unknown to graph
+        knowndep = {'version': {'pname': [pkg], 'version': [ver], 'declared_licenses': ['MIT']}}
+        if i % 3 == 0:
+            knowndep['cve'] = {'id': ['CVE-2020-{}'.format(i)]}
+        epv_data.append(knowndep)
+    return epv_data, dep_list
+
+
+def run(implementation, epv_data, dep_list):
+    """Match dependencies as transitive ones, return the results."""
+    return implementation(epv_data, {'result': {'data': []}}, dep_list, [], True)
+
+
+def main():
+    """Entry to the benchmark."""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    for size in SIZES:
+        epv_data, dep_list = make_stack(size)
+        assert run(find_unknown_deps, epv_data, dep_list) == \
+            run(nested_loop_find_unknown_deps, epv_data, dep_list)
+        nested_time = min(timeit.repeat(
+            lambda: run(nested_loop_find_unknown_deps, epv_data, dep_list),
+            number=rounds, repeat=3))
+        indexed_time = min(timeit.repeat(
+            lambda: run(find_unknown_deps, epv_data, dep_list), number=rounds, repeat=3))
+        print('{:>6} dependencies: nested loop: {:.4f}s, indexed: {:.4f}s, speedup: {:.1f}x'
+              .format(size, nested_time, indexed_time, nested_time / indexed_time))
+
+
+if __name__ == '__main__':
+    main()
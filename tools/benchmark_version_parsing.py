@@ -0,0 +1,100 @@
+"""Micro-benchmark of memoized version parsing.
+
+Version strings are collected from the recorded graph responses in tests/
+and select_latest_version() is timed against the uncached parsing it replaced.
+
+Usage:
+python3 tools/benchmark_version_parsing.py [rounds]
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.utils import (select_latest_version, version_info_tuple, zero_version,  # noqa: E402
+                       _semantic_version, _cached_version_key)
+
+VERSION_KEYS = {'version', 'latest_version', 'libio_latest_version',
+                'latest_non_cve_version', 'fixed_in'}
+
+
+def collect_versions(node, versions):
+    """Collect values of version like keys from the JSON document."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in VERSION_KEYS:
+                values = value if isinstance(value, list) else [value]
+                versions.extend(v for v in values if isinstance(v, str))
+            else:
+                collect_versions(value, versions)
+    elif isinstance(node, list):
+        for item in node:
+            collect_versions(item, versions)
+    return versions
+
+
+def load_corpus():
+    """Return version strings found in the recorded test data."""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+    versions = []
+    for path in sorted(glob.glob(os.path.join(root, '**', '*.json'), recursive=True)):
+        with open(path) as f:
+            try:
+                collect_versions(json.load(f), versions)
+            except ValueError:
+                continue
+    return versions
+
+
+def uncached_select_latest_version(input_version='', libio='', anitya=''):
+    """Select latest version parsing every version again, as done before memoization."""
+    parse = _semantic_version.__wrapped__
+    libio_sem = parse(libio) or zero_version
+    anitya_sem = parse(anitya) or zero_version
+    input_sem = parse(input_version) or zero_version
+    if libio_sem == zero_version and anitya_sem == zero_version \
+            and input_sem == zero_version:
+        return ''
+    libio_tuple = version_info_tuple(libio_sem)
+    anitya_tuple = version_info_tuple(anitya_sem)
+    input_tuple = version_info_tuple(input_sem)
+    if libio_tuple >= anitya_tuple and libio_tuple >= input_tuple:
+        return libio
+    if anitya_tuple >= libio_tuple and anitya_tuple >= input_tuple:
+        return anitya
+    return input_version
+
+
+def main():
+    """Entry to the benchmark."""
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    versions = load_corpus()
+    triples = list(zip(versions, versions[1:] + versions[:1], versions[2:] + versions[:2]))
+    print('Corpus: {} versions, {} unique, {} comparisons per round'.format(
+        len(versions), len(set(versions)), len(triples)))
+
+    for triple in triples:
+        assert uncached_select_latest_version(*triple) == select_latest_version(*triple)
+
+    def uncached():
+        for triple in triples:
+            uncached_select_latest_version(*triple)
+
+    def memoized():
+        for triple in triples:
+            select_latest_version(*triple)
+
+    _semantic_version.cache_clear()
+    _cached_version_key.cache_clear()
+    uncached_time = min(timeit.repeat(uncached, number=rounds, repeat=3))
+    memoized_time = min(timeit.repeat(memoized, number=rounds, repeat=3))
+    print('uncached: {:.4f}s, memoized: {:.4f}s, speedup: {:.1f}x'.format(
+        uncached_time, memoized_time, uncached_time / memoized_time))
+
+
+if __name__ == '__main__':
+    main()